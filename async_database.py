@@ -0,0 +1,325 @@
+import asyncio
+import logging
+from functools import partial
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+logger = logging.getLogger(__name__)
+
+
+def split_pool_config(pool_config):
+    """
+    Делит бюджет соединений pool_size между синхронным пулом и пулом aiomysql
+    (async_pool_size - доля асинхронного). Возвращает (синхронный, асинхронный) конфиг.
+    Без aiomysql асинхронные методы идут через синхронный пул - он получает весь бюджет.
+    Бюджет меньше 2 соединений не делится: асинхронный конфиг получает pool_size=0,
+    и AsyncClinicDatabase тоже работает через синхронный пул.
+    """
+    pool_config = dict(pool_config or {})
+    async_size = pool_config.pop('async_pool_size', None)
+    if aiomysql is None:
+        return pool_config, pool_config
+    total = pool_config.get('pool_size', 5)
+    if total < 2:
+        logger.warning(f"pool_size={total} не делится между пулами, асинхронная БД работает через синхронный пул")
+        return pool_config, dict(pool_config, pool_size=0)
+    async_size = max(1, min(async_size or total // 2, total - 1))
+    return dict(pool_config, pool_size=max(1, total - async_size)), dict(pool_config, pool_size=async_size)
+
+
+class AsyncClinicDatabase:
+    """
+    Асинхронный вариант ClinicDatabase (aiomysql + собственный пул).
+
+    Повторяет методы ClinicDatabase в виде корутин. Если aiomysql не
+    установлен, вызовы выполняются через синхронный ClinicDatabase в потоке.
+    """
+
+    def __init__(self, sync_db, pool_config=None):
+        self.sync_db = sync_db
+        self.config = sync_db.config
+        self.table_prefix = sync_db.table_prefix
+        # Кэш врачей общий с синхронным вариантом
+        self.roster = sync_db.roster
+
+        pool_config = pool_config or {}
+        self.pool_size = pool_config.get('pool_size', 5)
+        self.max_lifetime = pool_config.get('max_lifetime', 1800)
+        self.checkout_timeout = pool_config.get('checkout_timeout', 5)
+
+        self.pool = None
+        self._pool_lock = None
+        self._waiting = 0
+
+        # Без aiomysql или без своей доли соединений - через синхронный пул в потоках
+        self.use_aiomysql = aiomysql is not None and self.pool_size > 0
+        if aiomysql is None:
+            logger.warning("aiomysql не установлен, асинхронная БД работает через потоки")
+
+    async def _get_pool(self):
+        """Ленивое создание пула (нужен запущенный event loop)"""
+        if self.pool is not None:
+            return self.pool
+
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+
+        async with self._pool_lock:
+            if self.pool is None:
+                self.pool = await aiomysql.create_pool(
+                    host=self.config.get('host', 'localhost'),
+                    port=self.config.get('port', 3306),
+                    user=self.config.get('user'),
+                    password=self.config.get('password') or '',
+                    db=self.config.get('database'),
+                    charset=self.config.get('charset', 'utf8mb4'),
+                    autocommit=self.config.get('autocommit', True),
+                    connect_timeout=2,
+                    minsize=1,
+                    maxsize=self.pool_size,
+                    pool_recycle=self.max_lifetime,
+                )
+                logger.info(f"Асинхронный пул БД создан (maxsize={self.pool_size})")
+        return self.pool
+
+    async def _run_sync(self, func, *args, **kwargs):
+        """Резервный путь: синхронный метод в отдельном потоке"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def _fetch(self, query, params=None, one=False):
+        """Выполнение SELECT, возвращает список словарей (или одну строку)"""
+        pool = await self._get_pool()
+        self._waiting += 1
+        try:
+            conn = await asyncio.wait_for(pool.acquire(), self.checkout_timeout)
+        finally:
+            self._waiting -= 1
+        try:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(query, params)
+                if one:
+                    return await cursor.fetchone()
+                return list(await cursor.fetchall())
+        finally:
+            pool.release(conn)
+
+    async def _execute(self, query, params=None):
+        """Выполнение INSERT/UPDATE, возвращает количество строк"""
+        pool = await self._get_pool()
+        self._waiting += 1
+        try:
+            conn = await asyncio.wait_for(pool.acquire(), self.checkout_timeout)
+        finally:
+            self._waiting -= 1
+        try:
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params)
+                await conn.commit()
+                return cursor.rowcount
+        finally:
+            pool.release(conn)
+
+    async def close(self):
+        """Закрытие пула"""
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    def get_pool_metrics(self):
+        """Метрики асинхронного пула"""
+        if not self.use_aiomysql:
+            return self.sync_db.get_pool_metrics()
+        if self.pool is None:
+            return {'size': self.pool_size, 'open': 0, 'idle': 0, 'in_use': 0, 'waiting': self._waiting}
+        return {
+            'size': self.pool.maxsize,
+            'open': self.pool.size,
+            'idle': self.pool.freesize,
+            'in_use': self.pool.size - self.pool.freesize,
+            'waiting': self._waiting,
+        }
+
+    async def get_doctors(self):
+        """
+        Получение списка врачей из БД
+        Возвращает только АКТИВНЫХ врачей (is_active = 1)
+        """
+        cached = self.roster.get_all()
+        if cached is not None:
+            return cached
+        generation = self.roster.generation()
+
+        if not self.use_aiomysql:
+            return await self._run_sync(self.sync_db.get_doctors)
+
+        query = f"""
+            SELECT id,
+                   CONCAT_WS(' ', last_name, first_name, middle_name) as name,
+                   specialty,
+                   description,
+                   return_date,
+                   is_active
+            FROM {self.table_prefix}doctors
+            WHERE is_active = 1
+            ORDER BY last_name, first_name
+        """
+        try:
+            doctors = await self._fetch(query)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения врачей из БД: {e}")
+            return self.sync_db._get_fallback_doctors()
+
+        if not doctors:
+            logger.warning("⚠️ Список врачей из БД пуст, используем резервный список")
+            return self.sync_db._get_fallback_doctors()
+
+        logger.info(f"✅ Получено {len(doctors)} активных врачей из БД")
+        self.roster.set(doctors, generation)
+        return doctors
+
+    async def get_doctor_by_id(self, doctor_id):
+        """Получение информации о враче по ID"""
+        cached = self.roster.get(doctor_id)
+        if cached is not None:
+            return cached
+
+        if not self.use_aiomysql:
+            return await self._run_sync(self.sync_db.get_doctor_by_id, doctor_id)
+
+        query = f"""
+            SELECT id,
+                   CONCAT_WS(' ', last_name, first_name, middle_name) as name,
+                   specialty,
+                   description,
+                   is_active,
+                   return_date
+            FROM {self.table_prefix}doctors
+            WHERE id = %s
+        """
+        try:
+            return await self._fetch(query, (doctor_id,), one=True)
+        except Exception as e:
+            logger.error(f"Ошибка получения врача по ID: {e}")
+            # Ищем в резервном списке
+            for doc in self.sync_db._get_fallback_doctors():
+                if doc['id'] == doctor_id:
+                    return doc
+            return None
+
+    async def get_all_doctors_for_admin(self):
+        """Получение всех врачей (включая неактивных) для админ панели"""
+        if not self.use_aiomysql:
+            return await self._run_sync(self.sync_db.get_all_doctors_for_admin)
+
+        query = f"""
+            SELECT id,
+                   CONCAT_WS(' ', last_name, first_name, middle_name) as name,
+                   specialty,
+                   description,
+                   return_date,
+                   is_active
+            FROM {self.table_prefix}doctors
+            ORDER BY is_active DESC, last_name, first_name
+        """
+        try:
+            doctors = await self._fetch(query)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения всех врачей из БД: {e}")
+            return self.sync_db._get_fallback_doctors()
+
+        if not doctors:
+            logger.warning("⚠️ Список врачей из БД пуст, используем резервный список")
+            return self.sync_db._get_fallback_doctors()
+        return doctors
+
+    async def create_appointment(self, user_id, doctor_id, appointment_date, appointment_time, user_name, user_phone):
+        """Создание записи"""
+        if not self.use_aiomysql:
+            return await self._run_sync(
+                self.sync_db.create_appointment,
+                user_id, doctor_id, appointment_date, appointment_time, user_name, user_phone
+            )
+
+        # Форматируем время
+        if len(appointment_time) == 5:
+            appointment_time = appointment_time + ":00"
+
+        query = f"""
+            INSERT INTO {self.table_prefix}appointments
+            (user_telegram_id, doctor_id, appointment_date, appointment_time,
+             user_name, user_phone, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, 'confirmed', NOW())
+        """
+        try:
+            await self._execute(query, (user_id, doctor_id, appointment_date,
+                                        appointment_time, user_name, user_phone))
+            logger.info(f"Запись создана: врач={doctor_id}, дата={appointment_date}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка создания записи: {e}")
+            return False
+
+    async def get_all_appointments(self, limit=50):
+        """Получение всех записей (для админов)"""
+        if not self.use_aiomysql:
+            return await self._run_sync(self.sync_db.get_all_appointments, limit)
+
+        query = f"""
+            SELECT
+                a.id, a.user_telegram_id, a.doctor_id, a.appointment_date, a.appointment_time,
+                a.user_name, a.user_phone, a.status, a.created_at,
+                d.name as doctor_name
+            FROM {self.table_prefix}appointments a
+            LEFT JOIN {self.table_prefix}doctors d ON a.doctor_id = d.id
+            ORDER BY a.appointment_date DESC, a.appointment_time DESC
+            LIMIT %s
+        """
+        try:
+            return await self._fetch(query, (limit,))
+        except Exception as e:
+            logger.error(f"Ошибка получения всех записей: {e}")
+            return []
+
+    async def count_appointments(self):
+        """Количество записей в локальной БД"""
+        if not self.use_aiomysql:
+            return await self._run_sync(self.sync_db.count_appointments)
+
+        try:
+            row = await self._fetch(f"SELECT COUNT(*) as count FROM {self.table_prefix}appointments", one=True)
+            return row['count'] if row else 0
+        except Exception as e:
+            logger.error(f"Ошибка подсчета записей: {e}")
+            return 0
+
+    async def update_doctor_status(self, doctor_id, is_active, return_date=None):
+        """Обновление статуса врача"""
+        if not self.use_aiomysql:
+            return await self._run_sync(self.sync_db.update_doctor_status, doctor_id, is_active, return_date)
+
+        query = f"""
+            UPDATE {self.table_prefix}doctors
+            SET is_active = %s, return_date = %s
+            WHERE id = %s
+        """
+        try:
+            await self._execute(query, (is_active, return_date, doctor_id))
+            self.roster.invalidate()
+            logger.info(f"Статус врача ID {doctor_id} обновлен: is_active={is_active}, return_date={return_date}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления статуса врача: {e}")
+            return False
+
+    async def seed_doctors(self):
+        """Гарантированно заполняет таблицу врачей списком от пользователя"""
+        return await self._run_sync(self.sync_db.seed_doctors)
+
+    async def create_tables(self):
+        """Создает необходимые таблицы в БД, если они не существуют."""
+        return await self._run_sync(self.sync_db.create_tables)
@@ -0,0 +1,443 @@
+import asyncio
+import logging
+import random
+from functools import partial
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (нужен httpx для HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+from wordpress_api import (
+    is_server_failure, parse_occupied_slots, parse_occupied_range, parse_appointments_page,
+    parse_slot_taken, build_appointments_params, build_batch_payload, filter_appointments_by_status,
+)
+from response_cache import MISS
+from single_flight import AsyncSingleFlight
+from circuit_breaker import CircuitOpenError
+
+
+class AsyncWordPressAPI:
+    """
+    Асинхронный клиент clinic/v1 (httpx, keep-alive пул, HTTP/2 если доступен).
+
+    Повторяет методы WordPressAPI в виде корутин и берет настройки
+    (адрес, ключ, таймауты, повторы) из синхронного клиента. Если httpx
+    не установлен, вызовы выполняются через синхронный клиент в потоке.
+    """
+
+    def __init__(self, sync_api):
+        self.sync_api = sync_api
+        self.site_url = sync_api.site_url
+        self.api_key = sync_api.api_key
+        # Кэш ответов общий с синхронным клиентом
+        self.cache = sync_api.cache
+        # Одинаковые параллельные GET (например, один день врача у нескольких пациентов) - один запрос
+        self.flights = AsyncSingleFlight()
+        # Фоновые обновления устаревших ответов
+        self._background = set()
+        self.logger = logging.getLogger('wordpress_api')
+
+        self.client = None
+        if httpx is None:
+            self.logger.warning("httpx не установлен, асинхронный WordPress API работает через потоки")
+            return
+
+        self.client = httpx.AsyncClient(
+            base_url=f"{self.site_url}/wp-json/clinic/v1/",
+            headers=sync_api.headers,
+            verify=sync_api.verify_ssl,
+            timeout=sync_api.timeout,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=sync_api.pool_maxsize, max_keepalive_connections=sync_api.pool_maxsize),
+        )
+
+    async def _run_sync(self, func, *args, **kwargs):
+        """Резервный путь: синхронный метод в отдельном потоке"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def _request(self, method, endpoint, idempotent=None, **kwargs):
+        """
+        HTTP запрос с теми же правилами повторов, что и WordPressAPI._request
+        """
+        if idempotent is None:
+            idempotent = method == 'GET'
+        kwargs.setdefault('timeout', self.sync_api.endpoint_timeouts.get(endpoint, self.sync_api.timeout))
+        attempts = self.sync_api.retry_attempts
+
+        # Circuit breaker общий с синхронным клиентом
+        breaker = self.sync_api.get_breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(endpoint)
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = await self.client.request(method, endpoint, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                breaker.record_failure()
+                # Соединение не установлено - повтор безопасен для любого метода
+                if last_attempt or not breaker.allow():
+                    raise
+            except (httpx.TimeoutException, httpx.NetworkError):
+                breaker.record_failure()
+                if not idempotent or last_attempt or not breaker.allow():
+                    raise
+            except httpx.HTTPError:
+                breaker.record_failure()
+                raise
+            else:
+                failed = is_server_failure(response)
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not failed or not idempotent or last_attempt:
+                    return response
+                if not breaker.allow():
+                    return response
+            self.logger.warning(f"Повтор запроса {method} /{endpoint} (попытка {attempt + 2}/{attempts})")
+            delay = self.sync_api.backoff_factor * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def _cached_get(self, endpoint, params, parse):
+        """GET с кэшем ответов и If-None-Match (см. WordPressAPI._cached_get)"""
+        cached = self.cache.get(endpoint, params)
+        if cached is not MISS:
+            return cached
+
+        key = self.cache.make_key(endpoint, params)
+        fetch = partial(self._fetch, endpoint, params, parse)
+
+        # Сайт недоступен (breaker не закрыт): сразу отдаем последний ответ
+        # и пробуем обновить его в фоне, не заставляя пользователя ждать таймаут
+        if self.sync_api.is_degraded(endpoint):
+            stale = self.cache.get_stale(endpoint, params)
+            if stale is not MISS:
+                self._revalidate_in_background(key, fetch)
+                return stale
+
+        try:
+            return await self.flights.do(key, fetch)
+        except Exception as e:
+            stale = self.cache.get_stale(endpoint, params)
+            if stale is MISS:
+                raise
+            self.logger.warning(f"/{endpoint} недоступен ({e}), используем устаревший ответ из кэша")
+            return stale
+
+    def _revalidate_in_background(self, key, fetch):
+        """Одно фоновое обновление устаревшего ответа на ключ"""
+        if key in self.flights:
+            return
+
+        async def refresh():
+            try:
+                await self.flights.do(key, fetch)
+            except Exception as e:
+                self.logger.debug(f"Фоновое обновление не удалось: {e}")
+
+        task = asyncio.ensure_future(refresh())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _fetch(self, endpoint, params, parse):
+        """Запрос для _cached_get (см. WordPressAPI._fetch)"""
+        validator = self.cache.get_validator(endpoint, params)
+        headers = {'If-None-Match': validator[0]} if validator else {}
+        response = await self._request('GET', endpoint, params=params, headers=headers)
+
+        if response.status_code == 304 and validator:
+            value = validator[1]
+            self.cache.mark_revalidated()
+        else:
+            response.raise_for_status()
+            value = parse(response)
+            etag = response.headers.get('ETag')
+            if etag:
+                self.cache.set_validator(endpoint, params, etag, value)
+        self.cache.set(endpoint, params, value)
+        return value
+
+    async def close(self):
+        """Закрытие HTTP клиента"""
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def get_doctors(self):
+        """Получение списка врачей"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.get_doctors)
+        try:
+            return await self._cached_get('doctors', None, lambda response: response.json())
+        except Exception as e:
+            self.logger.error(f"Ошибка получения врачей: {e}")
+            return []
+
+    async def test_connection(self):
+        """Проверка подключения к API"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.test_connection)
+        try:
+            response = await self._request('GET', 'doctors')
+            if response.status_code != 200:
+                return False, f"HTTP {response.status_code}"
+            return True, "Подключение успешно"
+        except Exception as e:
+            return False, str(e)
+
+    async def get_occupied_slots(self, doctor_id, date):
+        """Получение занятых слотов. None - занятость неизвестна (ошибка запроса)"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.get_occupied_slots, doctor_id, date)
+        try:
+            params = {'doctor_id': doctor_id, 'date': date}
+            if self.api_key:
+                params['api_key'] = self.api_key
+            return await self._cached_get('get-appointments', params,
+                                          lambda response: parse_occupied_slots(response.json()))
+        except Exception as e:
+            self.logger.error(f"Ошибка получения слотов: {e}")
+            return None
+
+    async def get_occupied_slots_range(self, doctor_id, date_from, date_to):
+        """Занятые слоты врача за диапазон дат одним запросом (заполняет кэш по дням)"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.get_occupied_slots_range, doctor_id, date_from, date_to)
+        try:
+            params = {'doctor_id': doctor_id, 'date_from': date_from, 'date_to': date_to}
+            if self.api_key:
+                params['api_key'] = self.api_key
+
+            def parse(response):
+                occupancy = parse_occupied_range(response.json())
+                self.sync_api.cache_occupied_range(doctor_id, occupancy)
+                return occupancy
+
+            return await self._cached_get('get-appointments-range', params, parse)
+        except Exception as e:
+            self.logger.error(f"Ошибка получения слотов за период: {e}")
+            return {}
+
+    async def create_appointment(self, doctor_id, date, time, patient_name, patient_phone, telegram_id=None):
+        """Создание записи"""
+        if self.client is None:
+            return await self._run_sync(
+                self.sync_api.create_appointment,
+                doctor_id, date, time, patient_name, patient_phone, telegram_id
+            )
+        try:
+            payload = {
+                'doctor_id': doctor_id,
+                'appointment_date': date,
+                'appointment_time': time,
+                'user_name': patient_name,
+                'user_phone': patient_phone,
+                'telegram_id': telegram_id
+            }
+            if self.api_key:
+                payload['api_key'] = self.api_key
+
+            # Создание записи не идемпотентно: повтор только если запрос не ушел
+            response = await self._request('POST', 'appointments', json=payload)
+
+            if response.status_code == 200:
+                result = response.json()
+                if result.get('success'):
+                    self.sync_api.invalidate_appointments(doctor_id, date, telegram_id)
+                    return True, result.get('id')
+                return False, result.get('message', 'Неизвестная ошибка от API')
+
+            conflict = parse_slot_taken(response)
+            if conflict is not None:
+                self.logger.warning(f"Слот {date} {time} у врача {doctor_id}: {conflict['code']}")
+                if conflict['occupied'] is not None:
+                    self.cache.set('get-appointments', {'doctor_id': doctor_id, 'date': date}, conflict['occupied'])
+                return False, conflict
+
+            self.logger.error(f"Ошибка создания записи: {response.text}")
+            return False, f"HTTP Error {response.status_code}: {response.text}"
+        except Exception as e:
+            self.logger.error(f"Исключение при создании записи: {e}")
+            return False, str(e)
+
+    async def get_patient_appointments(self, telegram_id):
+        """Получение записей пациента по Telegram ID (None - записи неизвестны)"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.get_patient_appointments, telegram_id)
+        try:
+            return await self._cached_get('my-appointments', {'telegram_id': telegram_id},
+                                          lambda response: response.json())
+        except Exception as e:
+            self.logger.error(f"Ошибка получения записей пациента: {e}")
+            return None
+
+    async def cancel_appointment(self, appointment_id):
+        """Отмена записи"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.cancel_appointment, appointment_id)
+        try:
+            response = await self._request('POST', 'cancel-appointment', idempotent=True,
+                                           params={'appointment_id': appointment_id})
+            if response.status_code == 200:
+                self.sync_api.apply_cancellation(response)
+                return True
+
+            self.logger.error(f"Ошибка отмены записи: {response.text}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Ошибка отмены записи: {e}")
+            return False
+
+    async def get_appointments_page(self, limit=50, status=None, doctor_id=None, date_from=None, date_to=None, cursor=None):
+        """Страница записей (для админов): (записи, курсор следующей страницы или None)"""
+        if self.client is None:
+            return await self._run_sync(
+                self.sync_api.get_appointments_page, limit, status, doctor_id, date_from, date_to, cursor
+            )
+        try:
+            params = build_appointments_params(limit, status, doctor_id, date_from, date_to, cursor)
+            if self.api_key:
+                params['api_key'] = self.api_key
+            return await self._cached_get('all-appointments', params, parse_appointments_page)
+        except Exception as e:
+            self.logger.error(f"Ошибка получения всех записей: {e}")
+            return [], None
+
+    async def get_all_appointments(self, limit=50, **filters):
+        """Получение всех записей (для админов)"""
+        appointments, _ = await self.get_appointments_page(limit, **filters)
+        return appointments
+
+    async def get_all_appointments_paged(self, page_size=200, max_pages=50, **filters):
+        """Получение всех записей постранично (для экспорта)"""
+        appointments = []
+        cursor = None
+        for _ in range(max_pages):
+            page, cursor = await self.get_appointments_page(page_size, cursor=cursor, **filters)
+            appointments.extend(page)
+            if not cursor:
+                break
+        return appointments
+
+    async def get_filtered_appointments(self, limit=50, status_filter=None):
+        """Получение записей с фильтрацией по статусу (для админов)"""
+        appointments = await self.get_all_appointments(limit, status=status_filter)
+        return filter_appointments_by_status(appointments, status_filter)
+
+    async def update_appointment_status(self, appointment_id, status_code):
+        """Обновление статуса записи"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.update_appointment_status, appointment_id, status_code)
+        try:
+            payload = {'appointment_id': appointment_id, 'status': status_code}
+            if self.api_key:
+                payload['api_key'] = self.api_key
+
+            response = await self._request('POST', 'update-status', idempotent=True, data=payload)
+            if response.status_code == 200:
+                # Статус не освобождает слот, но меняет списки записей
+                self.cache.invalidate('all-appointments')
+                self.cache.invalidate('my-appointments')
+                return True
+
+            self.logger.error(f"Ошибка обновления статуса: {response.text}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Исключение при обновлении статуса: {e}")
+            return False
+
+    async def get_changes(self, since=None, limit=500):
+        """Страница журнала изменений записей (см. WordPressAPI.get_changes)"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.get_changes, since, limit)
+        try:
+            params = {'limit': limit}
+            if since is not None:
+                params['since'] = since
+            if self.api_key:
+                params['api_key'] = self.api_key
+            response = await self._request('GET', 'changes', params=params)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            self.logger.error(f"Ошибка получения журнала изменений: {e}")
+            return None
+
+    async def get_diagnostics(self):
+        """Диагностика плагина (см. WordPressAPI.get_diagnostics)"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.get_diagnostics)
+        try:
+            params = {'api_key': self.api_key} if self.api_key else None
+            response = await self._request('GET', 'diagnostics', params=params)
+            response.raise_for_status()
+            self.sync_api.diagnostics = response.json()
+            return self.sync_api.diagnostics
+        except Exception as e:
+            self.logger.error(f"Ошибка получения диагностики плагина: {e}")
+            return None
+
+    async def poll_changes(self, max_pages=10):
+        """
+        Изменения записей с прошлого вызова или None, если дельта неизвестна.
+        Курсор общий с синхронным клиентом (см. WordPressAPI.poll_changes).
+        """
+        first_call = self.sync_api.changes_cursor is None
+        # Курсор сохраняется только после применения изменений: при ошибке
+        # на середине страницы будут запрошены заново
+        cursor = self.sync_api.changes_cursor
+        changes = []
+        for _ in range(max_pages):
+            feed = await self.get_changes(cursor)
+            if feed is None:
+                return None
+            changes.extend(feed['changes'])
+            cursor = feed['cursor']
+            if not feed['has_more']:
+                break
+        else:
+            self.sync_api.invalidate_appointments()
+            self.sync_api.changes_cursor = cursor
+            return None
+
+        if not first_call:
+            self.sync_api.apply_changes(changes)
+        self.sync_api.changes_cursor = cursor
+        return None if first_call else changes
+
+    async def batch(self, operations, idempotent=False):
+        """Несколько операций одним HTTP запросом (см. WordPressAPI.batch)"""
+        if self.client is None:
+            return await self._run_sync(self.sync_api.batch, operations, idempotent)
+        try:
+            response = await self._request('POST', 'batch', idempotent=idempotent,
+                                           json=build_batch_payload(operations, self.api_key))
+            if response.status_code == 404:
+                self.logger.warning("Endpoint /batch не найден (старая версия плагина)")
+                return None
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            self.logger.error(f"Ошибка пакетного запроса: {e}")
+            return None
+
+    async def update_status_and_list(self, appointment_id, status_code, limit=50, status_filter=None):
+        """Смена статуса и обновленный список записей за один запрос: (успех, записи)"""
+        list_params = build_appointments_params(limit, status_filter)
+        results = await self.batch([
+            ('update-status', {'appointment_id': appointment_id, 'status': status_code}),
+            ('all-appointments', list_params),
+        ], idempotent=True)
+
+        if results is None:
+            success = await self.update_appointment_status(appointment_id, status_code)
+            return success, await self.get_filtered_appointments(limit, status_filter)
+        return self.sync_api.apply_status_batch(results, list_params, status_filter)
@@ -0,0 +1,200 @@
+import threading
+import time
+from datetime import datetime
+
+try:
+    popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+    def popcount(mask):
+        return bin(mask).count('1')
+
+
+class AvailabilityEngine:
+    """
+    Занятость врачей в памяти: (doctor_id, date) -> битовая маска по сетке слотов врача.
+
+    Бит i установлен - i-й слот сетки (schedules.template(doctor_id)) занят.
+    Запись/отмена - переключение одного бита, количество свободных/занятых -
+    popcount, общие свободные слоты нескольких дней - AND масок.
+    Маска дня загружается из ответа /get-appointments (load_day) и
+    сбрасывается при изменениях на сайте (invalidate); прошедшие дни удаляются.
+
+    Ответ, запрошенный до сброса дня, не должен его перезаписать: перед
+    запросом берется stamp(), и load_day(..., since=stamp) отбрасывает данные,
+    если день (врач, все дни) сбросили после этой метки.
+    """
+
+    def __init__(self, schedules):
+        self.schedules = schedules
+        self._lock = threading.Lock()
+        self._days = {}
+        self._loaded_at = {}
+        # Счетчик сбросов и метки последнего сброса: (doctor_id|None, date|None) -> счетчик
+        self._clock = 0
+        self._invalidated = {}
+        self._pruned_on = None
+
+    def _template(self, doctor_id):
+        return self.schedules.template(doctor_id)
+
+    def full_mask(self, doctor_id):
+        """Маска со всеми слотами сетки врача"""
+        return (1 << len(self._template(doctor_id))) - 1
+
+    def stamp(self):
+        """Метка перед запросом занятости (для load_day(..., since=...))"""
+        with self._lock:
+            return self._clock
+
+    def _invalidated_since(self, doctor_id, date, since):
+        """Сбрасывали ли день после метки since (под self._lock)"""
+        doctor = str(doctor_id)
+        keys = ((doctor, date), (doctor, None), (None, date), (None, None))
+        return any(self._invalidated.get(key, 0) > since for key in keys)
+
+    def load_day(self, doctor_id, date, occupied, since=None):
+        """
+        Маска дня из списка занятых времен "HH:MM" (время вне сетки игнорируется).
+        since - stamp() до запроса; если день с тех пор сбросили, данные отбрасываются (None).
+        """
+        index = self._template(doctor_id).index
+        mask = 0
+        for time_str in occupied:
+            position = index.get(time_str[:5])
+            if position is not None:
+                mask |= 1 << position
+        with self._lock:
+            self._prune()
+            if since is not None and self._invalidated_since(doctor_id, date, since):
+                return None
+            self._days[(doctor_id, date)] = mask
+            self._loaded_at[(doctor_id, date)] = time.monotonic()
+        return mask
+
+    def _prune(self):
+        """Удаление прошедших дней (раз в сутки, под self._lock)"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self._pruned_on == today:
+            return
+        for key in [key for key in self._days if key[1] < today]:
+            del self._days[key]
+            self._loaded_at.pop(key, None)
+        for key in [key for key in self._invalidated if key[1] is not None and key[1] < today]:
+            del self._invalidated[key]
+        self._pruned_on = today
+
+    def is_fresh(self, doctor_id, date, max_age):
+        """День загружен не раньше max_age секунд назад (и с тех пор не сбрасывался)"""
+        with self._lock:
+            loaded_at = self._loaded_at.get((doctor_id, date))
+            return loaded_at is not None and time.monotonic() - loaded_at <= max_age
+
+    def has_day(self, doctor_id, date):
+        with self._lock:
+            return (doctor_id, date) in self._days
+
+    def busy_mask(self, doctor_id, date):
+        """Маска занятых слотов (0, если день не загружен)"""
+        with self._lock:
+            return self._days.get((doctor_id, date), 0)
+
+    def _flip(self, doctor_id, date, time_str, busy):
+        position = self._template(doctor_id).index.get(time_str[:5])
+        if position is None:
+            return False
+        bit = 1 << position
+        with self._lock:
+            key = (doctor_id, date)
+            if key not in self._days:
+                return False
+            mask = self._days[key]
+            if bool(mask & bit) == busy:
+                return False
+            self._days[key] = mask | bit if busy else mask & ~bit
+            return True
+
+    def book(self, doctor_id, date, time_str):
+        """Отметить слот занятым. False - слот вне сетки, уже занят или день не загружен"""
+        return self._flip(doctor_id, date, time_str, True)
+
+    def cancel(self, doctor_id, date, time_str):
+        """Освободить слот. False - слот вне сетки, уже свободен или день не загружен"""
+        return self._flip(doctor_id, date, time_str, False)
+
+    def is_free(self, doctor_id, date, time_str):
+        position = self._template(doctor_id).index.get(time_str[:5])
+        return position is not None and not self.busy_mask(doctor_id, date) >> position & 1
+
+    def visible_mask(self, doctor_id, date, now=None):
+        """Маска слотов, доступных для записи (для сегодня - только будущие)"""
+        template = self._template(doctor_id)
+        now = now or datetime.now()
+        start = 0
+        if date == now.strftime('%Y-%m-%d'):
+            start = template.first_after(now.hour * 60 + now.minute)
+        return self.full_mask(doctor_id) >> start << start
+
+    def free_mask(self, doctor_id, date, now=None):
+        """Маска свободных слотов, доступных для записи"""
+        return self.visible_mask(doctor_id, date, now) & ~self.busy_mask(doctor_id, date)
+
+    def counts(self, doctor_id, date, now=None):
+        """(свободно, занято) среди слотов, доступных для записи"""
+        visible = self.visible_mask(doctor_id, date, now)
+        busy = self.busy_mask(doctor_id, date) & visible
+        return popcount(visible) - popcount(busy), popcount(busy)
+
+    def slots_from_mask(self, doctor_id, mask):
+        """Маска -> список "HH:MM\""""
+        labels = self._template(doctor_id).labels
+        return [label for i, label in enumerate(labels) if mask >> i & 1]
+
+    def free_slots(self, doctor_id, date, now=None):
+        """Свободные слоты дня "HH:MM\""""
+        return self.slots_from_mask(doctor_id, self.free_mask(doctor_id, date, now))
+
+    def first_free(self, doctor_id, date, limit, now=None):
+        """До limit самых ранних свободных слотов дня (перебор битов с ранним выходом)"""
+        labels = self._template(doctor_id).labels
+        mask = self.free_mask(doctor_id, date, now)
+        slots = []
+        while mask and len(slots) < limit:
+            low = mask & -mask
+            slots.append(labels[low.bit_length() - 1])
+            mask ^= low
+        return slots
+
+    def common_free(self, doctor_id, dates, now=None):
+        """Слоты, свободные во ВСЕ указанные дни (AND масок)"""
+        mask = self.full_mask(doctor_id)
+        for date in dates:
+            mask &= self.free_mask(doctor_id, date, now)
+        return self.slots_from_mask(doctor_id, mask)
+
+    def earliest_free(self, doctor_id, dates, now=None):
+        """Первый свободный слот по дням (dates по возрастанию): (date, "HH:MM") или None"""
+        labels = self._template(doctor_id).labels
+        for date in dates:
+            if not self.has_day(doctor_id, date):
+                continue
+            mask = self.free_mask(doctor_id, date, now)
+            if mask:
+                # Младший установленный бит - самый ранний слот
+                return date, labels[(mask & -mask).bit_length() - 1]
+        return None
+
+    def invalidate(self, doctor_id=None, date=None):
+        """Сброс загруженных дней (врача/даты или всех)"""
+        with self._lock:
+            self._clock += 1
+            if doctor_id is None and date is None:
+                self._days.clear()
+                self._loaded_at.clear()
+                self._invalidated = {(None, None): self._clock}
+                return
+            self._prune()
+            self._invalidated[(None if doctor_id is None else str(doctor_id), date)] = self._clock
+            for key in list(self._days):
+                if (doctor_id is None or str(key[0]) == str(doctor_id)) and (date is None or key[1] == date):
+                    del self._days[key]
+                    self._loaded_at.pop(key, None)
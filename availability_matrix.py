@@ -0,0 +1,249 @@
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from schedule_compiler import to_minutes
+
+NUMPY_AVAILABLE = np is not None
+
+
+class AvailabilityMatrix:
+    """
+    Занятость всех врачей на окно дней: массив (врачи, дни, слоты) на NumPy.
+
+    Слоты - объединение сеток всех врачей (schedules), workable[врач, слот]
+    показывает, есть ли слот в сетке врача. loaded[врач, день] - день загружен
+    из /get-appointments(-range); незагруженные дни в запросах не участвуют.
+    Обновляется по событиям записи/отмены (apply_changes, set_slot) без
+    полной перезагрузки. Окно сдвигается вперед вместе с текущей датой.
+    changed[врач, день] - значение счетчика при последнем точечном изменении/сбросе:
+    load_day(..., since=stamp()) не перезаписывает день, измененный после начала запроса.
+    """
+
+    def __init__(self, schedules, doctor_ids=(), days=7):
+        if np is None:
+            raise RuntimeError("numpy не установлен")
+        self.schedules = schedules
+        self.days = days
+        self._lock = threading.RLock()
+        self._clock = 0
+        self.start_date = datetime.now().date()
+        self.set_doctors(doctor_ids)
+
+    def set_doctors(self, doctor_ids):
+        """Пересборка матрицы под список врачей (загруженные данные сбрасываются)"""
+        with self._lock:
+            self.doctor_ids = list(dict.fromkeys(doctor_ids))
+            # ID врача из журнала/webhook приходит числом, из бота - как есть: сравниваем строки
+            self.doctor_index = {str(doctor_id): i for i, doctor_id in enumerate(self.doctor_ids)}
+
+            templates = [self.schedules.template(doctor_id) for doctor_id in self.doctor_ids]
+            offsets = sorted({m for template in templates for m in template.offsets})
+            self.offsets = np.array(offsets, dtype=np.int32)
+            self.labels = [f"{m // 60:02d}:{m % 60:02d}" for m in offsets]
+            self.column = {label: i for i, label in enumerate(self.labels)}
+
+            shape = (len(self.doctor_ids), len(offsets))
+            self.workable = np.zeros(shape, dtype=bool)
+            for row, template in enumerate(templates):
+                self.workable[row, [self.column[label] for label in template.labels]] = True
+
+            self.busy = np.zeros((len(self.doctor_ids), self.days, len(offsets)), dtype=bool)
+            self.loaded = np.zeros((len(self.doctor_ids), self.days), dtype=bool)
+            self.changed = np.zeros((len(self.doctor_ids), self.days), dtype=np.int64)
+
+    def sync_doctors(self, doctor_ids):
+        """Пересборка, только если список врачей изменился"""
+        doctor_ids = list(dict.fromkeys(doctor_ids))
+        if doctor_ids != self.doctor_ids:
+            self.set_doctors(doctor_ids)
+            return True
+        return False
+
+    def _roll_window(self):
+        """Сдвиг окна, если наступил новый день"""
+        today = datetime.now().date()
+        shift = (today - self.start_date).days
+        if shift <= 0:
+            return
+        if shift >= self.days:
+            self.busy[:] = False
+            self.loaded[:] = False
+            self.changed[:] = 0
+        else:
+            self.busy[:, :-shift] = self.busy[:, shift:]
+            self.busy[:, -shift:] = False
+            self.loaded[:, :-shift] = self.loaded[:, shift:]
+            self.loaded[:, -shift:] = False
+            self.changed[:, :-shift] = self.changed[:, shift:]
+            self.changed[:, -shift:] = 0
+        self.start_date = today
+
+    def date_at(self, day):
+        """Индекс дня окна -> "YYYY-MM-DD\""""
+        return (self.start_date + timedelta(days=day)).strftime('%Y-%m-%d')
+
+    def _day(self, date):
+        """"YYYY-MM-DD" -> индекс дня окна или None"""
+        day = (datetime.strptime(date, '%Y-%m-%d').date() - self.start_date).days
+        return day if 0 <= day < self.days else None
+
+    def _cell(self, doctor_id, date):
+        row = self.doctor_index.get(str(doctor_id))
+        day = self._day(date) if row is not None else None
+        return (row, day) if day is not None else None
+
+    def stamp(self):
+        """Метка перед запросом занятости (для load_day/load_range(..., since=...))"""
+        with self._lock:
+            return self._clock
+
+    def _touch(self, cell):
+        """Отметка точечного изменения дня (под self._lock)"""
+        self._clock += 1
+        self.changed[cell] = self._clock
+
+    def load_day(self, doctor_id, date, occupied, since=None):
+        """
+        Занятость врача на дату из списка времен "HH:MM".
+        since - stamp() до запроса; если день с тех пор менялся, данные отбрасываются.
+        """
+        with self._lock:
+            self._roll_window()
+            cell = self._cell(doctor_id, date)
+            if cell is None or (since is not None and self.changed[cell] > since):
+                return False
+            row, day = cell
+            self.busy[row, day] = False
+            columns = [self.column[t[:5]] for t in occupied if t[:5] in self.column]
+            self.busy[row, day, columns] = True
+            self.loaded[row, day] = True
+            return True
+
+    def load_range(self, doctor_id, occupancy, since=None):
+        """Занятость врача за период: {"YYYY-MM-DD": ["HH:MM", ...]}"""
+        for date, occupied in occupancy.items():
+            self.load_day(doctor_id, date, occupied, since)
+
+    def set_slot(self, doctor_id, date, time_str, busy):
+        """Запись (busy=True) или отмена (busy=False) одного слота"""
+        with self._lock:
+            self._roll_window()
+            cell = self._cell(doctor_id, date)
+            column = self.column.get(time_str[:5])
+            if cell is None or column is None:
+                return False
+            self.busy[cell[0], cell[1], column] = busy
+            self._touch(cell)
+            return True
+
+    def unload_day(self, doctor_id, date):
+        """Отметить день как неизвестный (нужна повторная загрузка)"""
+        with self._lock:
+            cell = self._cell(doctor_id, date)
+            if cell is not None:
+                self.loaded[cell] = False
+                self._touch(cell)
+
+    def apply_changes(self, changes):
+        """
+        События журнала изменений / webhook: {'doctor_id', 'date', 'time', 'type', 'status'}.
+        created/updated (не отмененные) занимают слот; cancelled, deleted и moved
+        (старый слот перенесенной записи) освобождают его.
+        Событие без времени помечает день как незагруженный.
+        """
+        for change in changes:
+            doctor_id, date, time_str = change.get('doctor_id'), change.get('date'), change.get('time')
+            if not doctor_id or not date:
+                continue
+            if not time_str:
+                self.unload_day(doctor_id, date)
+                continue
+            change_type = change.get('type')
+            busy = change_type in ('created', 'updated') and change.get('status') != 0
+            self.set_slot(doctor_id, date, time_str, busy)
+
+    def on_invalidated(self, doctor_id, date):
+        """
+        Обработчик WordPressAPI.invalidation_listeners.
+        Полный сброс (без врача/даты) помечает все дни незагруженными;
+        изменения конкретного дня приходят через apply_changes/set_slot.
+        """
+        if doctor_id is None and date is None:
+            with self._lock:
+                self.loaded[:] = False
+                self._clock += 1
+                self.changed[:] = self._clock
+
+    def free(self, now=None):
+        """Булев массив свободных слотов (врачи, дни, слоты) с учетом прошедшего времени сегодня"""
+        with self._lock:
+            self._roll_window()
+            free = self.workable[:, None, :] & ~self.busy & self.loaded[:, :, None]
+            now = now or datetime.now()
+            if now.date() == self.start_date:
+                free[:, 0, self.offsets <= now.hour * 60 + now.minute] = False
+            return free
+
+    def free_counts(self, now=None):
+        """Количество свободных слотов: массив (врачи, дни)"""
+        return self.free(now).sum(axis=2)
+
+    def is_loaded(self, doctor_id, date):
+        """Загружен ли день врача"""
+        with self._lock:
+            self._roll_window()
+            cell = self._cell(doctor_id, date)
+            return cell is not None and bool(self.loaded[cell])
+
+    def unloaded_doctors(self):
+        """Врачи, у которых загружены не все дни окна"""
+        with self._lock:
+            self._roll_window()
+            return [self.doctor_ids[row] for row in np.flatnonzero(~self.loaded.all(axis=1))]
+
+    def free_counts_on(self, date, now=None):
+        """{doctor_id: свободных слотов} на дату (только загруженные дни)"""
+        day = self._day(date)
+        if day is None:
+            return {}
+        counts = self.free_counts(now)[:, day]
+        return {doctor_id: int(counts[row]) for row, doctor_id in enumerate(self.doctor_ids)
+                if self.loaded[row, day]}
+
+    def first_free_on(self, date, now=None):
+        """{doctor_id: первый свободный слот "HH:MM" или None} на дату"""
+        day = self._day(date)
+        if day is None:
+            return {}
+        free = self.free(now)[:, day, :]
+        has_free = free.any(axis=1)
+        first = free.argmax(axis=1)
+        return {doctor_id: (self.labels[first[row]] if has_free[row] else None)
+                for row, doctor_id in enumerate(self.doctor_ids) if self.loaded[row, day]}
+
+    def free_doctors(self, date, from_time='00:00', to_time='23:59', now=None):
+        """Врачи, у которых есть свободный слот на дату в интервале [from_time, to_time)"""
+        day = self._day(date)
+        if day is None:
+            return []
+        window = (self.offsets >= to_minutes(from_time)) & (self.offsets < to_minutes(to_time))
+        has_free = self.free(now)[:, day, :][:, window].any(axis=1)
+        return [self.doctor_ids[row] for row in np.flatnonzero(has_free)]
+
+    def utilization_by_hour(self):
+        """{час: доля занятых слотов} по загруженным дням всех врачей"""
+        with self._lock:
+            self._roll_window()
+            working = self.workable[:, None, :] & self.loaded[:, :, None]
+            busy = (self.busy & working).sum(axis=(0, 1))
+            total = working.sum(axis=(0, 1))
+            hours = self.offsets // 60
+        busy_by_hour = np.bincount(hours, weights=busy, minlength=24)
+        total_by_hour = np.bincount(hours, weights=total, minlength=24)
+        return {int(hour): float(busy_by_hour[hour] / total_by_hour[hour])
+                for hour in np.flatnonzero(total_by_hour)}
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+async def load_occupancy_range(wp_api, availability, matrix, doctor_id, date_from, date_to):
+    """
+    Занятость врача за период одним запросом /get-appointments-range -> availability и матрица.
+    Дни, сброшенные (webhook, /changes) пока запрос выполнялся, старым ответом не перезаписываются.
+    Возвращает {"YYYY-MM-DD": ["HH:MM", ...]} ({} при ошибке).
+    """
+    since = availability.stamp()
+    matrix_since = matrix.stamp() if matrix else None
+    occupancy = await wp_api.get_occupied_slots_range(doctor_id, date_from, date_to)
+    for date, occupied in occupancy.items():
+        availability.load_day(doctor_id, date, occupied, since)
+    if matrix:
+        matrix.load_range(doctor_id, occupancy, matrix_since)
+    return occupancy
+
+
+async def warm_up_availability(context):
+    """
+    Периодическая задача прогрева занятости.
+    Загружает занятость всех активных врачей на days_forward дней вперед:
+    один запрос /get-appointments-range на врача, одновременно не больше concurrency.
+    Заполняет битовые маски availability (по ним select_date строит сетку без запроса,
+    пока день свежий - availability_fresh_ttl) и матрицу.
+    Итог последнего прогрева сохраняется в job.data['last_run'].
+    """
+    data = context.job.data
+    wp_api = data.get('wp_api')
+    db = data.get('db')
+    availability = data.get('availability')
+    matrix = data.get('matrix')
+
+    if not wp_api or not db:
+        logger.error("WP API/БД не переданы в job прогрева занятости")
+        return
+
+    started = datetime.now()
+    try:
+        # Статус триггеров журнала изменений (от него зависит, сколько доверять памяти)
+        await wp_api.get_diagnostics()
+        doctors = await db.get_doctors()
+        days = data.get('days_forward', 7)
+        date_from = started.strftime('%Y-%m-%d')
+        date_to = (started + timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        semaphore = asyncio.Semaphore(data.get('concurrency', 4))
+        if matrix:
+            matrix.sync_doctors([doctor['id'] for doctor in doctors])
+
+        async def warm(doctor_id):
+            async with semaphore:
+                occupancy = await load_occupancy_range(wp_api, availability, matrix, doctor_id, date_from, date_to)
+            # Пустой ответ - ошибка запроса (для диапазона плагин возвращает все дни)
+            return bool(occupancy)
+
+        results = await asyncio.gather(*(warm(doctor['id']) for doctor in doctors))
+        duration = (datetime.now() - started).total_seconds()
+        failed = results.count(False)
+        data['last_run'] = {
+            'finished_at': datetime.now(),
+            'duration': duration,
+            'doctors': len(doctors),
+            'failed': failed,
+        }
+        logger.info(f"Прогрев занятости: врачей {len(doctors)}, ошибок {failed}, дней {days}, за {duration:.2f} с")
+
+    except Exception as e:
+        logger.error(f"Ошибка в job warm_up_availability: {e}")
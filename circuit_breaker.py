@@ -0,0 +1,79 @@
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: endpoint временно отключен (circuit breaker открыт)"""
+
+    def __init__(self, endpoint):
+        super().__init__(f"endpoint /{endpoint} временно недоступен (circuit breaker)")
+        self.endpoint = endpoint
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для одного endpoint'а.
+
+    После failure_threshold ошибок подряд переходит в OPEN и reset_timeout
+    секунд сразу отказывает (без ожидания таймаута). Затем пропускает один
+    пробный запрос (HALF_OPEN): успех закрывает breaker, ошибка снова открывает.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Можно ли отправить запрос"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+            # Пробный запрос один; если он "потерялся", через reset_timeout разрешаем новый
+            if self._state == HALF_OPEN and (not self._trial_in_flight
+                                             or time.monotonic() - self._trial_started >= self.reset_timeout):
+                self._trial_in_flight = True
+                self._trial_started = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def get_stats(self):
+        """Состояние breaker'а"""
+        state = self.state
+        with self._lock:
+            return {'state': state, 'failures': self._failures, 'rejected': self.rejected}
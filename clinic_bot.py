@@ -18,7 +18,16 @@ import mysql.connector
 from mysql.connector import Error
 import asyncio
 from wordpress_api import WordPressAPI, calculate_available_slots, generate_day_slots
-from config import WORDPRESS_CONFIG, WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION, ADMIN_IDS, PINNED_NUMBERS_FILE, DB_CONFIG, TABLE_PREFIX, BOT_TOKEN
+from db_pool import ConnectionPool
+from async_database import AsyncClinicDatabase, split_pool_config
+from async_wordpress_api import AsyncWordPressAPI
+from doctor_cache import DoctorRosterCache
+from webhook_receiver import InvalidationWebhookServer
+from schedule_compiler import CompiledSchedules
+from availability import AvailabilityEngine
+from availability_matrix import AvailabilityMatrix, NUMPY_AVAILABLE
+from availability_warmup import load_occupancy_range, warm_up_availability
+from config import WEBHOOK_CONFIG, WORDPRESS_CONFIG, WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION, ADMIN_IDS, PINNED_NUMBERS_FILE, DB_CONFIG, DB_POOL_CONFIG, TABLE_PREFIX, BOT_TOKEN, BOT_SETTINGS
 try:
     from config import CLINIC_INFO
 except ImportError:
@@ -54,27 +63,42 @@ SELECT_DOCTOR, SELECT_DATE, SELECT_TIME, CONFIRM_BOOKING = range(4)
 
 # Глобальные переменные
 db = None
+db_async = None
 wp_api = None
+wp_async = None
+webhook_server = None
+warmup_job = None
+
+# Сетки слотов врачей (собираются один раз из config)
+schedules = CompiledSchedules(WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION)
+# Занятость врачей по дням (битовые маски по сеткам слотов)
+availability = AvailabilityEngine(schedules)
+# Занятость всех врачей на days_forward дней (NumPy) для сводных запросов админа
+availability_matrix = AvailabilityMatrix(schedules, days=BOT_SETTINGS.get('days_forward', 7)) if NUMPY_AVAILABLE else None
 
 class ClinicDatabase:
     """Рабочий класс для бота клиники"""
     
-    def __init__(self, config, table_prefix):
+    def __init__(self, config, table_prefix, pool_config=None, roster_ttl=300):
         self.config = config
         self.table_prefix = table_prefix
         self.wp_api = None # Инициализация wp_api
         
+        # Кэш списка активных врачей (сбрасывается при изменении статуса врача)
+        self.roster = DoctorRosterCache(ttl=roster_ttl)
+        
+        # Копируем конфиг и добавляем таймаут
+        connect_config = self.config.copy()
+        connect_config['connect_timeout'] = 2
+        self.pool = ConnectionPool(connect_config, **(pool_config or {}))
+        
     def get_connection(self):
-        """Подключение к БД"""
-        try:
-            # Копируем конфиг и добавляем таймаут
-            config = self.config.copy()
-            config['connect_timeout'] = 2
-            connection = mysql.connector.connect(**config)
-            return connection
-        except Error as e:
-            logger.error(f"Ошибка подключения: {e}")
-            return None
+        """Подключение к БД (соединение берется из пула, close() возвращает его обратно)"""
+        return self.pool.get_connection()
+
+    def get_pool_metrics(self):
+        """Метрики пула соединений"""
+        return self.pool.get_metrics()
     
     def create_tables(self):
         """Создает необходимые таблицы в БД, если они не существуют."""
@@ -122,7 +146,7 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
     def get_doctors(self):
         """Получение списка врачей"""
@@ -163,7 +187,7 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
 
     def seed_doctors(self):
@@ -210,6 +234,7 @@ class ClinicDatabase:
                 ))
             
             connection.commit()
+            self.roster.invalidate()
             logger.info("Список врачей синхронизирован с конфигурацией")
                 
         except Error as e:
@@ -217,7 +242,7 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
     def _get_fallback_doctors(self):
         """
@@ -239,6 +264,11 @@ class ClinicDatabase:
         Получение списка врачей из БД
         Возвращает только АКТИВНЫХ врачей (is_active = 1)
         """
+        cached = self.roster.get_all()
+        if cached is not None:
+            return cached
+        generation = self.roster.generation()
+        
         connection = self.get_connection()
         if not connection:
             logger.warning("⚠️ Нет подключения к БД, используем резервный список врачей")
@@ -274,6 +304,7 @@ class ClinicDatabase:
                 if doc.get('return_date'):
                     logger.info(f"📅 Врач {doc['name']} вернется {doc['return_date']}")
             
+            self.roster.set(doctors, generation)
             return doctors
             
         except Error as e:
@@ -282,10 +313,14 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
     def get_doctor_by_id(self, doctor_id):
         """Получение информации о враче по ID"""
+        cached = self.roster.get(doctor_id)
+        if cached is not None:
+            return cached
+        
         connection = self.get_connection()
         if not connection:
             # Ищем в резервном списке
@@ -319,7 +354,7 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
     
     def create_appointment(self, user_id, doctor_id, appointment_date, appointment_time, user_name, user_phone):
@@ -355,7 +390,7 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
     def get_all_appointments(self, limit=50):
         """Получение всех записей (для админов)"""
@@ -387,7 +422,7 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
     def get_all_doctors_for_admin(self):
         """Получение всех врачей (включая неактивных) для админ панели"""
@@ -427,7 +462,27 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
+
+    def count_appointments(self):
+        """Количество записей в локальной БД"""
+        connection = self.get_connection()
+        if not connection:
+            return 0
+        
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(f"SELECT COUNT(*) as count FROM {self.table_prefix}appointments")
+            return cursor.fetchone()['count']
+            
+        except Error as e:
+            logger.error(f"Ошибка подсчета записей: {e}")
+            return 0
+        finally:
+            if cursor is not None and connection.is_connected():
+                cursor.close()
+            connection.close()
 
     def update_doctor_status(self, doctor_id, is_active, return_date=None):
         """Обновление статуса врача"""
@@ -448,6 +503,7 @@ class ClinicDatabase:
             
             cursor.execute(query, (is_active, return_date, doctor_id))
             connection.commit()
+            self.roster.invalidate()
             
             logger.info(f"Статус врача ID {doctor_id} обновлен: is_active={is_active}, return_date={return_date}")
             return True
@@ -458,10 +514,12 @@ class ClinicDatabase:
         finally:
             if connection.is_connected():
                 cursor.close()
-                connection.close()
+            connection.close()
 
 # Инициализация
-db = ClinicDatabase(DB_CONFIG, TABLE_PREFIX)
+sync_pool_config, _ = split_pool_config(DB_POOL_CONFIG)
+db = ClinicDatabase(DB_CONFIG, TABLE_PREFIX, sync_pool_config, BOT_SETTINGS.get('doctors_cache_ttl', 300))
+# Асинхронные клиенты (db_async, wp_async) создаются в main() - им нужен event loop бота
 
 # Инициализация WordPress API
 wp_api = None
@@ -473,8 +531,21 @@ if WORDPRESS_CONFIG.get('enabled', False):
             password=WORDPRESS_CONFIG.get('password'),
             api_key=WORDPRESS_CONFIG.get('api_key'),
             verify_ssl=WORDPRESS_CONFIG.get('verify_ssl', True),
-            timeout=WORDPRESS_CONFIG.get('timeout', 10) # Добавлен таймаут
+            timeout=WORDPRESS_CONFIG.get('timeout', 10), # Добавлен таймаут
+            retry_attempts=WORDPRESS_CONFIG.get('retry_attempts', 3),
+            endpoint_timeouts=WORDPRESS_CONFIG.get('endpoint_timeouts'),
+            pool_maxsize=WORDPRESS_CONFIG.get('pool_maxsize', 10),
+            cache_ttl=WORDPRESS_CONFIG.get('cache_ttl', 30),
+            cache_ttls=WORDPRESS_CONFIG.get('cache_ttls'),
+            cache_max_entries=WORDPRESS_CONFIG.get('cache_max_entries', 256),
+            cache_stale_ttl=WORDPRESS_CONFIG.get('cache_stale_ttl', 600),
+            breaker_threshold=WORDPRESS_CONFIG.get('breaker_threshold', 5),
+            breaker_reset_timeout=WORDPRESS_CONFIG.get('breaker_reset_timeout', 30)
         )
+        wp_api.invalidation_listeners.append(availability.invalidate)
+        if availability_matrix:
+            wp_api.invalidation_listeners.append(availability_matrix.on_invalidated)
+            wp_api.change_listeners.append(availability_matrix.apply_changes)
         success, message = wp_api.test_connection()
         if success:
             logger.info(f"✅ WordPress API подключен: {message}")
@@ -503,7 +574,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Проверяем подключение
     try:
-        doctors = await run_sync(db.get_doctors)
+        doctors = await db_async.get_doctors()
         doctors_count = len(doctors)
     except Exception as e:
         logger.error(f"Ошибка при проверке подключения: {e}")
@@ -556,7 +627,7 @@ async def doctors_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /doctors"""
     # await update.message.reply_text("👨‍⚕️ Получаю список врачей...") # Removed to reduce noise
     
-    doctors = await run_sync(db.get_doctors)
+    doctors = await db_async.get_doctors()
     
     if not doctors:
         await update.message.reply_text(
@@ -652,13 +723,13 @@ async def my_appointments_command(update: Update, context: ContextTypes.DEFAULT_
     # === ЛОГИКА ДЛЯ ВСЕХ ПОЛЬЗОВАТЕЛЕЙ ===
 
     # === ЛОГИКА ДЛЯ ОБЫЧНЫХ ПОЛЬЗОВАТЕЛЕЙ ===
-    if not wp_api:
+    if not wp_async:
         await update.message.reply_text("❌ Система управления записями временно недоступна.")
         return
 
     message = await update.message.reply_text("⏳ Ищу ваши записи...")
     
-    appointments = wp_api.get_patient_appointments(user_id)
+    appointments = await wp_async.get_patient_appointments(user_id)
     
     # Удаляем сообщение о поиске
     try:
@@ -667,9 +738,17 @@ async def my_appointments_command(update: Update, context: ContextTypes.DEFAULT_
         pass
     
     
+    if appointments is None:
+        await update.message.reply_text("⚠️ Сайт временно недоступен, не удалось загрузить ваши записи. Попробуйте позже.")
+        return
+
     if not appointments:
         await update.message.reply_text("📋 У вас пока нет активных записей.")
         return
+
+    if wp_async.sync_api.is_stale('my-appointments', {'telegram_id': user_id}):
+        # Ответ из кэша: отмены/записи последних минут могут быть не видны
+        await update.message.reply_text("⚠️ Сайт временно недоступен, список записей может быть неактуален.")
         
     for apt in appointments:
         # Форматируем дату
@@ -699,7 +778,7 @@ async def cancel_appointment_callback(update: Update, context: ContextTypes.DEFA
     apt_id = query.data.split('_')[2]
     
     # Пытаемся отменить
-    if wp_api and await run_sync(wp_api.cancel_appointment, apt_id):
+    if wp_async and await wp_async.cancel_appointment(apt_id):
         await query.edit_message_text(
             f"{query.message.text_html}\n\n"
             f"✅ <b>ЗАПИСЬ ОТМЕНЕНА</b>",
@@ -717,7 +796,7 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.answer("⛔ Нет доступа", show_alert=True)
         return
 
-    if not wp_api:
+    if not wp_async:
         await query.answer("❌ API отключен", show_alert=True)
         return
 
@@ -731,14 +810,22 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
     apt_id = parts[2]
     user_tg_id = int(parts[3])
 
+    # Получаем текущий фильтр
+    current_filter = context.user_data.get('admin_filter', 'all')
+
+    # Статус и обновленный список записей - одним запросом (/batch)
     if action_type == 'v':
         # Посетил -> Status 4
-        success = await run_sync(wp_api.update_appointment_status, apt_id, 4)
+        success, appointments = await wp_async.update_status_and_list(
+            apt_id, 4, limit=50, status_filter=current_filter
+        )
         action_text = "✅ Посетил"
         user_msg = "🏥 <b>Спасибо за посещение нашего медицинского центра!</b>\nБудем рады видеть вас снова! Желаем крепкого здоровья! 🌟"
     else:
         # Не пришел -> Status 5 (No Show)
-        success = await run_sync(wp_api.update_appointment_status, apt_id, 5)
+        success, appointments = await wp_async.update_status_and_list(
+            apt_id, 5, limit=50, status_filter=current_filter
+        )
         action_text = "⛔ Не пришел"
         user_msg = "⚠️ <b>Вы пропустили запись.</b>\nМы отметили, что вы не пришли на прием. Если вы хотите записаться снова, используйте команду /book."
 
@@ -756,12 +843,6 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Показываем уведомление админу
     await query.answer(f"{action_text} - статус обновлен!", show_alert=False)
     
-    # Получаем текущий фильтр
-    current_filter = context.user_data.get('admin_filter', 'all')
-    
-    # Получаем обновленный список записей
-    appointments = wp_api.get_filtered_appointments(limit=50, status_filter=current_filter)
-    
     # Определяем название фильтра
     filter_names = {
         'all': 'Все записи',
@@ -881,7 +962,7 @@ async def handle_admin_filter(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data['admin_filter'] = new_filter
     
     # Получаем отфильтрованные записи
-    appointments = wp_api.get_filtered_appointments(limit=50, status_filter=new_filter)
+    appointments = await wp_async.get_filtered_appointments(limit=50, status_filter=new_filter)
     
     # Определяем название фильтра
     filter_names = {
@@ -989,7 +1070,7 @@ async def show_admin_statistics(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     # Получаем все записи для подсчета статистики
-    all_appointments = wp_api.get_all_appointments(limit=200)
+    all_appointments = await wp_async.get_all_appointments(limit=200)
     
     # Подсчитываем по статусам
     confirmed_count = 0
@@ -1077,7 +1158,7 @@ async def show_doctor_management(update: Update, context: ContextTypes.DEFAULT_T
     
     # Получаем всех врачей (включая неактивных)
     logger.info("DEBUG: Calling get_all_doctors_for_admin...")
-    doctors = await run_sync(db.get_all_doctors_for_admin)
+    doctors = await db_async.get_all_doctors_for_admin()
     logger.info(f"DEBUG: Received {len(doctors) if doctors else 0} doctors. First doc active status: {doctors[0].get('is_active') if doctors else 'None'}")
     
     if not doctors:
@@ -1141,7 +1222,7 @@ async def handle_doctor_status_change(update: Update, context: ContextTypes.DEFA
     
     if data.startswith("toggle_doctor_"):
         doctor_id = int(data.split('_')[2])
-        doctor = await run_sync(db.get_doctor_by_id, doctor_id)
+        doctor = await db_async.get_doctor_by_id(doctor_id)
         
         if not doctor:
             await query.answer("❌ Врач не найден", show_alert=True)
@@ -1163,14 +1244,14 @@ async def handle_doctor_status_change(update: Update, context: ContextTypes.DEFA
             
         # Если врач неактивен -> активируем сразу
         else:
-            await run_sync(db.update_doctor_status, doctor_id, 1, None)
+            await db_async.update_doctor_status(doctor_id, 1, None)
             await query.answer("✅ Врач активирован!", show_alert=True)
             await show_doctor_management(update, context)
             return
 
     elif data.startswith("doc_perm_"):
         doctor_id = int(data.split('_')[2])
-        await run_sync(db.update_doctor_status, doctor_id, 0, None)
+        await db_async.update_doctor_status(doctor_id, 0, None)
         await query.answer("⛔ Врач деактивирован", show_alert=True)
         await show_doctor_management(update, context)
 
@@ -1198,7 +1279,7 @@ async def handle_doctor_status_change(update: Update, context: ContextTypes.DEFA
         from datetime import datetime, timedelta
         return_date = (datetime.now() + timedelta(days=days)).date()
         
-        await run_sync(db.update_doctor_status, doctor_id, 0, return_date)
+        await db_async.update_doctor_status(doctor_id, 0, return_date)
         await query.answer(f"🏖 Врач отправлен в отпуск до {return_date}", show_alert=True)
         await show_doctor_management(update, context)
 
@@ -1215,7 +1296,7 @@ async def show_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     try:
-        appointments = db.get_all_appointments(limit=20)
+        appointments = await db_async.get_all_appointments(limit=20)
         
         if not appointments:
             text = "📋 <b>Список записей (БД)</b>\n\n📭 Записей в базе не найдено."
@@ -1425,7 +1506,7 @@ async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("⏳ Загружаю список записей...")
     
     try:
-        appointments = db.get_all_appointments(limit=20)
+        appointments = await db_async.get_all_appointments(limit=20)
         
         if not appointments:
             await update.message.reply_text("📋 Записей в базе не найдено.")
@@ -1466,21 +1547,111 @@ async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Произошла ошибка при получении списка.")
 
 
+async def fill_availability_matrix():
+    """Догрузка в матрицу занятости врачей с незагруженными днями (один запрос за период на врача)"""
+    if not availability_matrix or not wp_async:
+        return
+    missing = availability_matrix.unloaded_doctors()
+    if not missing:
+        return
+    date_from = availability_matrix.date_at(0)
+    date_to = availability_matrix.date_at(availability_matrix.days - 1)
+    await asyncio.gather(*(
+        load_occupancy_range(wp_async, availability, availability_matrix, doctor_id, date_from, date_to)
+        for doctor_id in missing
+    ))
+
+
+@admin_required
+async def free_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /free [YYYY-MM-DD] [HH:MM-HH:MM] - свободные врачи и слоты на дату (по умолчанию завтра)"""
+    if not availability_matrix:
+        await update.message.reply_text("❌ Сводка недоступна: не установлен numpy.")
+        return
+
+    try:
+        args = context.args or []
+        date = args[0] if args else (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        from_time, to_time = args[1].split('-') if len(args) > 1 else ('00:00', '23:59')
+
+        doctors = await db_async.get_doctors()
+        names = {str(doctor['id']): doctor['name'] for doctor in doctors}
+        availability_matrix.sync_doctors([doctor['id'] for doctor in doctors])
+        await fill_availability_matrix()
+
+        counts = availability_matrix.free_counts_on(date)
+        if not counts:
+            await update.message.reply_text(
+                f"❌ Нет данных на {date}: доступны даты с {availability_matrix.date_at(0)} "
+                f"по {availability_matrix.date_at(availability_matrix.days - 1)}."
+            )
+            return
+        first_free = availability_matrix.first_free_on(date)
+        in_window = {str(doctor_id) for doctor_id in availability_matrix.free_doctors(date, from_time, to_time)}
+
+        text = f"🗓 <b>Свободные слоты на {date}</b> ({from_time}-{to_time})\n\n"
+        for doctor_id, count in sorted(counts.items(), key=lambda item: -item[1]):
+            key = str(doctor_id)
+            mark = "✅" if key in in_window else "⛔"
+            first = f", первый {first_free[doctor_id]}" if first_free.get(doctor_id) else ""
+            text += f"{mark} {names.get(key, key)}: {count}{first}\n"
+
+        utilization = availability_matrix.utilization_by_hour()
+        if utilization:
+            text += "\n<b>Загрузка по часам:</b>\n"
+            text += " ".join(f"{hour:02d}ч {share:.0%}" for hour, share in utilization.items())
+
+        await update.message.reply_text(text, parse_mode='HTML')
+
+    except ValueError:
+        await update.message.reply_text("Использование: /free [YYYY-MM-DD] [HH:MM-HH:MM]")
+    except Exception as e:
+        logger.error(f"Ошибка в команде free: {e}")
+        await update.message.reply_text("❌ Не удалось получить свободные слоты.")
+
+
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /status - проверка состояния системы"""
     try:
-        doctors = db.get_doctors()
+        doctors = await db_async.get_doctors()
         doctors_count = len(doctors)
         
-        connection = db.get_connection()
-        if connection:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(f"SELECT COUNT(*) as count FROM {TABLE_PREFIX}appointments")
-            appointments_count = cursor.fetchone()['count']
-            cursor.close()
-            connection.close()
-        else:
-            appointments_count = 0
+        appointments_count = await db_async.count_appointments()
+        
+        pool = db_async.get_pool_metrics()
+        
+        cache_stats = "отключен"
+        if wp_async:
+            stats = wp_async.cache.get_stats()
+            cache_stats = (
+                f"попаданий {stats['hits']}, промахов {stats['misses']}, записей {stats['entries']}, "
+                f"304: {stats['revalidated']}, устаревших: {stats['stale']}, объединено запросов: {wp_async.flights.shared + wp_api.flights.shared}"
+            )
+
+        breaker_stats = "нет данных"
+        if wp_api:
+            breakers = wp_api.get_breaker_stats()
+            problems = [
+                f"{endpoint}: {b['state']} (ошибок {b['failures']}, отказов {b['rejected']})"
+                for endpoint, b in breakers.items() if b['state'] != 'closed'
+            ]
+            if problems:
+                breaker_stats = "\n   " + "\n   ".join(problems)
+            elif breakers:
+                breaker_stats = f"все {len(breakers)} endpoint'ов в норме"
+
+        webhook_stats = "выключен"
+        if webhook_server:
+            hook = webhook_server.get_stats()
+            webhook_stats = f"{'работает' if hook['running'] else 'остановлен'}, событий {hook['received']}, отклонено {hook['rejected']}"
+        
+        warmup_stats = "не запускался"
+        last_run = warmup_job.data.get('last_run') if warmup_job else None
+        if last_run:
+            warmup_stats = (
+                f"{last_run['finished_at'].strftime('%H:%M:%S')}, врачей {last_run['doctors']}, "
+                f"ошибок {last_run['failed']}, {last_run['duration']:.1f} с"
+            )
         
         status_text = (
             "📊 <b>Статус системы</b>\n\n"
@@ -1488,6 +1659,12 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"✅ Префикс таблиц: {TABLE_PREFIX}\n"
             f"👨‍⚕️ Врачей в базе: {doctors_count}\n"
             f"📅 Всего записей: {appointments_count}\n"
+            f"🔌 Пул БД: занято {pool['in_use']}/{pool['size']}, "
+            f"ожидают {pool['waiting']}, открыто {pool['open']}\n"
+            f"🗄 Кэш WordPress: {cache_stats}\n"
+            f"🛡 Circuit breaker: {breaker_stats}\n"
+            f"🔔 Webhook: {webhook_stats}\n"
+            f"🔥 Прогрев занятости: {warmup_stats}\n"
             f"🤖 Бот работает: Да\n\n"
             "<b>Последние 3 врача:</b>\n"
         )
@@ -1546,6 +1723,132 @@ async def handle_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+def doctor_return_date(doctor):
+    """Дата возвращения врача из отпуска (date) или None"""
+    return_date = doctor.get('return_date')
+    if isinstance(return_date, str):
+        try:
+            return datetime.strptime(return_date, '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    if isinstance(return_date, datetime):
+        return return_date.date()
+    return return_date
+
+
+def bookable_dates(now=None):
+    """Даты, доступные для записи: days_forward дней без воскресений, сегодня - до дедлайна"""
+    now = now or datetime.now()
+    deadline_hour = BOT_SETTINGS.get('same_day_booking_deadline', 11)
+    dates = []
+    for i in range(BOT_SETTINGS.get('days_forward', 7)):
+        date = now + timedelta(days=i)
+        if date.weekday() == 6 or (i == 0 and now.hour >= deadline_hour):
+            continue
+        dates.append(date.strftime('%Y-%m-%d'))
+    return dates
+
+
+def availability_max_age():
+    """
+    Сколько секунд занятость дня из памяти считается актуальной.
+    availability_fresh_ttl - только когда изменения с сайта приходят сразу (запущен
+    приемник webhook, а в журнал изменений попадают записи с сайта - есть триггеры);
+    иначе запись на сайте увидим не раньше, чем истечет этот срок,
+    поэтому он не больше TTL кэша /get-appointments.
+    """
+    cache_ttl = WORDPRESS_CONFIG.get('cache_ttls', {}).get('get-appointments', WORDPRESS_CONFIG.get('cache_ttl', 30))
+    if webhook_server and webhook_server.get_stats()['running'] and wp_api and wp_api.push_invalidation_complete():
+        return BOT_SETTINGS.get('availability_fresh_ttl', 900)
+    return cache_ttl
+
+
+async def find_nearest_slots(doctors, limit):
+    """
+    Ближайшие свободные слоты у нескольких врачей: [(date, time, doctor), ...] по возрастанию.
+
+    Занятость каждого врача за все окно - один запрос /get-appointments-range
+    (запросы по врачам параллельно). Дальше дни просматриваются по порядку,
+    и как только набралось limit вариантов, более поздние дни не смотрим.
+    """
+    dates = bookable_dates()
+    if not dates or not wp_async:
+        return []
+
+    await asyncio.gather(*(
+        load_occupancy_range(wp_async, availability, availability_matrix, doctor['id'], dates[0], dates[-1])
+        for doctor in doctors
+    ))
+
+    options = []
+    for date in dates:
+        for doctor in doctors:
+            return_date = doctor_return_date(doctor)
+            # День без данных (ошибка запроса, сброшен изменениями) или врач в отпуске - не предлагаем
+            if not availability.has_day(doctor['id'], date) or (return_date and date < return_date.strftime('%Y-%m-%d')):
+                continue
+            options.extend((date, time, doctor) for time in availability.first_free(doctor['id'], date, limit))
+        if len(options) >= limit:
+            break
+
+    options.sort(key=lambda option: (option[0], option[1]))
+    return options[:limit]
+
+
+async def prefetch_doctor_week(doctor_id, dates):
+    """
+    Фоновая загрузка занятости врача на показанные даты одним запросом /get-appointments-range.
+    Заполняет кэш /get-appointments по дням и битовые маски availability.
+    """
+    started = datetime.now()
+    occupancy = await load_occupancy_range(wp_async, availability, availability_matrix, doctor_id, dates[0], dates[-1])
+    logger.info(f"Предзагрузка занятости врача {doctor_id}: {len(occupancy)} дн. за {(datetime.now() - started).total_seconds():.2f} с")
+
+
+async def show_specialties(query, context):
+    """Выбор специальности для поиска ближайшего свободного времени"""
+    doctors = await db_async.get_doctors()
+    specialties = sorted({doctor.get('specialty') or 'Специалист' for doctor in doctors})
+    context.user_data['specialties'] = specialties
+
+    keyboard = [[InlineKeyboardButton(f"🩺 {specialty}", callback_data=f"spec_{i}")]
+                for i, specialty in enumerate(specialties)]
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+    await query.edit_message_text(
+        "⚡ Ближайшее свободное время\n\nВыберите специальность:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return SELECT_DOCTOR
+
+
+async def show_nearest_slots(query, context, specialty, notice=None):
+    """Ближайшие свободные слоты всех врачей специальности одной клавиатурой"""
+    context.user_data['nearest_specialty'] = specialty
+    doctors = [doctor for doctor in await db_async.get_doctors()
+               if (doctor.get('specialty') or 'Специалист') == specialty]
+    await query.edit_message_text(f"⏳ Ищем ближайшее свободное время: {specialty}...")
+
+    options = await find_nearest_slots(doctors, BOT_SETTINGS.get('nearest_slots_count', 6))
+    keyboard = []
+    for date, time, doctor in options:
+        day = datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m')
+        keyboard.append([InlineKeyboardButton(
+            f"🗓 {day} {time} - {doctor['name']}",
+            callback_data=f"near_{doctor['id']}_{date}_{time}"
+        )])
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="nearest")])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+
+    if options:
+        text = f"⚡ <b>{specialty}</b>: ближайшее свободное время\n\nВыберите удобный вариант:"
+    else:
+        text = f"❌ <b>{specialty}</b>: свободного времени на ближайшие дни нет."
+    if notice:
+        text = f"{notice}\n\n{text}"
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+    return SELECT_DOCTOR
+
+
 async def book_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало процесса записи"""
     # Ограничение времени для ТЕКУЩЕГО дня проверяется позже при выборе даты
@@ -1557,7 +1860,7 @@ async def book_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Получаем список врачей
     # Получаем список врачей
-    doctors = db.get_doctors()
+    doctors = await db_async.get_doctors()
     
     if not doctors:
         await update.message.reply_text(
@@ -1597,6 +1900,7 @@ async def book_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         button_text = f"👨‍⚕️ {name} - {specialty}{vacation_text}"
         keyboard.append([InlineKeyboardButton(button_text, callback_data=f"doctor_{doctor['id']}")])
     
+    keyboard.append([InlineKeyboardButton("⚡ Ближайшее свободное время", callback_data="nearest")])
     keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -1619,21 +1923,59 @@ async def select_doctor(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ConversationHandler.END
         
         logger.info(f"select_doctor: Processing callback data: {query.data}")
+
+        # Режим "ближайшее свободное время": специальность -> варианты всех ее врачей
+        if query.data == "nearest":
+            return await show_specialties(query, context)
+        if query.data.startswith('spec_'):
+            specialty = context.user_data['specialties'][int(query.data.split('_')[1])]
+            return await show_nearest_slots(query, context, specialty)
+        if query.data.startswith('near_'):
+            _, doctor_id, date, time = query.data.split('_')
+            doctor = await db_async.get_doctor_by_id(int(doctor_id))
+            # Варианты могли устареть, пока клавиатура висела: дедлайн записи на сегодня,
+            # прошедшее время, слот заняли или врач ушел в отпуск - проверяем заново.
+            # Незагруженный (сброшенный) день в памяти выглядит свободным - сначала загружаем его
+            if not availability.is_fresh(int(doctor_id), date, availability_max_age()) and wp_async:
+                since = availability.stamp()
+                matrix_since = availability_matrix.stamp() if availability_matrix else None
+                occupied = await wp_async.get_occupied_slots(doctor_id=int(doctor_id), date=date)
+                if occupied is not None:
+                    availability.load_day(int(doctor_id), date, occupied, since)
+                    if availability_matrix:
+                        availability_matrix.load_day(int(doctor_id), date, occupied, matrix_since)
+            return_date = doctor_return_date(doctor) if doctor else None
+            if (date not in bookable_dates()
+                    or not availability.has_day(int(doctor_id), date)
+                    or time not in availability.free_slots(int(doctor_id), date)
+                    or (return_date and date < return_date.strftime('%Y-%m-%d'))):
+                specialty = context.user_data.get('nearest_specialty')
+                if not specialty:
+                    return await show_specialties(query, context)
+                return await show_nearest_slots(query, context, specialty,
+                                                notice="⚠️ Это время уже недоступно, выберите другое.")
+            context.user_data['doctor_id'] = int(doctor_id)
+            context.user_data['doctor_name'] = doctor['name'] if doctor else "Неизвестный врач"
+            context.user_data['date'] = date
+            context.user_data['time'] = time
+            try:
+                await query.message.delete()
+            except Exception:
+                pass
+            return await request_contact(update, context)
         
         doctor_id = int(query.data.split('_')[1])
         context.user_data['doctor_id'] = doctor_id
         
         # Сохраняем имя врача для дальнейшего использования
-        doctors = db.get_doctors()
+        doctor = await db_async.get_doctor_by_id(doctor_id)
         doctor_name = "Неизвестный врач"
         return_date = None
         
-        for doc in doctors:
-            if doc['id'] == doctor_id:
-                doctor_name = doc['name']
-                if doc.get('return_date'):
-                    return_date = doc['return_date']
-                break
+        if doctor:
+            doctor_name = doctor['name']
+            if doctor.get('return_date'):
+                return_date = doctor['return_date']
         context.user_data['doctor_name'] = doctor_name
         
         # Определяем начальную дату (сегодня или дата возвращения)
@@ -1666,6 +2008,7 @@ async def select_doctor(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Генерируем даты на ближайшие 7 дней от start_date
         keyboard = []
+        shown_dates = []
         
         for i in range(7):
             date = start_date + timedelta(days=i)
@@ -1695,6 +2038,7 @@ async def select_doctor(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 display_date = display_date.replace(eng, ru)
             
             keyboard.append([InlineKeyboardButton(display_date, callback_data=f"date_{date_str}")])
+            shown_dates.append(date_str)
         
         keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_doctors")])
         keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
@@ -1705,6 +2049,12 @@ async def select_doctor(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup,
             parse_mode='HTML'
         )
+
+        # Пока пользователь выбирает дату, в фоне загружаем занятость всех показанных дней
+        if wp_async and shown_dates:
+            context.user_data['prefetch'] = context.application.create_task(
+                prefetch_doctor_week(doctor_id, shown_dates)
+            )
         
         return SELECT_DATE
 
@@ -1726,7 +2076,7 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         if query.data == "back_to_doctors":
             # Возврат к выбору врачей
-            doctors = db.get_doctors()
+            doctors = await db_async.get_doctors()
             keyboard = []
             for doctor in doctors:
                 # Обрезаем длинные имена
@@ -1758,27 +2108,39 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['date'] = date
         doctor_id = context.user_data.get('doctor_id')
         
-        # Получаем занятые слоты из WordPress API
-        occupied_slots = []
-        if wp_api:
+        # Дожидаемся фоновой загрузки недели (запущена при выборе врача), но не дольше
+        # prefetch_wait_timeout: тогда занятость дня уже в памяти и запрос к сайту не нужен.
+        # shield - по таймауту задача не отменяется и дозаполняет кэш в фоне
+        prefetch = context.user_data.pop('prefetch', None)
+        if prefetch and not prefetch.done():
             try:
-                occupied_slots = wp_api.get_occupied_slots(doctor_id=doctor_id, date=date)
+                await asyncio.wait_for(asyncio.shield(prefetch), timeout=BOT_SETTINGS.get('prefetch_wait_timeout', 3))
+            except asyncio.TimeoutError:
+                logger.warning(f"Фоновая загрузка занятости врача {doctor_id} не успела, запрашиваем день")
+            except Exception as e:
+                logger.warning(f"Фоновая загрузка занятости не удалась: {e}")
+
+        # Занятость, загруженная недавно (прогрев, предзагрузка недели) и не сброшенная
+        # изменениями с сайта, берется из памяти. Иначе - из WordPress API (None - неизвестна)
+        fresh = availability.is_fresh(doctor_id, date, availability_max_age())
+        occupied_slots = None
+        since = availability.stamp()
+        matrix_since = availability_matrix.stamp() if availability_matrix else None
+        if wp_async and not fresh:
+            try:
+                occupied_slots = await wp_async.get_occupied_slots(doctor_id=doctor_id, date=date)
                 logger.info(f"Получены занятые слоты из WordPress: {occupied_slots}")
             except Exception as e:
                 logger.error(f"Ошибка получения слотов из WordPress: {e}")
         
-        # Получаем расписание для конкретного врача (или используем стандартное)
-        doctor_schedule = DOCTOR_SCHEDULES.get(doctor_id, WORKING_HOURS)
-        
-        # Получаем ВСЕ слоты на день с учетом индивидуального расписания врача
-        all_slots = generate_day_slots(
-            start_time=doctor_schedule.get('start', '09:00'),
-            end_time=doctor_schedule.get('end', '18:00'),
-            lunch_start=doctor_schedule.get('lunch_start', '13:00'),
-            lunch_end=doctor_schedule.get('lunch_end', '14:00'),
-            slot_duration=APPOINTMENT_DURATION,
-            date_str=date
-        )
+        # Получаем ВСЕ слоты на день по сетке врача (индивидуальной или стандартной)
+        all_slots = schedules.day_slots(doctor_id, date_str=date)
+        # Занятость дня - битовая маска по сетке врача; при ошибке запроса
+        # оставляем ранее загруженную маску, а не "все свободно"
+        if occupied_slots is not None:
+            availability.load_day(doctor_id, date, occupied_slots, since)
+            if availability_matrix:
+                availability_matrix.load_day(doctor_id, date, occupied_slots, matrix_since)
         
         # Создаём кнопки (по 3 в ряд)
         keyboard = []
@@ -1839,7 +2201,7 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             
         for i, slot in enumerate(all_slots):
-            if slot in occupied_slots:
+            if not availability.is_free(doctor_id, date, slot):
                 # Занятый слот
                 row.append(InlineKeyboardButton(f"❌ {slot}", callback_data=f"busy_{slot}"))
             else:
@@ -1858,11 +2220,15 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         # Формируем сообщение
-        available_count = len([s for s in all_slots if s not in occupied_slots])
+        available_count, busy_count = availability.counts(doctor_id, date)
         
         message = f"📅 Выберите время приёма на {date}:\n\n"
         message += f"✅ Свободно: {available_count}\n"
-        message += f"❌ Занято: {len(occupied_slots)}\n"
+        message += f"❌ Занято: {busy_count}\n"
+        if wp_api and (wp_api.is_degraded('get-appointments')
+                       or (not fresh and wp_api.is_stale('get-appointments', {'doctor_id': doctor_id, 'date': date}))):
+            # Сайт недоступен - занятость могла измениться
+            message += "\n⚠️ Сайт временно недоступен, данные о занятости могут быть неактуальны.\n"
         
         await query.edit_message_text(
             message,
@@ -1914,6 +2280,11 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     time = query.data.split('_')[1]
     context.user_data['time'] = time
+
+    # Повторный выбор после "слот занят": контакты уже есть, сразу создаем запись
+    if context.user_data.pop('rebooking', False):
+        await query.edit_message_text(f"⏳ Записываем на {time}...")
+        return await finalize_booking(update, context)
     
     # Удаляем сообщение с календарем/временем, чтобы не захламлять чат
     try:
@@ -2029,8 +2400,7 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['name'] = message.text
         
         # Все данные есть - СОЗДАЕМ ЗАПИСЬ
-        await finalize_booking(update, context)
-        return ConversationHandler.END
+        return await finalize_booking(update, context)
 
 async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Финальное создание записи"""
@@ -2047,44 +2417,53 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = user_data['name']
     phone = user_data['phone']
     user = update.effective_user
+    # Сообщение пользователя или (при повторном выборе времени) сообщение с кнопками
+    message = update.effective_message
     
     # 1. Создаем запись в WordPress
     success = False
     result = "WordPress API не подключен или ошибка сети"
     
-    if wp_api:
+    if wp_async:
+        for attempt in range(2):
+            try:
+                success, result = await wp_async.create_appointment(
+                    doctor_id=doctor_id,
+                    date=date,
+                    time=time_full,
+                    patient_name=name,
+                    patient_phone=phone,
+                    telegram_id=user.id
+                )
+            except Exception as e:
+                logger.error(f"Ошибка вызова WP API: {e}")
+                result = str(e)
+            # День врача сейчас записывают параллельно - одна повторная попытка
+            if attempt == 0 and isinstance(result, dict) and result.get('code') == 'slot_locked':
+                await asyncio.sleep(1)
+                continue
+            break
+    else:
+        logger.warning("WordPress API не инициализирован. Пропускаем сохранение на сайт.")
+    
+    # 2. Создаем запись в локальной БД (дублирование) - только если сайт ее принял
+    # (или сайт не подключен), иначе остаются строки на чужие слоты
+    if success or not wp_async:
         try:
-            success, result = await run_sync(wp_api.create_appointment,
+            db_success = await db_async.create_appointment(
+                user_id=user.id,
                 doctor_id=doctor_id,
-                date=date,
-                time=time_full,
-                patient_name=name,
-                patient_phone=phone,
-                telegram_id=user.id
+                appointment_date=date,
+                appointment_time=time_full,
+                user_name=name,
+                user_phone=phone
             )
+            if db_success:
+                logger.info(f"✅ Запись сохранена в локальной БД: {name} на {date} {time}")
+            else:
+                logger.warning(f"⚠️ Не удалось сохранить запись в локальную БД")
         except Exception as e:
-            logger.error(f"Ошибка вызова WP API: {e}")
-            result = str(e)
-    else:
-        logger.warning("WordPress API не инициализирован. Пропускаем сохранение на сайт.")
-    
-    # 2. Создаем запись в локальной БД (дублирование)
-    try:
-        db_success = await run_sync(
-            db.create_appointment,
-            user_id=user.id,
-            doctor_id=doctor_id,
-            appointment_date=date,
-            appointment_time=time_full,
-            user_name=name,
-            user_phone=phone
-        )
-        if db_success:
-            logger.info(f"✅ Запись сохранена в локальной БД: {name} на {date} {time}")
-        else:
-            logger.warning(f"⚠️ Не удалось сохранить запись в локальную БД")
-    except Exception as e:
-        logger.error(f"❌ Ошибка сохранения в локальную БД: {e}")
+            logger.error(f"❌ Ошибка сохранения в локальную БД: {e}")
     
     # Отправляем главное меню обратно
     from telegram import ReplyKeyboardMarkup, KeyboardButton
@@ -2110,9 +2489,12 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if success:
         appointment_id = result
+        availability.book(doctor_id, date, time)
+        if availability_matrix:
+            availability_matrix.set_slot(doctor_id, date, time, True)
         logger.info(f"✅ Запись создана: ID {appointment_id}, {name} к врачу {doctor_id} на {date} {time}")
         
-        await update.message.reply_text(
+        await message.reply_text(
             f"✅ <b>ВЫ УСПЕШНО ЗАПИСАНЫ!</b>\n\n"
             f"�‍⚕️ Врач: <b>{user_data['doctor_name']}</b>\n"
             f"📅 Дата: <b>{date}</b>\n"
@@ -2151,6 +2533,40 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception as e:
                 logger.error(f"Не удалось отправить уведомление админу {admin_id}: {e}")
                 
+    elif isinstance(result, dict) and result.get('code') in ('slot_taken', 'slot_locked'):
+        # Слот заняли (или его сейчас записывают) параллельно - сразу предлагаем свободное время этого дня
+        logger.warning(f"Слот {date} {time}: {result['code']}, предлагаем альтернативы пользователю {user.id}")
+        if result['occupied'] is not None:
+            availability.load_day(doctor_id, date, result['occupied'])
+            if availability_matrix:
+                availability_matrix.load_day(doctor_id, date, result['occupied'])
+            free_slots = availability.free_slots(doctor_id, date)
+        else:
+            # slot_locked: занятость неизвестна - запрашиваем ее, выбранное время считаем занятым
+            occupied = await wp_async.get_occupied_slots(doctor_id=doctor_id, date=date)
+            free_slots = schedules.free_slots(doctor_id, list(occupied or []) + [time], date_str=date)
+
+        if free_slots:
+            keyboard = [
+                [InlineKeyboardButton(f"✅ {slot}", callback_data=f"time_{slot}") for slot in free_slots[i:i + 3]]
+                for i in range(0, len(free_slots), 3)
+            ]
+            keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel")])
+            user_data['rebooking'] = True
+            await message.reply_text(
+                f"⚠️ <b>Время {time} на {date} только что заняли.</b>\n\n"
+                f"Выберите другое свободное время:",
+                parse_mode='HTML',
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return SELECT_TIME
+
+        await message.reply_text(
+            f"⚠️ <b>Время {time} на {date} только что заняли,</b> свободных слотов на этот день больше нет.\n"
+            f"Пожалуйста, выберите другую дату: /book",
+            parse_mode='HTML',
+            reply_markup=main_menu
+        )
     else:
         # Failure case
         logger.error(f"❌ Ошибка создания записи для {user.id}: {result}")
@@ -2160,7 +2576,7 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif isinstance(result, dict) and 'message' in result:
              error_msg = result['message']
 
-        await update.message.reply_text(
+        await message.reply_text(
             f"❌ <b>Ошибка при создании записи</b>\n"
             f"{error_msg}\n"
             f"Пожалуйста, попробуйте еще раз или свяжитесь с нами по телефону.",
@@ -2205,6 +2621,20 @@ async def post_init(application: Application):
         logger.warning(f"⚠️ Не удалось установить команды: {e}")
 
 
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов при остановке бота"""
+    if db_async:
+        await db_async.close()
+    if db:
+        db.pool.close_all()
+    if wp_async:
+        await wp_async.close()
+    if wp_api:
+        wp_api.close()
+    if webhook_server:
+        webhook_server.stop()
+
+
 async def handle_sync_doctors(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Синхронизация врачей с WordPress"""
     query = update.callback_query
@@ -2213,7 +2643,7 @@ async def handle_sync_doctors(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.answer("⛔ Нет доступа", show_alert=True)
         return
 
-    if not wp_api:
+    if not wp_async:
         await query.answer("❌ API не подключен", show_alert=True)
         return
         
@@ -2221,7 +2651,7 @@ async def handle_sync_doctors(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # 1. Получаем врачей из WP
-        wp_doctors = await run_sync(wp_api.get_doctors)
+        wp_doctors = await wp_async.get_doctors()
         
         if not wp_doctors:
             await query.edit_message_text(
@@ -2271,8 +2701,13 @@ async def handle_sync_doctors(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 def main():
     """Запуск бота"""
-    global db, wp_api # Make sure we affect the global variables used by handlers
-    
+    global db, db_async, wp_api, wp_async, webhook_server, warmup_job # Make sure we affect the global variables used by handlers
+
+    # Клиенты, созданные при импорте, заменяются ниже - освобождаем их соединения
+    if wp_api:
+        wp_api.close()
+    db.pool.close_all()
+
     # Инициализация API
     wp_api = WordPressAPI(
         site_url=WORDPRESS_CONFIG['site_url'],
@@ -2280,24 +2715,60 @@ def main():
         password=WORDPRESS_CONFIG['password'],
         api_key=WORDPRESS_CONFIG.get('api_key'),
         verify_ssl=WORDPRESS_CONFIG.get('verify_ssl', True),
-        timeout=WORDPRESS_CONFIG.get('timeout', 10)
+        timeout=WORDPRESS_CONFIG.get('timeout', 10),
+        retry_attempts=WORDPRESS_CONFIG.get('retry_attempts', 3),
+        endpoint_timeouts=WORDPRESS_CONFIG.get('endpoint_timeouts'),
+        pool_maxsize=WORDPRESS_CONFIG.get('pool_maxsize', 10),
+        cache_ttl=WORDPRESS_CONFIG.get('cache_ttl', 30),
+        cache_ttls=WORDPRESS_CONFIG.get('cache_ttls'),
+        cache_max_entries=WORDPRESS_CONFIG.get('cache_max_entries', 256),
+        cache_stale_ttl=WORDPRESS_CONFIG.get('cache_stale_ttl', 600),
+        breaker_threshold=WORDPRESS_CONFIG.get('breaker_threshold', 5),
+        breaker_reset_timeout=WORDPRESS_CONFIG.get('breaker_reset_timeout', 30)
     )
     
+    # Изменения записей сбрасывают загруженную занятость
+    wp_api.invalidation_listeners.append(availability.invalidate)
+    if availability_matrix:
+        wp_api.invalidation_listeners.append(availability_matrix.on_invalidated)
+        wp_api.change_listeners.append(availability_matrix.apply_changes)
+
     # Тест подключения
     success, message = wp_api.test_connection()
     if success:
         logger.info(f"✅ WordPress API подключен: {message}")
+        wp_api.get_diagnostics()
+        if not wp_api.push_invalidation_complete():
+            logger.warning("⚠️ Триггеры журнала изменений не установлены: записи с сайта бот увидит только по TTL кэша")
     else:
         logger.error(f"❌ Ошибка подключения к WordPress API: {message}")
+    # Асинхронный клиент для обработчиков (не блокирует event loop)
+    wp_async = AsyncWordPressAPI(wp_api)
+
+    # Приемник событий от сайта: сброс кэша сразу после изменений на сайте
+    if WEBHOOK_CONFIG.get('enabled'):
+        webhook_server = InvalidationWebhookServer(
+            wp_api,
+            host=WEBHOOK_CONFIG.get('host', '127.0.0.1'),
+            port=WEBHOOK_CONFIG.get('port', 8081),
+            secret=WEBHOOK_CONFIG.get('secret', ''),
+            path=WEBHOOK_CONFIG.get('path', '/clinic-webhook'),
+            max_age=WEBHOOK_CONFIG.get('max_age', 300)
+        )
+        webhook_server.start()
         
     # Инициализация БД
-    db = ClinicDatabase(DB_CONFIG, TABLE_PREFIX)
+    # Бюджет соединений MySQL делится между синхронным и асинхронным пулом
+    sync_pool_config, async_pool_config = split_pool_config(DB_POOL_CONFIG)
+    db = ClinicDatabase(DB_CONFIG, TABLE_PREFIX, sync_pool_config, BOT_SETTINGS.get('doctors_cache_ttl', 300))
     # ВАЖНО: Передаем API в глобальный объект БД
     if db:
         db.wp_api = wp_api
+    # Асинхронный доступ к БД для обработчиков (свой пул, не занимает потоки)
+    db_async = AsyncClinicDatabase(db, async_pool_config)
         
     # Используем post_init для настройки команд
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
     
     # Добавляем обработчик ошибок
     application.add_error_handler(error_handler)
@@ -2330,6 +2801,7 @@ def main():
     application.add_handler(CommandHandler("del_pin", del_pin_command))
     application.add_handler(CommandHandler("pinned", pinned_command))
     application.add_handler(CommandHandler("list", list_command)) # New command
+    application.add_handler(CommandHandler("free", free_command))
     application.add_handler(CallbackQueryHandler(cancel_appointment_callback, pattern="^cancel_apt_")) 
     application.add_handler(CallbackQueryHandler(handle_admin_action, pattern="^adm_[vn]_")) # Admin actions handlers
     application.add_handler(CallbackQueryHandler(handle_admin_filter, pattern="^admin_filter_")) # Admin filter handlers
@@ -2362,7 +2834,7 @@ def main():
             
         try:
             # Получаем все записи (можно добавить фильтры по датам аргументами)
-            appointments = wp_api.get_filtered_appointments(limit=1000, status_filter='all')
+            appointments = await wp_async.get_all_appointments_paged(page_size=200)
             if not appointments:
                 await status_msg.edit_text("📭 Записей не найдено.")
                 return
@@ -2409,9 +2881,25 @@ def main():
             check_reminders, 
             interval=3600, # Каждый час
             first=10, # Первый запуск через 10 сек
-            data={'wp_api': wp_api}
+            data={'wp_api': wp_async}
         )
         logger.info("⏰ Планировщик напоминаний запущен")
+
+        # Прогрев занятости всех врачей, чтобы первые пациенты не ждали сайт
+        warmup_job = application.job_queue.run_repeating(
+            warm_up_availability,
+            interval=BOT_SETTINGS.get('warmup_interval', 600),
+            first=30,
+            data={
+                'wp_api': wp_async,
+                'db': db_async,
+                'availability': availability,
+                'matrix': availability_matrix,
+                'days_forward': BOT_SETTINGS.get('days_forward', 7),
+                'concurrency': BOT_SETTINGS.get('warmup_concurrency', 4),
+            }
+        )
+        logger.info("🔥 Прогрев занятости запущен")
     else:
         logger.warning("⚠️ JobQueue не доступен!")
 
@@ -43,6 +43,15 @@ DB_CONFIG = {
     "autocommit": True,
 }
 
+# Пул соединений с БД
+DB_POOL_CONFIG = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),  # Максимум открытых соединений (на оба пула вместе)
+    "async_pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", 3)),  # Из них - асинхронному пулу (aiomysql)
+    "max_lifetime": 1800,  # Пересоздавать соединение через N секунд
+    "ping_interval": 30,  # Проверять соединение, если оно простаивало дольше N секунд
+    "checkout_timeout": 5,  # Сколько ждать свободное соединение (сек)
+}
+
 # Префикс таблиц (реальный, а не из wp-config.php)
 TABLE_PREFIX = os.getenv("TABLE_PREFIX", "wp_")
 
@@ -60,7 +69,27 @@ WORDPRESS_CONFIG = {
     "verify_ssl": True,  # Проверка SSL сертификата
     "timeout": 10,  # Таймаут запросов в секундах
     "retry_attempts": 3,  # Количество попыток при ошибке
+    "endpoint_timeouts": {  # Таймауты отдельных endpoint'ов (секунды)
+        "get-appointments": 5,
+        "all-appointments": 20,
+    },
+    "pool_maxsize": 10,  # Максимум keep-alive соединений с сайтом
     "cache_ttl": 30,  # Время жизни кэша в секундах
+    "cache_ttls": {"doctors": 300},  # Время жизни кэша отдельных endpoint'ов
+    "cache_max_entries": 256,  # Максимум ответов в кэше (LRU)
+    "cache_stale_ttl": 600,  # Сколько секунд отдавать устаревший ответ, если сайт недоступен
+    "breaker_threshold": 5,  # Ошибок подряд до отключения endpoint'а (circuit breaker)
+    "breaker_reset_timeout": 30,  # Через сколько секунд пробовать снова
+}
+
+# Приемник событий от WordPress плагина (сброс кэша при изменении записей на сайте)
+WEBHOOK_CONFIG = {
+    "enabled": os.getenv("WEBHOOK_ENABLED", "false").lower() == "true",
+    "host": os.getenv("WEBHOOK_HOST", "127.0.0.1"),
+    "port": int(os.getenv("WEBHOOK_PORT", 8081)),
+    "path": "/clinic-webhook",
+    "secret": os.getenv("WEBHOOK_SECRET", ""),  # Тот же секрет, что в настройке плагина
+    "max_age": 300,  # Запросы старше N секунд (по timestamp в теле) отклоняются как повторные
 }
 
 
@@ -116,12 +145,25 @@ BOT_SETTINGS = {
     "conversation_timeout": 300,  # 5 минут таймаут диалога
     # Количество дней для записи вперед
     "days_forward": 7,
+    # Время жизни кэша списка врачей (секунды)
+    "doctors_cache_ttl": 300,
     # Время обновления (секунды)
     "polling_interval": 0.5,
     # Ограничения
     "max_doctors_per_page": 10,
     "max_appointments_per_user": 5,
     "same_day_booking_deadline": 11, # Час дня (0-23), после которого нельзя записаться на сегодня
+    # Сколько вариантов показывать в режиме "ближайшее свободное время"
+    "nearest_slots_count": 6,
+    # Прогрев занятости всех врачей: период (секунды) и число одновременных запросов к сайту
+    "warmup_interval": 600,
+    "warmup_concurrency": 4,
+    # Сколько секунд загруженная занятость дня считается свежей (select_date не запрашивает сайт).
+    # Больше warmup_interval, чтобы прогретые дни не устаревали до следующего прогрева.
+    # Действует только при запущенном приемнике webhook (WEBHOOK_CONFIG), иначе - cache_ttl
+    "availability_fresh_ttl": 900,
+    # Сколько секунд select_date ждет фоновую загрузку недели врача, прежде чем запросить день
+    "prefetch_wait_timeout": 3,
 }
 
 # ============================================
@@ -179,6 +221,8 @@ PATHS = {"log_dir": "logs", "data_dir": "data", "backup_dir": "backups"}
 __all__ = [
     "BOT_TOKEN",
     "DB_CONFIG",
+    "DB_POOL_CONFIG",
+    "WEBHOOK_CONFIG",
     "TABLE_PREFIX",
     "CLINIC_INFO",
     "WORKING_HOURS",
@@ -0,0 +1,188 @@
+import threading
+import time
+import logging
+
+import mysql.connector
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """
+    Обертка над соединением из пула.
+    Ведет себя как обычное соединение mysql.connector, но close()
+    возвращает соединение обратно в пул вместо разрыва.
+    """
+
+    def __init__(self, pool, connection, created_at):
+        self._pool = pool
+        self._connection = connection
+        self.created_at = created_at
+        self.last_used = time.monotonic()
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def is_connected(self):
+        # После возврата в пул обертка считается закрытой
+        if self._returned:
+            return False
+        return self._connection.is_connected()
+
+    def close(self):
+        """Возврат соединения в пул"""
+        if self._returned:
+            return
+        self._returned = True
+        self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений MySQL.
+
+    - Не более pool_size открытых соединений одновременно
+    - Ожидание свободного соединения не дольше checkout_timeout секунд
+    - Проверка (ping) соединений, простаивавших дольше ping_interval
+    - Пересоздание соединений старше max_lifetime секунд
+    """
+
+    def __init__(self, config, pool_size=5, max_lifetime=1800, ping_interval=30, checkout_timeout=5):
+        self.config = config
+        self.pool_size = pool_size
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = []
+        self._lock = threading.Condition()
+        self._open = 0  # Всего открытых соединений (в пуле + выданных)
+
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+        self._timeouts = 0
+
+    def _connect(self):
+        """Открытие нового физического соединения"""
+        connection = mysql.connector.connect(**self.config)
+        with self._lock:
+            self._created += 1
+        return connection
+
+    def _discard(self, connection):
+        """Закрытие физического соединения без возврата в пул"""
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def _is_usable(self, pooled):
+        """Проверка соединения перед выдачей"""
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_lifetime:
+            with self._lock:
+                self._recycled += 1
+            return False
+        if now - pooled.last_used > self.ping_interval:
+            try:
+                pooled._connection.ping(reconnect=False)
+            except Error:
+                return False
+        return True
+
+    def get_connection(self):
+        """Получение соединения из пула (или None, если не удалось)"""
+        deadline = time.monotonic() + self.checkout_timeout
+
+        with self._lock:
+            while not self._idle and self._open >= self.pool_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    logger.error(f"Пул соединений исчерпан: ожидание дольше {self.checkout_timeout} сек")
+                    return None
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                self._open += 1
+            self._in_use += 1
+
+        # Проверка и создание соединений выполняется вне блокировки
+        if pooled is not None and not self._is_usable(pooled):
+            self._discard(pooled._connection)
+            pooled = None
+
+        if pooled is None:
+            try:
+                connection = self._connect()
+            except Error as e:
+                with self._lock:
+                    self._open -= 1
+                    self._in_use -= 1
+                    self._lock.notify()
+                logger.error(f"Ошибка подключения: {e}")
+                return None
+            return PooledConnection(self, connection, time.monotonic())
+
+        return PooledConnection(self, pooled._connection, pooled.created_at)
+
+    def release(self, pooled):
+        """Возврат соединения в пул"""
+        connection = pooled._connection
+        healthy = True
+        try:
+            if not connection.is_connected():
+                healthy = False
+            elif connection.in_transaction:
+                connection.rollback()
+        except Error:
+            healthy = False
+
+        if healthy and time.monotonic() - pooled.created_at > self.max_lifetime:
+            healthy = False
+            with self._lock:
+                self._recycled += 1
+
+        if not healthy:
+            self._discard(connection)
+
+        with self._lock:
+            self._in_use -= 1
+            if healthy:
+                idle = PooledConnection(self, connection, pooled.created_at)
+                idle._returned = True
+                self._idle.append(idle)
+            else:
+                self._open -= 1
+            self._lock.notify()
+
+    def close_all(self):
+        """Закрытие всех свободных соединений"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for pooled in idle:
+            self._discard(pooled._connection)
+
+    def get_metrics(self):
+        """Метрики пула"""
+        with self._lock:
+            return {
+                'size': self.pool_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'created': self._created,
+                'recycled': self._recycled,
+                'timeouts': self._timeouts,
+            }
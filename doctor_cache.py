@@ -0,0 +1,70 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DoctorRosterCache:
+    """
+    Кэш списка активных врачей в памяти процесса.
+
+    Хранит список в исходном порядке (ORDER BY last_name) и индекс id -> врач.
+    Сбрасывается по истечении ttl секунд или явно через invalidate()
+    (при изменении статуса врача или синхронизации списка).
+    Загрузка, начатая до invalidate(), список не сохраняет: перед запросом
+    берется generation(), и set(doctors, generation) с устаревшим поколением игнорируется.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._doctors = None
+        self._by_id = {}
+        self._loaded_at = 0.0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self):
+        return self._doctors is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get_all(self):
+        """Список врачей из кэша или None, если кэш пуст/устарел"""
+        with self._lock:
+            if self._is_fresh():
+                self.hits += 1
+                # Копия: вызывающий код не должен менять закэшированный список
+                return list(self._doctors)
+            self.misses += 1
+            return None
+
+    def get(self, doctor_id):
+        """Врач по ID из кэша или None"""
+        with self._lock:
+            if not self._is_fresh():
+                return None
+            return self._by_id.get(doctor_id)
+
+    def generation(self):
+        """Поколение кэша (увеличивается при каждом invalidate)"""
+        with self._lock:
+            return self._generation
+
+    def set(self, doctors, generation=None):
+        """Сохранение свежего списка врачей (False - кэш сбросили во время загрузки)"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._doctors = list(doctors)
+            self._by_id = {doc['id']: doc for doc in doctors}
+            self._loaded_at = time.monotonic()
+            return True
+
+    def invalidate(self):
+        """Сброс кэша"""
+        with self._lock:
+            self._generation += 1
+            self._doctors = None
+            self._by_id = {}
+        logger.info("Кэш списка врачей сброшен")
@@ -1,5 +1,10 @@
 import json
 import os
+import logging
+from datetime import datetime
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
 
 SENT_REMINDERS_FILE = 'data/sent_reminders.json'
 
@@ -32,12 +37,21 @@ async def check_reminders(context):
         return
 
     try:
+        today = datetime.now().date()
+
+        # Журнал изменений: если с прошлой проверки за сегодня ничего не менялось,
+        # новых напоминаний быть не может - полный список не запрашиваем
+        changes = await wp_api.poll_changes()
+        if changes == [] and context.job.data.get('checked_date') == today:
+            logger.debug("Изменений записей нет, проверка напоминаний пропущена")
+            return
+
         # Получаем записи (статус confirmed)
-        appointments = wp_api.get_filtered_appointments(limit=100, status_filter='confirmed')
+        appointments = await wp_api.get_filtered_appointments(limit=100, status_filter='confirmed')
+        context.job.data['checked_date'] = today
         if not appointments:
             return
 
-        today = datetime.now().date()
         sent_reminders = load_sent_reminders()
         
         for apt in appointments:
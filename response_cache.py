@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Признак отсутствия значения в кэше (None/[] - допустимые ответы API)
+MISS = object()
+
+
+class ResponseCache:
+    """
+    LRU кэш ответов API с TTL.
+
+    Ключ - (endpoint, параметры запроса). Время жизни задается общим ttl
+    или отдельно для endpoint'а через endpoint_ttls. При превышении
+    max_entries вытесняются самые давно использованные записи.
+
+    Отдельно хранятся валидаторы (ETag + последний ответ) - они живут
+    дольше TTL и позволяют перепроверить устаревшую запись условным
+    запросом (If-None-Match) и при 304 взять ответ отсюда.
+
+    Истекшая запись хранится еще stale_ttl секунд: get() ее не отдает,
+    но get_stale() вернет последний ответ, если сайт недоступен.
+    """
+
+    def __init__(self, ttl=30, max_entries=256, endpoint_ttls=None, stale_ttl=600):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.endpoint_ttls = endpoint_ttls or {}
+        self._entries = OrderedDict()
+        self._validators = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_served = 0
+
+    @staticmethod
+    def make_key(endpoint, params=None):
+        params = params or {}
+        # api_key не влияет на ответ
+        return endpoint, tuple(sorted((k, str(v)) for k, v in params.items() if k != 'api_key'))
+
+    def get(self, endpoint, params=None):
+        """Значение из кэша или MISS"""
+        key = self.make_key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                now = time.monotonic()
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if now >= expires_at + self.stale_ttl:
+                    del self._entries[key]
+            self.misses += 1
+            return MISS
+
+    def get_stale(self, endpoint, params=None):
+        """Последний ответ, в т.ч. истекший (не старше stale_ttl), или MISS"""
+        key = self.make_key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[1] + self.stale_ttl:
+                return MISS
+            self.stale_served += 1
+            return entry[0]
+
+    def is_stale(self, endpoint, params=None):
+        """Есть только истекшая запись (get_stale() отдаст устаревший ответ)"""
+        key = self.make_key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            now = time.monotonic()
+            return entry[1] <= now < entry[1] + self.stale_ttl
+
+    def set(self, endpoint, params, value):
+        """Сохранение ответа"""
+        ttl = self.endpoint_ttls.get(endpoint, self.ttl)
+        if ttl <= 0:
+            return
+        key = self.make_key(endpoint, params)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_validator(self, endpoint, params=None):
+        """(etag, ответ) последнего полного ответа или None"""
+        key = self.make_key(endpoint, params)
+        with self._lock:
+            validator = self._validators.get(key)
+            if validator is not None:
+                self._validators.move_to_end(key)
+            return validator
+
+    def set_validator(self, endpoint, params, etag, value):
+        """Сохранение ETag вместе с ответом"""
+        key = self.make_key(endpoint, params)
+        with self._lock:
+            self._validators[key] = (etag, value)
+            self._validators.move_to_end(key)
+            while len(self._validators) > self.max_entries:
+                self._validators.popitem(last=False)
+
+    def mark_revalidated(self):
+        """Учет ответа 304 (тело взято из валидатора)"""
+        with self._lock:
+            self.revalidated += 1
+
+    def invalidate(self, endpoint, params=None):
+        """
+        Сброс записей endpoint'а.
+        Если переданы params - только записи, содержащие эти параметры.
+        """
+        match = set(self.make_key(endpoint, params)[1])
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == endpoint and match.issubset(key[1]):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._validators.clear()
+
+    def get_stats(self):
+        """Счетчики кэша"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'stale': self.stale_served,
+            }
@@ -0,0 +1,127 @@
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+
+# Значения по умолчанию для неполного расписания (как в select_date)
+DEFAULT_SCHEDULE = {
+    'start': '09:00',
+    'end': '18:00',
+    'lunch_start': '13:00',
+    'lunch_end': '14:00',
+}
+
+
+def to_minutes(time_str):
+    """"HH:MM" -> минуты от полуночи"""
+    hours, minutes = time_str.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes):
+    """Минуты от полуночи -> "HH:MM\""""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class SlotTemplate:
+    """
+    Неизменяемая сетка слотов рабочего дня.
+
+    offsets - начала слотов в минутах от полуночи (по возрастанию),
+    labels - те же слоты в виде "HH:MM", index - "HH:MM" -> позиция в сетке.
+    """
+
+    __slots__ = ('offsets', 'labels', 'index', 'duration')
+
+    def __init__(self, offsets, duration):
+        object.__setattr__(self, 'offsets', tuple(offsets))
+        object.__setattr__(self, 'labels', tuple(format_minutes(m) for m in self.offsets))
+        object.__setattr__(self, 'index', MappingProxyType({label: i for i, label in enumerate(self.labels)}))
+        object.__setattr__(self, 'duration', duration)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SlotTemplate неизменяем")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def first_after(self, minutes):
+        """Позиция первого слота, начинающегося строго позже minutes"""
+        return bisect_right(self.offsets, minutes)
+
+    def day_slots(self, date_str=None, now=None):
+        """
+        Слоты дня "HH:MM". Для сегодняшней даты прошедшие (и текущий) слоты отбрасываются.
+        """
+        start = 0
+        if date_str:
+            now = now or datetime.now()
+            if date_str == now.strftime('%Y-%m-%d'):
+                start = self.first_after(now.hour * 60 + now.minute)
+        return list(self.labels[start:])
+
+    def free_slots(self, occupied, date_str=None, now=None):
+        """Свободные слоты дня; occupied - любые "HH:MM" (или "HH:MM:SS")"""
+        busy = {t[:5] for t in occupied}
+        return [label for label in self.day_slots(date_str, now) if label not in busy]
+
+
+@lru_cache(maxsize=64)
+def compile_template(start_time, end_time, lunch_start, lunch_end, slot_duration):
+    """
+    Сетка слотов для расписания (результат кэшируется по параметрам).
+    Слот начинается с шагом slot_duration от start_time, пока начало < end_time;
+    слоты, начинающиеся в обед [lunch_start, lunch_end), пропускаются.
+    """
+    start = to_minutes(start_time)
+    end = to_minutes(end_time)
+    l_start = to_minutes(lunch_start)
+    l_end = to_minutes(lunch_end)
+
+    offsets = [m for m in range(start, end, slot_duration) if not l_start <= m < l_end]
+    return SlotTemplate(offsets, slot_duration)
+
+
+class CompiledSchedules:
+    """
+    Сетки слотов всех врачей, собранные из WORKING_HOURS / DOCTOR_SCHEDULES.
+
+    Собирается один раз при запуске (и в reload() при изменении настроек).
+    Врачи с одинаковым расписанием используют один объект SlotTemplate.
+    """
+
+    def __init__(self, working_hours, doctor_schedules, slot_duration):
+        self._lock = threading.Lock()
+        self.reload(working_hours, doctor_schedules, slot_duration)
+
+    @staticmethod
+    def _compile(schedule, slot_duration):
+        schedule = {**DEFAULT_SCHEDULE, **(schedule or {})}
+        return compile_template(
+            schedule['start'], schedule['end'], schedule['lunch_start'], schedule['lunch_end'], slot_duration
+        )
+
+    def reload(self, working_hours, doctor_schedules, slot_duration):
+        """Пересборка сеток (например, после изменения config)"""
+        default = self._compile(working_hours, slot_duration)
+        by_doctor = {
+            doctor_id: self._compile(schedule, slot_duration)
+            for doctor_id, schedule in (doctor_schedules or {}).items()
+        }
+        with self._lock:
+            self.slot_duration = slot_duration
+            self._default = default
+            self._by_doctor = MappingProxyType(by_doctor)
+
+    def template(self, doctor_id):
+        """Сетка слотов врача (индивидуальная или стандартная)"""
+        return self._by_doctor.get(doctor_id, self._default)
+
+    def day_slots(self, doctor_id, date_str=None, now=None):
+        """Все слоты врача на дату (без учета занятости)"""
+        return self.template(doctor_id).day_slots(date_str, now)
+
+    def free_slots(self, doctor_id, occupied, date_str=None, now=None):
+        """Свободные слоты врача на дату"""
+        return self.template(doctor_id).free_slots(occupied, date_str, now)
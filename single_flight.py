@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """Выполняющийся вызов и его результат"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых параллельных вызовов (для потоков).
+
+    Пока вызов с ключом key выполняется, остальные вызовы с тем же
+    ключом не запускают свой, а ждут и получают его результат (или ошибку).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def __contains__(self, key):
+        """Выполняется ли сейчас вызов с этим ключом"""
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """
+    Объединение одинаковых параллельных вызовов (для корутин).
+
+    Общий вызов защищен от отмены: если отменят одного из ожидающих,
+    остальные все равно получат результат.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.shared = 0
+
+    def __contains__(self, key):
+        """Выполняется ли сейчас вызов с этим ключом"""
+        return key in self._calls
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(func())
+        self._calls[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+        return await asyncio.shield(future)
+
+    def _done(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Ошибка считается обработанной, даже если все ожидающие были отменены
+        if not future.cancelled():
+            future.exception()
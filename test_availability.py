@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from availability import AvailabilityEngine
+from schedule_compiler import CompiledSchedules
+from config import WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION
+
+schedules = CompiledSchedules(WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION)
+tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+after_tomorrow = (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+
+print("=" * 60)
+print("ТЕСТ 1: AvailabilityEngine - запись, отмена, количество слотов")
+print("=" * 60)
+
+engine = AvailabilityEngine(schedules)
+slots = schedules.day_slots(2, tomorrow)
+engine.load_day(2, tomorrow, ['09:45', '12:00', '08:00'])  # 08:00 вне сетки
+
+print(f'\nСетка врача 2: {slots}')
+print(f'Свободно: {engine.free_slots(2, tomorrow)}')
+print(f'(свободно, занято): {engine.counts(2, tomorrow)}')
+
+try:
+    assert engine.counts(2, tomorrow) == (len(slots) - 2, 2), 'Неверное количество после загрузки'
+    assert engine.book(2, tomorrow, '10:30'), 'Свободный слот должен записываться'
+    assert not engine.book(2, tomorrow, '10:30'), 'Повторная запись на занятый слот должна вернуть False'
+    assert not engine.is_free(2, tomorrow, '10:30'), '10:30 должно быть занято'
+    assert engine.cancel(2, tomorrow, '09:45'), 'Занятый слот должен освобождаться'
+    assert not engine.cancel(2, tomorrow, '09:45'), 'Повторная отмена должна вернуть False'
+    assert engine.counts(2, tomorrow) == (len(slots) - 2, 2), 'Неверное количество после записи/отмены'
+    assert engine.first_free(2, tomorrow, 2) == ['09:45', '11:15'], 'Неверные первые свободные слоты'
+    assert not engine.book(2, after_tomorrow, '09:45'), 'Незагруженный день не должен меняться'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: AvailabilityEngine - earliest_free и сброс")
+print("=" * 60)
+
+engine = AvailabilityEngine(schedules)
+engine.load_day(6, tomorrow, schedules.day_slots(6, tomorrow))  # весь день занят
+engine.load_day(6, after_tomorrow, ['09:00'])
+
+print(f'\nПервый свободный слот: {engine.earliest_free(6, [tomorrow, after_tomorrow])}')
+
+try:
+    assert engine.earliest_free(6, [tomorrow, after_tomorrow]) == (after_tomorrow, '09:45'), \
+        'Первый свободный слот должен быть послезавтра в 09:45'
+    since = engine.stamp()
+    engine.invalidate(6, after_tomorrow)
+    assert not engine.has_day(6, after_tomorrow), 'Сброшенный день должен удаляться'
+    assert engine.load_day(6, after_tomorrow, [], since) is None, 'Ответ, запрошенный до сброса, должен отбрасываться'
+    assert engine.load_day(6, after_tomorrow, [], engine.stamp()) == 0, 'Новый ответ должен загружаться'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from availability_matrix import AvailabilityMatrix, NUMPY_AVAILABLE
+from schedule_compiler import CompiledSchedules
+from config import WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION
+
+schedules = CompiledSchedules(WORKING_HOURS, DOCTOR_SCHEDULES, APPOINTMENT_DURATION)
+tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+after_tomorrow = (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+
+print("=" * 60)
+print("ТЕСТ 1: AvailabilityMatrix - запись, перенос и отмена из журнала изменений")
+print("=" * 60)
+
+if not NUMPY_AVAILABLE:
+    print('\n⚠️ numpy не установлен, тест пропущен')
+else:
+    matrix = AvailabilityMatrix(schedules, [2, 6])
+    matrix.load_range(6, {tomorrow: ['09:00'], after_tomorrow: []})
+
+    matrix.apply_changes([
+        # Новая запись
+        {'doctor_id': 6, 'date': tomorrow, 'time': '10:30', 'type': 'created', 'status': 1},
+        # Перенос 09:00 -> 11:15: старый слот (moved), затем новый (updated)
+        {'doctor_id': 6, 'date': tomorrow, 'time': '09:00', 'type': 'moved', 'status': 1},
+        {'doctor_id': 6, 'date': tomorrow, 'time': '11:15', 'type': 'updated', 'status': 1},
+        # Отмена записи
+        {'doctor_id': 6, 'date': tomorrow, 'time': '10:30', 'type': 'cancelled', 'status': 0},
+        # День без времени - помечается незагруженным
+        {'doctor_id': 6, 'date': after_tomorrow, 'time': None, 'type': 'updated', 'status': 1},
+    ])
+    free = matrix.first_free_on(tomorrow)
+
+    print(f'\nПервый свободный слот завтра: {free}')
+    print(f'Свободных слотов завтра: {matrix.free_counts_on(tomorrow)}')
+
+    try:
+        assert free == {6: '09:00'}, 'После переноса 09:00 должно освободиться'
+        assert matrix.free_counts_on(tomorrow) == {6: len(schedules.day_slots(6, tomorrow)) - 1}, \
+            'Занят должен быть только 11:15'
+        assert matrix.free_doctors(tomorrow, '11:00', '12:00') == [], '11:15 должно быть занято'
+        assert not matrix.is_loaded(6, after_tomorrow), 'День без времени должен стать незагруженным'
+        since = matrix.stamp()
+        matrix.set_slot(6, tomorrow, '12:00', True)
+        assert not matrix.load_day(6, tomorrow, [], since), 'Ответ, запрошенный до изменения, должен отбрасываться'
+        print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+    except AssertionError as e:
+        print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+    print("\n" + "=" * 60)
+    print("ТЕСТ 2: AvailabilityMatrix - свободные врачи и сдвиг окна")
+    print("=" * 60)
+
+    matrix = AvailabilityMatrix(schedules, [2, 6])
+    matrix.load_day(2, tomorrow, ['09:45', '10:30'])
+    matrix.load_day(6, tomorrow, [])
+    free = matrix.free_doctors(tomorrow, '09:00', '11:00')
+    # Как будто матрицу собрали вчера: загруженный день "завтра" того окна - сегодня
+    today = datetime.now().strftime('%Y-%m-%d')
+    matrix.start_date -= timedelta(days=1)
+
+    print(f'\nСвободны 09:00-11:00 завтра: {free}')
+
+    try:
+        assert free == [6], 'У врача 2 утро занято'
+        assert matrix.is_loaded(2, today) and not matrix.is_loaded(2, tomorrow), \
+            'Загруженные дни должны сдвинуться вместе с окном'
+        assert matrix.start_date == datetime.now().date(), 'Окно должно начинаться с сегодня'
+        print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+    except AssertionError as e:
+        print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import httpx
+
+from wordpress_api import WordPressAPI
+from async_wordpress_api import AsyncWordPressAPI
+
+SITE_URL = 'http://clinic.test'
+APPOINTMENTS = [{'id': 7, 'status': 'visited'}, {'id': 8, 'status': 'confirmed'}]
+
+
+def make_async_api(handler):
+    """Асинхронный клиент, запросы которого обрабатывает handler (без сети)"""
+    api = AsyncWordPressAPI(WordPressAPI(SITE_URL, backoff_factor=0))
+    asyncio.run(api.client.aclose())
+    api.client = httpx.AsyncClient(transport=httpx.MockTransport(handler),
+                                   base_url=f"{SITE_URL}/wp-json/clinic/v1/")
+    return api
+
+
+def plugin(with_batch):
+    """handler, изображающий плагин (с /batch или без); запоминает вызванные endpoint'ы"""
+    calls = []
+
+    def handler(request):
+        endpoint = request.url.path.rsplit('/', 1)[-1]
+        calls.append(endpoint)
+        if endpoint == 'batch':
+            if not with_batch:
+                return httpx.Response(404, json={'code': 'rest_no_route'})
+            operations = json.loads(request.content)['operations']
+            assert [op['op'] for op in operations] == ['update-status', 'all-appointments']
+            return httpx.Response(200, json=[
+                {'status': 200, 'data': {'success': True}, 'headers': {}},
+                {'status': 200, 'data': APPOINTMENTS, 'headers': {'X-Next-Cursor': None}},
+            ])
+        if endpoint == 'update-status':
+            return httpx.Response(200, json={'success': True})
+        if endpoint == 'all-appointments':
+            return httpx.Response(200, json=APPOINTMENTS)
+        return httpx.Response(404)
+
+    return handler, calls
+
+
+print("=" * 60)
+print("ТЕСТ 1: смена статуса и список записей одним запросом /batch")
+print("=" * 60)
+
+handler, calls = plugin(with_batch=True)
+api = make_async_api(handler)
+result = asyncio.run(api.update_status_and_list(7, 2, status_filter='visited'))
+cached = api.sync_api.cache.get('all-appointments', {'limit': 50, 'status': 'visited'})
+
+print(f'\nЗапросы: {calls}')
+print(f'Результат: {result}')
+
+try:
+    assert calls == ['batch'], 'Должен быть ровно один запрос'
+    assert result == (True, [{'id': 7, 'status': 'visited'}]), 'Неверный результат пакета'
+    assert cached == (APPOINTMENTS, None), 'Свежая страница списка должна попасть в кэш'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: старый плагин без /batch (404) - отдельные запросы")
+print("=" * 60)
+
+handler, calls = plugin(with_batch=False)
+api = make_async_api(handler)
+result = asyncio.run(api.update_status_and_list(7, 2, status_filter='visited'))
+
+print(f'\nЗапросы: {calls}')
+print(f'Результат: {result}')
+
+try:
+    assert calls == ['batch', 'update-status', 'all-appointments'], 'После 404 нужны два отдельных запроса'
+    assert result == (True, [{'id': 7, 'status': 'visited'}]), 'Результат не должен зависеть от /batch'
+    assert api.sync_api.get_breaker('batch')._failures == 0, '404 от /batch не должен считаться сбоем сайта'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+
+import requests
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from wordpress_api import WordPressAPI
+
+print("=" * 60)
+print("ТЕСТ 1: CircuitBreaker - closed -> open -> half_open -> closed")
+print("=" * 60)
+
+breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+states = [breaker.state]
+breaker.record_failure()
+breaker.record_failure()
+states.append(breaker.state)
+rejected = not breaker.allow()
+time.sleep(0.25)
+states.append(breaker.state)
+trial = breaker.allow()
+second_trial = breaker.allow()
+breaker.record_success()
+states.append(breaker.state)
+
+print(f'\nСостояния: {states}')
+print(f'Статистика: {breaker.get_stats()}')
+
+try:
+    assert states == [CLOSED, OPEN, HALF_OPEN, CLOSED], f'Неверная смена состояний: {states}'
+    assert rejected, 'Открытый breaker должен отказывать'
+    assert trial and not second_trial, 'В half_open пропускается только один пробный запрос'
+    time.sleep(0.25)
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.25)
+    assert breaker.allow(), 'После reset_timeout должен пройти пробный запрос'
+    breaker.record_failure()
+    assert breaker.state == OPEN, 'Ошибка пробного запроса должна снова открыть breaker'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: WordPressAPI - устаревший ответ сразу, обновление в фоне")
+print("=" * 60)
+
+api = WordPressAPI('http://clinic.test', cache_ttl=0.05, retry_attempts=1,
+                   breaker_threshold=1, breaker_reset_timeout=0.1)
+site = {'times': ['09:45:00'], 'down': False}
+refreshed = threading.Event()
+
+
+def request(method, url, **kwargs):
+    if site['down']:
+        raise requests.exceptions.ConnectionError('refused')
+    time.sleep(0.2)
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps([{'time': t} for t in site['times']]).encode()
+    refreshed.set()
+    return response
+
+
+api.session.request = request
+first = api.get_occupied_slots(2, '2030-01-01')
+site['down'] = True
+time.sleep(0.06)
+failed = api.get_occupied_slots(2, '2030-01-01')  # устаревший ответ, breaker открывается
+site.update(down=False, times=['09:45:00', '10:30:00'])
+refreshed.clear()
+time.sleep(0.1)
+
+started = time.monotonic()
+degraded = api.get_occupied_slots(2, '2030-01-01')
+elapsed = time.monotonic() - started
+stale = api.is_stale('get-appointments', {'doctor_id': 2, 'date': '2030-01-01'})
+refreshed.wait(1)
+time.sleep(0.02)
+fresh = api.get_occupied_slots(2, '2030-01-01')
+
+print(f'\nОтветы: {first}, {failed}, {degraded} (за {elapsed:.3f} с), после обновления: {fresh}')
+print(f'Breaker: {api.get_breaker_stats()}')
+
+try:
+    assert first == failed == degraded == ['09:45'], 'При недоступности сайта отдается последний ответ'
+    assert elapsed < 0.1, 'Когда breaker не закрыт, устаревший ответ отдается без ожидания запроса'
+    assert stale, 'Ответ должен помечаться устаревшим'
+    assert fresh == ['09:45', '10:30'], 'Фоновое обновление должно заменить устаревший ответ'
+    assert api.get_breaker('get-appointments').state == CLOSED, 'Удачное фоновое обновление закрывает breaker'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
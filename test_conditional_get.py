@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import httpx
+
+from wordpress_api import WordPressAPI
+from async_wordpress_api import AsyncWordPressAPI
+
+SITE_URL = 'http://clinic.test'
+
+print("=" * 60)
+print("ТЕСТ 1: If-None-Match и ответ 304 (тело берется из кэша)")
+print("=" * 60)
+
+sent = []
+
+
+def handler(request):
+    sent.append(request.headers.get('If-None-Match'))
+    if request.headers.get('If-None-Match') == '"v1"':
+        return httpx.Response(304)
+    return httpx.Response(200, json=[{'time': '09:45:00'}], headers={'ETag': '"v1"'})
+
+
+sync_api = WordPressAPI(SITE_URL, cache_ttl=0.1)
+api = AsyncWordPressAPI(sync_api)
+asyncio.run(api.client.aclose())
+api.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url=f"{SITE_URL}/wp-json/clinic/v1/")
+
+
+async def fetch_day():
+    first = await api.get_occupied_slots(2, '2030-01-01')
+    cached = await api.get_occupied_slots(2, '2030-01-01')
+    time.sleep(0.15)  # запись кэша истекла - нужен условный запрос
+    revalidated = await api.get_occupied_slots(2, '2030-01-01')
+    return first, cached, revalidated
+
+
+first, cached, revalidated = asyncio.run(fetch_day())
+stats = sync_api.cache.get_stats()
+
+print(f'\nЗаголовки If-None-Match: {sent}')
+print(f'Ответы: {first}, {cached}, {revalidated}')
+print(f'Статистика кэша: {stats}')
+
+try:
+    assert sent == [None, '"v1"'], 'Второй запрос (после TTL) должен быть условным, свежий кэш - без запроса'
+    assert first == cached == revalidated == ['09:45'], 'На 304 возвращается сохраненный ответ'
+    assert stats['revalidated'] == 1, '304 должен учитываться в статистике'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: новый ETag заменяет сохраненный ответ")
+print("=" * 60)
+
+
+def changed_handler(request):
+    sent.append(request.headers.get('If-None-Match'))
+    return httpx.Response(200, json=[{'time': '09:45:00'}, {'time': '10:30:00'}], headers={'ETag': '"v2"'})
+
+
+sent.clear()
+api.client = httpx.AsyncClient(transport=httpx.MockTransport(changed_handler),
+                               base_url=f"{SITE_URL}/wp-json/clinic/v1/")
+time.sleep(0.15)
+changed = asyncio.run(api.get_occupied_slots(2, '2030-01-01'))
+validator = sync_api.cache.get_validator('get-appointments', {'doctor_id': 2, 'date': '2030-01-01'})
+
+print(f'\nОтвет: {changed}, валидатор: {validator}')
+
+try:
+    assert sent == ['"v1"'], 'Запрос должен содержать прошлый ETag'
+    assert changed == ['09:45', '10:30'], 'Измененный ответ должен разбираться заново'
+    assert validator == ('"v2"', ['09:45', '10:30']), 'Валидатор обновляется новым ETag'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
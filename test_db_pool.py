@@ -0,0 +1,70 @@
+from db_pool import ConnectionPool
+
+print("=" * 60)
+print("ТЕСТ 1: ConnectionPool - лимит соединений и ожидание")
+print("=" * 60)
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePool(ConnectionPool):
+    def _connect(self):
+        with self._lock:
+            self._created += 1
+        return FakeConnection()
+
+
+pool = FakePool({}, pool_size=2, checkout_timeout=0.1)
+first = pool.get_connection()
+second = pool.get_connection()
+exhausted = pool.get_connection()
+first.close()
+third = pool.get_connection()
+metrics = pool.get_metrics()
+
+print(f'\nМетрики: {metrics}')
+
+try:
+    assert exhausted is None, 'Сверх pool_size соединение не выдается'
+    assert third is not None, 'Возвращенное соединение должно выдаваться повторно'
+    assert metrics['created'] == 2 and metrics['open'] == 2, 'Новых соединений сверх pool_size быть не должно'
+    assert metrics['timeouts'] == 1, 'Ожидание должно учитываться как таймаут'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: ConnectionPool - разорванное соединение не возвращается в пул")
+print("=" * 60)
+
+
+class BrokenConnection(FakeConnection):
+    def is_connected(self):
+        return False
+
+
+pool = FakePool({}, pool_size=1, checkout_timeout=0.1)
+connection = pool.get_connection()
+connection._connection = BrokenConnection()
+connection.close()
+metrics = pool.get_metrics()
+
+print(f'\nМетрики: {metrics}')
+
+try:
+    assert metrics['open'] == 0 and metrics['idle'] == 0, 'Разорванное соединение должно закрываться'
+    assert pool.get_connection() is not None, 'Вместо него должно открываться новое'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
@@ -0,0 +1,64 @@
+import time
+import types
+
+from response_cache import ResponseCache, MISS
+from wordpress_api import WordPressAPI
+
+print("=" * 60)
+print("ТЕСТ 1: ResponseCache - TTL, устаревшие ответы и сброс")
+print("=" * 60)
+
+cache = ResponseCache(ttl=0.1, stale_ttl=0.2)
+params = {'doctor_id': 2, 'date': '2030-01-01', 'api_key': 'secret'}
+cache.set('get-appointments', params, ['09:45'])
+fresh = cache.get('get-appointments', {'doctor_id': '2', 'date': '2030-01-01'})
+time.sleep(0.15)
+expired = cache.get('get-appointments', params)
+stale = cache.get_stale('get-appointments', params)
+time.sleep(0.2)
+gone = cache.get_stale('get-appointments', params)
+
+print(f'\nСвежий: {fresh}, после TTL: {expired is MISS}, устаревший: {stale}, после stale_ttl: {gone is MISS}')
+print(f'Статистика: {cache.get_stats()}')
+
+try:
+    assert fresh == ['09:45'], 'Ключ не должен зависеть от api_key и типа значений'
+    assert expired is MISS, 'После TTL get() не должен отдавать запись'
+    assert stale == ['09:45'], 'До истечения stale_ttl get_stale() отдает последний ответ'
+    assert gone is MISS, 'После stale_ttl запись удаляется'
+    cache = ResponseCache(ttl=60)
+    cache.set('get-appointments', {'doctor_id': 2, 'date': '2030-01-01'}, [])
+    cache.set('get-appointments', {'doctor_id': 6, 'date': '2030-01-01'}, [])
+    cache.invalidate('get-appointments', {'doctor_id': 2})
+    assert cache.get('get-appointments', {'doctor_id': 2, 'date': '2030-01-01'}) is MISS, 'Записи врача 2 должны сброситься'
+    assert cache.get('get-appointments', {'doctor_id': 6, 'date': '2030-01-01'}) == [], 'Записи врача 6 должны остаться'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: WordPressAPI - отмена записи сбрасывает только ее день")
+print("=" * 60)
+
+api = WordPressAPI('http://clinic.test')
+api.cache.set('get-appointments', {'doctor_id': 2, 'date': '2030-01-01'}, ['09:45'])
+api.cache.set('get-appointments', {'doctor_id': 2, 'date': '2030-01-02'}, [])
+api.cache.set('get-appointments', {'doctor_id': 6, 'date': '2030-01-01'}, [])
+invalidated = []
+api.invalidation_listeners.append(lambda doctor_id, date: invalidated.append((doctor_id, date)))
+api._request = lambda *args, **kwargs: types.SimpleNamespace(
+    status_code=200, json=lambda: {'success': True, 'doctor_id': 2, 'date': '2030-01-01', 'time': '09:45'}
+)
+cancelled = api.cancel_appointment(10)
+
+print(f'\nСброшено: {invalidated}')
+
+try:
+    assert cancelled, 'Отмена должна пройти'
+    assert invalidated == [(2, '2030-01-01')], 'Сбрасывается только день отмененной записи'
+    assert api.cache.get('get-appointments', {'doctor_id': 2, 'date': '2030-01-01'}) is MISS, 'День записи сброшен'
+    assert api.cache.get('get-appointments', {'doctor_id': 2, 'date': '2030-01-02'}) == [], 'Другие дни врача остаются'
+    assert api.cache.get('get-appointments', {'doctor_id': 6, 'date': '2030-01-01'}) == [], 'Другие врачи остаются'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+
+from single_flight import SingleFlight, AsyncSingleFlight
+
+print("=" * 60)
+print("ТЕСТ 1: SingleFlight - одинаковые параллельные вызовы выполняются один раз")
+print("=" * 60)
+
+flights = SingleFlight()
+calls = []
+results = []
+
+
+def slow_request():
+    calls.append(1)
+    time.sleep(0.2)
+    return ['09:45']
+
+
+threads = [threading.Thread(target=lambda: results.append(flights.do('key', slow_request))) for _ in range(5)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+print(f'\nВызовов: {len(calls)}, результатов: {len(results)}, общих: {flights.shared}')
+
+try:
+    assert len(calls) == 1, f'Запрос должен выполниться один раз, выполнен {len(calls)}'
+    assert results == [['09:45']] * 5, 'Все вызовы должны получить результат'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: AsyncSingleFlight - отмена одного ожидающего не отменяет общий вызов")
+print("=" * 60)
+
+async_flights = AsyncSingleFlight()
+async_calls = []
+
+
+async def slow_async_request():
+    async_calls.append(1)
+    await asyncio.sleep(0.2)
+    return ['10:30']
+
+
+async def run_flights():
+    tasks = [asyncio.create_task(async_flights.do('key', slow_async_request)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    tasks[0].cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return [r if not isinstance(r, BaseException) else type(r).__name__ for r in results]
+
+
+async_results = asyncio.run(run_flights())
+
+print(f'\nВызовов: {len(async_calls)}, результаты: {async_results}, общих: {async_flights.shared}')
+
+try:
+    assert len(async_calls) == 1, f'Запрос должен выполниться один раз, выполнен {len(async_calls)}'
+    assert async_results == ['CancelledError', ['10:30'], ['10:30']], 'Остальные вызовы должны получить результат'
+    assert 'key' not in async_flights, 'Завершенный вызов не должен оставаться в списке'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
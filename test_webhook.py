@@ -0,0 +1,66 @@
+import json
+import time
+
+import httpx
+
+from wordpress_api import WordPressAPI
+from response_cache import MISS
+from webhook_receiver import InvalidationWebhookServer, sign_payload
+
+SECRET = 'test-secret'
+DAY = {'doctor_id': 2, 'date': '2030-01-01'}
+
+wp_api = WordPressAPI('http://clinic.test')
+receiver = InvalidationWebhookServer(wp_api, port=0, secret=SECRET, max_age=300)
+receiver.start()
+url = f'http://127.0.0.1:{receiver._server.server_address[1]}{receiver.path}'
+
+
+def post(events, timestamp=None, secret=SECRET, body=None):
+    """POST в приемник как от плагина: код ответа"""
+    if body is None:
+        body = json.dumps({'events': events, 'timestamp': int(timestamp or time.time())}).encode()
+    headers = {'X-Clinic-Signature': sign_payload(secret, body), 'Content-Type': 'application/json'}
+    return httpx.post(url, content=body, headers=headers).status_code, body
+
+
+print("=" * 60)
+print("ТЕСТ 1: подписанное событие сбрасывает занятость дня")
+print("=" * 60)
+
+wp_api.cache.set('get-appointments', DAY, ['09:45'])
+status, body = post([dict(DAY, appointment_id=1, type='created')])
+
+print(f'\nОтвет: {status}, статистика: {receiver.get_stats()}')
+
+try:
+    assert status == 204, 'Подписанный запрос должен приниматься'
+    assert wp_api.cache.get('get-appointments', DAY) is MISS, 'Занятость дня должна сбрасываться'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: неверная подпись, повтор и устаревший запрос - 403")
+print("=" * 60)
+
+wp_api.cache.set('get-appointments', DAY, ['09:45'])
+results = {
+    'чужой секрет': post([DAY], secret='wrong')[0],
+    'повтор': post(None, body=body)[0],
+    'старый timestamp': post([DAY], timestamp=time.time() - 301)[0],
+}
+for case, result in results.items():
+    print(f'  {case}: {result}')
+print(f'Статистика: {receiver.get_stats()}')
+
+try:
+    assert results == {'чужой секрет': 403, 'повтор': 403, 'старый timestamp': 403}, \
+        'Запросы должны отклоняться'
+    assert wp_api.cache.get('get-appointments', DAY) == ['09:45'], 'Отклоненный запрос не должен сбрасывать кэш'
+    assert receiver.get_stats()['rejected'] == 3, 'Отклоненные запросы должны учитываться'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
+
+receiver.stop()
@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import requests
+
+from wordpress_api import WordPressAPI
+from async_wordpress_api import AsyncWordPressAPI
+
+SITE_URL = 'http://clinic.test'
+
+
+def make_async_api(handler):
+    """Асинхронный клиент, запросы которого обрабатывает handler (без сети)"""
+    api = AsyncWordPressAPI(WordPressAPI(SITE_URL, retry_attempts=3, backoff_factor=0))
+    asyncio.run(api.client.aclose())
+    api.client = httpx.AsyncClient(transport=httpx.MockTransport(handler),
+                                   base_url=f"{SITE_URL}/wp-json/clinic/v1/")
+    return api
+
+
+def replies(*outcomes):
+    """handler: по очереди отдает ответы (код) или бросает исключения; считает вызовы"""
+    calls = []
+
+    def handler(request):
+        outcome = outcomes[min(len(calls), len(outcomes) - 1)]
+        calls.append(request.method)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json={})
+
+    return handler, calls
+
+
+async def send(api, method, endpoint, **kwargs):
+    try:
+        return (await api._request(method, endpoint, **kwargs)).status_code
+    except httpx.HTTPError as e:
+        return type(e).__name__
+
+
+print("=" * 60)
+print("ТЕСТ 1: AsyncWordPressAPI - какие запросы повторяются")
+print("=" * 60)
+
+results = {}
+handler, calls = replies(503, 503, 200)
+results['GET 503, 503, 200'] = (asyncio.run(send(make_async_api(handler), 'GET', 'doctors')), len(calls))
+handler, calls = replies(503, 200)
+results['POST 503'] = (asyncio.run(send(make_async_api(handler), 'POST', 'appointments')), len(calls))
+handler, calls = replies(503, 200)
+results['POST idempotent 503'] = (asyncio.run(send(make_async_api(handler), 'POST', 'cancel-appointment',
+                                                   idempotent=True)), len(calls))
+handler, calls = replies(httpx.ConnectError('refused'), 200)
+results['POST ConnectError'] = (asyncio.run(send(make_async_api(handler), 'POST', 'appointments')), len(calls))
+handler, calls = replies(httpx.ReadTimeout('timeout'), 200)
+results['POST ReadTimeout'] = (asyncio.run(send(make_async_api(handler), 'POST', 'appointments')), len(calls))
+
+for case, (result, count) in results.items():
+    print(f'  {case}: {result}, запросов {count}')
+
+try:
+    assert results['GET 503, 503, 200'] == (200, 3), 'GET повторяется при 5xx'
+    assert results['POST 503'] == (503, 1), 'Неидемпотентный POST при 5xx не повторяется'
+    assert results['POST idempotent 503'] == (200, 2), 'Идемпотентный POST повторяется при 5xx'
+    assert results['POST ConnectError'] == (200, 2), 'POST повторяется, если соединение не установлено'
+    assert results['POST ReadTimeout'] == ('ReadTimeout', 1), 'POST не повторяется, если запрос мог дойти'
+    print('\n✅ ТЕСТ 1 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 1 НЕ ПРОЙДЕН: {e}')
+
+print("\n" + "=" * 60)
+print("ТЕСТ 2: WordPressAPI - повторы при сетевых ошибках")
+print("=" * 60)
+
+
+def sync_send(method, endpoint, *errors, **kwargs):
+    """Первые запросы бросают errors, следующий отвечает 200: (результат, число запросов)"""
+    api = WordPressAPI(SITE_URL, retry_attempts=3, backoff_factor=0)
+    calls = []
+
+    def request(*args, **request_kwargs):
+        calls.append(method)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    api.session.request = request
+    try:
+        return api._request(method, endpoint, **kwargs).status_code, len(calls)
+    except requests.exceptions.RequestException as e:
+        return type(e).__name__, len(calls)
+
+
+results = {
+    'GET ReadTimeout': sync_send('GET', 'doctors', requests.exceptions.ReadTimeout()),
+    'POST ConnectTimeout': sync_send('POST', 'appointments', requests.exceptions.ConnectTimeout()),
+    'POST ReadTimeout': sync_send('POST', 'appointments', requests.exceptions.ReadTimeout()),
+    'GET x3 ConnectionError': sync_send('GET', 'doctors', *[requests.exceptions.ConnectionError()] * 3),
+}
+for case, (result, count) in results.items():
+    print(f'  {case}: {result}, запросов {count}')
+
+try:
+    assert results['GET ReadTimeout'] == (200, 2), 'GET повторяется при таймауте'
+    assert results['POST ConnectTimeout'] == (200, 2), 'POST повторяется, если соединение не установлено'
+    assert results['POST ReadTimeout'] == ('ReadTimeout', 1), 'POST не повторяется, если запрос мог дойти'
+    assert results['GET x3 ConnectionError'] == ('ConnectionError', 3), 'Не больше retry_attempts попыток'
+    print('\n✅ ТЕСТ 2 ПРОЙДЕН!')
+except AssertionError as e:
+    print(f'\n❌ ТЕСТ 2 НЕ ПРОЙДЕН: {e}')
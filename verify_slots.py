@@ -33,7 +33,7 @@ def main():
     logger.info(f"Testing for Doctor ID: {test_doctor_id} on Date: {test_date}")
 
     # 3. Get initial occupied slots
-    occupied_before = api.get_occupied_slots(doctor_id=test_doctor_id, date=test_date)
+    occupied_before = api.get_occupied_slots(doctor_id=test_doctor_id, date=test_date) or []
     logger.info(f"Occupied slots BEFORE booking: {occupied_before}")
     
     # 4. Calculate available slots
@@ -71,7 +71,7 @@ def main():
     logger.info(f"Appointment created successfully! ID: {apt_id}")
 
     # 6. Verify the slot is now occupied
-    occupied_after = api.get_occupied_slots(doctor_id=test_doctor_id, date=test_date)
+    occupied_after = api.get_occupied_slots(doctor_id=test_doctor_id, date=test_date) or []
     logger.info(f"Occupied slots AFTER booking: {occupied_after}")
 
     is_occupied = test_time in occupied_after
@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер тела запроса (байт)
+MAX_BODY_SIZE = 64 * 1024
+
+
+def sign_payload(secret, body):
+    """Подпись тела запроса: sha256=<hex HMAC-SHA256>"""
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class InvalidationWebhookServer:
+    """
+    Локальный HTTP приемник событий от WordPress плагина.
+
+    Плагин отправляет POST с изменениями записей
+    {"events": [{"appointment_id", "doctor_id", "date", "type"}, ...], "timestamp": unix-время}
+    и подписью X-Clinic-Signature (HMAC-SHA256 тела с общим секретом).
+    Запросы старше max_age секунд и повторы уже принятой подписи отклоняются.
+    По событиям сбрасываются соответствующие записи кэша WordPressAPI.
+    Сервер работает в отдельном потоке и не блокирует event loop бота.
+    """
+
+    def __init__(self, wp_api, host='127.0.0.1', port=8081, secret='', path='/clinic-webhook', max_age=300):
+        self.wp_api = wp_api
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.path = path
+        self.max_age = max_age
+        self.received = 0
+        self.rejected = 0
+        # Принятые подписи -> время, до которого они могли бы пройти проверку timestamp
+        self._seen = {}
+        self._seen_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != receiver.path:
+                    self.send_error(404)
+                    return
+
+                length = int(self.headers.get('Content-Length') or 0)
+                if length <= 0 or length > MAX_BODY_SIZE:
+                    self.send_error(413 if length > MAX_BODY_SIZE else 400)
+                    return
+                body = self.rfile.read(length)
+
+                signature = self.headers.get('X-Clinic-Signature', '')
+                if not hmac.compare_digest(signature, sign_payload(receiver.secret, body)):
+                    receiver.rejected += 1
+                    logger.warning(f"Webhook: неверная подпись от {self.client_address[0]}")
+                    self.send_error(403)
+                    return
+
+                try:
+                    payload = json.loads(body)
+                    events = payload.get('events', [])
+                    timestamp = int(payload.get('timestamp') or 0)
+                except (ValueError, TypeError, AttributeError):
+                    self.send_error(400)
+                    return
+
+                if not receiver.accept_once(signature, timestamp):
+                    receiver.rejected += 1
+                    logger.warning(f"Webhook: устаревший или повторный запрос от {self.client_address[0]}")
+                    self.send_error(403)
+                    return
+
+                receiver.handle_events(events)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # Запросы не пишем в stderr, ошибки логируются выше
+                pass
+
+        return Handler
+
+    def accept_once(self, signature, timestamp, now=None):
+        """Запрос не старше max_age и с этой подписью еще не принимался"""
+        now = now or time.time()
+        if abs(now - timestamp) > self.max_age:
+            return False
+        with self._seen_lock:
+            for seen, expires_at in list(self._seen.items()):
+                if expires_at < now:
+                    del self._seen[seen]
+            if signature in self._seen:
+                return False
+            self._seen[signature] = timestamp + self.max_age
+        return True
+
+    def handle_events(self, events):
+        """Сброс кэша по событиям изменения записей"""
+        changes = [e for e in events if isinstance(e, dict) and e.get('doctor_id') and e.get('date')]
+        if changes:
+            self.wp_api.apply_changes(changes)
+        elif events:
+            # Врач/дата неизвестны - сбрасываем всю занятость
+            self.wp_api.invalidate_appointments()
+        self.received += len(events)
+        logger.info(f"Webhook: получено событий {len(events)}, кэш сброшен")
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        if not self.secret:
+            logger.error("Webhook: секрет не задан, приемник не запущен")
+            return False
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        except OSError as e:
+            logger.error(f"Webhook: не удалось занять {self.host}:{self.port}: {e}")
+            return False
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name='clinic-webhook', daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Webhook приемник запущен на http://{self.host}:{self.port}{self.path}")
+        return True
+
+    def stop(self):
+        """Остановка сервера"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def get_stats(self):
+        """Счетчики приемника"""
+        return {'running': self._server is not None, 'received': self.received, 'rejected': self.rejected}
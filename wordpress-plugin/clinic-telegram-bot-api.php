@@ -7,6 +7,38 @@
  */
 
 define('CLINIC_BOT_API_KEY', 'tg_bot_secret_key_8451'); // Секретный ключ для защиты
+define('CLINIC_PATIENT_ID_TTL', WEEK_IN_SECONDS); // Кэш telegram_id -> patient_id
+define('CLINIC_SCHEMA_VERSION', '5'); // Версия схемы (индексы, журнал изменений, уникальность слота)
+define('CLINIC_DOCTORS_CACHE_TTL', HOUR_IN_SECONDS); // Кэш списка врачей (сбрасывается при изменениях)
+define('CLINIC_BATCH_MAX_OPERATIONS', 20); // Максимум операций в одном /batch
+define('CLINIC_CHANGES_RETENTION_DAYS', 30); // Сколько дней хранить журнал изменений
+define('CLINIC_SCHEMA_RETRY_INTERVAL', HOUR_IN_SECONDS); // Пауза между попытками обновить схему после ошибки
+
+// Схема (индексы, журнал изменений) создается при активации, а при обновлении плагина -
+// в фоновом событии WP-Cron (ALTER TABLE не выполняется в обычных запросах посетителей)
+register_activation_hook(__FILE__, 'clinic_upgrade_schema');
+add_action('plugins_loaded', 'clinic_maybe_upgrade_schema');
+add_action('clinic_upgrade_schema', 'clinic_upgrade_schema');
+
+// Ежедневная очистка старых записей журнала изменений
+add_action('clinic_prune_changes', 'clinic_prune_changes');
+
+// Отправка событий об изменении записей боту (webhook)
+// URL и секрет: Настройки -> Clinic Bot (опции clinic_bot_webhook_url / clinic_bot_webhook_secret)
+// Отправка только если в этом запросе менялись записи (отслеживается по SQL-запросам)
+add_filter('query', 'clinic_watch_appointment_writes');
+add_action('shutdown', 'clinic_dispatch_webhook');
+add_action('admin_init', 'clinic_register_settings');
+add_action('admin_menu', 'clinic_add_settings_page');
+
+// Сброс кэша врачей при изменении пользователей/профилей
+add_action('user_register', 'clinic_flush_doctors_cache');
+add_action('profile_update', 'clinic_flush_doctors_cache');
+add_action('delete_user', 'clinic_flush_doctors_cache');
+add_action('set_user_role', 'clinic_flush_doctors_cache');
+add_action('added_user_meta', 'clinic_flush_doctors_cache_on_meta', 10, 3);
+add_action('updated_user_meta', 'clinic_flush_doctors_cache_on_meta', 10, 3);
+add_action('deleted_user_meta', 'clinic_flush_doctors_cache_on_meta', 10, 3);
 
 // Регистрация REST API endpoints
 add_action('rest_api_init', function () {
@@ -59,6 +91,34 @@ add_action('rest_api_init', function () {
         'callback' => 'clinic_update_appointment_status',
         'permission_callback' => 'clinic_check_api_key'
     ));
+
+    // 8. Занятые слоты врача за диапазон дат (неделя одним запросом)
+    register_rest_route('clinic/v1', '/get-appointments-range', array(
+        'methods' => 'GET',
+        'callback' => 'clinic_get_kivi_appointments_range',
+        'permission_callback' => 'clinic_check_api_key'
+    ));
+
+    // 9. Пакет операций одним запросом
+    register_rest_route('clinic/v1', '/batch', array(
+        'methods' => 'POST',
+        'callback' => 'clinic_batch',
+        'permission_callback' => 'clinic_check_api_key'
+    ));
+
+    // 10. Журнал изменений записей (инкрементальная синхронизация)
+    register_rest_route('clinic/v1', '/changes', array(
+        'methods' => 'GET',
+        'callback' => 'clinic_get_changes',
+        'permission_callback' => 'clinic_check_api_key'
+    ));
+
+    // 11. Диагностика (наличие индексов)
+    register_rest_route('clinic/v1', '/diagnostics', array(
+        'methods' => 'GET',
+        'callback' => 'clinic_get_diagnostics',
+        'permission_callback' => 'clinic_check_api_key'
+    ));
 });
 
 // ... (existing code) ...
@@ -90,6 +150,7 @@ function clinic_update_appointment_status($request)
     if ($result === false) {
         return new WP_Error('db_error', 'Update status failed');
     }
+    clinic_log_change($appointment_id, 'updated');
 
     return rest_ensure_response(array('success' => true, 'id' => $appointment_id, 'new_status' => $status));
 }
@@ -110,12 +171,704 @@ function clinic_check_api_key($request)
 }
 
 /**
- * Получение врачей из KiviCare
+ * Выполнение нескольких операций за один HTTP запрос
+ * Тело: {"operations": [{"op": "update-status", "params": {...}}, ...]}
+ * Операции выполняются по порядку через те же endpoint'ы (чтение видит предыдущие изменения)
+ * Ответ: [{"status": 200, "data": ..., "headers": {...}}, ...]
  */
-function clinic_get_kivi_doctors($request)
+function clinic_batch($request)
+{
+    // Разрешенные операции => HTTP метод
+    $allowed = array(
+        'update-status' => 'POST',
+        'doctors' => 'GET',
+        'get-appointments' => 'GET',
+        'get-appointments-range' => 'GET',
+        'all-appointments' => 'GET',
+        'my-appointments' => 'GET'
+    );
+
+    $operations = $request->get_param('operations');
+    if (!is_array($operations) || empty($operations)) {
+        return new WP_Error('missing_operations', 'Operations required', array('status' => 400));
+    }
+    if (count($operations) > CLINIC_BATCH_MAX_OPERATIONS) {
+        return new WP_Error('too_many_operations', 'Too many operations', array('status' => 400));
+    }
+
+    $server = rest_get_server();
+    $results = array();
+    foreach ($operations as $operation) {
+        $op = isset($operation['op']) ? $operation['op'] : '';
+        if (!isset($allowed[$op])) {
+            $results[] = array(
+                'status' => 400,
+                'data' => array('code' => 'invalid_operation', 'message' => 'Unknown operation: ' . $op),
+                'headers' => new stdClass()
+            );
+            continue;
+        }
+
+        $params = isset($operation['params']) && is_array($operation['params']) ? $operation['params'] : array();
+        $sub_request = new WP_REST_Request($allowed[$op], '/clinic/v1/' . $op);
+        // Пакет уже авторизован
+        $sub_request->set_header('x-api-key', CLINIC_BOT_API_KEY);
+        if ($allowed[$op] === 'GET') {
+            $sub_request->set_query_params($params);
+        } else {
+            $sub_request->set_body_params($params);
+        }
+
+        $sub_response = rest_do_request($sub_request);
+        $headers = array_intersect_key($sub_response->get_headers(), array('ETag' => true, 'X-Next-Cursor' => true));
+        $results[] = array(
+            'status' => $sub_response->get_status(),
+            'data' => $server->response_to_data($sub_response, false),
+            'headers' => empty($headers) ? new stdClass() : $headers
+        );
+    }
+
+    return rest_ensure_response($results);
+}
+
+/**
+ * Ответ с ETag: если у клиента та же версия (If-None-Match), отдаем 304 без тела
+ * ETag по умолчанию - хэш данных и дополнительных заголовков
+ */
+function clinic_conditional_response($request, $data, $etag = null, $headers = array())
+{
+    if ($etag === null) {
+        $etag = '"' . md5(wp_json_encode(array($data, $headers))) . '"';
+    }
+
+    $if_none_match = $request->get_header('if-none-match');
+    if ($if_none_match && in_array($etag, array_map('trim', explode(',', $if_none_match)), true)) {
+        $response = new WP_REST_Response(null, 304);
+    } else {
+        $response = rest_ensure_response($data);
+    }
+
+    $response->header('ETag', $etag);
+    foreach ($headers as $name => $value) {
+        $response->header($name, $value);
+    }
+    return $response;
+}
+
+/**
+ * Составные индексы под запросы плагина к ae3rf_kc_appointments
+ * имя индекса => колонки
+ */
+function clinic_appointment_indexes()
+{
+    return array(
+        // /get-appointments, /get-appointments-range
+        'clinic_doctor_date_status' => array('doctor_id', 'appointment_start_date', 'status'),
+        // /my-appointments: status фильтруется неравенством, поэтому идет после даты
+        'clinic_patient_date_status' => array('patient_id', 'appointment_start_date', 'status'),
+        // /all-appointments (диапазон дат + keyset курсор)
+        'clinic_date_time_id' => array('appointment_start_date', 'appointment_start_time', 'id'),
+    );
+}
+
+/**
+ * Индексы прошлых версий схемы, которые удаляются при обновлении
+ */
+function clinic_obsolete_appointment_indexes()
+{
+    return array('clinic_patient_status_date');
+}
+
+/**
+ * Имена индексов таблицы записей => колонки в порядке индекса
+ */
+function clinic_get_existing_indexes()
+{
+    global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+
+    $existing = array();
+    $rows = $wpdb->get_results("SHOW INDEX FROM $table_name");
+    foreach ((array) $rows as $row) {
+        $existing[$row->Key_name][intval($row->Seq_in_index)] = $row->Column_name;
+    }
+    foreach ($existing as $name => $columns) {
+        ksort($columns);
+        $existing[$name] = array_values($columns);
+    }
+    return $existing;
+}
+
+/**
+ * Создание недостающих индексов (активация/обновление плагина)
+ * Индекс с теми же колонками, но другим именем считается существующим
+ */
+function clinic_ensure_appointment_indexes()
+{
+    global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+
+    $existing = clinic_get_existing_indexes();
+    foreach (clinic_appointment_indexes() as $name => $columns) {
+        if (isset($existing[$name]) || in_array($columns, $existing, true)) {
+            continue;
+        }
+        $result = $wpdb->query("ALTER TABLE $table_name ADD INDEX $name (" . implode(', ', $columns) . ")");
+        if ($result === false) {
+            error_log("Clinic Bot API: не удалось создать индекс $name: " . $wpdb->last_error);
+            return false;
+        }
+    }
+    foreach (clinic_obsolete_appointment_indexes() as $name) {
+        if (isset($existing[$name])) {
+            $wpdb->query("ALTER TABLE $table_name DROP INDEX $name");
+        }
+    }
+    return true;
+}
+
+/**
+ * Защита от двойной записи на уровне БД: уникальный ключ по активному слоту.
+ * clinic_active_slot - генерируемая колонка "врач|дата|время" для неотмененных записей
+ * и NULL для отмененных (NULL в уникальном ключе не конфликтуют), поэтому вставку
+ * на занятый слот отклоняет MySQL - и из бота, и с сайта KiviCare, и из админки.
+ * Если в таблице уже есть двойные записи, ключ создать нельзя: результат в опции
+ * clinic_bot_slot_guard (и /diagnostics), остальная схема обновляется без него.
+ */
+function clinic_ensure_slot_guard()
+{
+    global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+
+    $existing = clinic_get_existing_indexes();
+    if (!isset($existing['clinic_active_slot'])) {
+        if (!$wpdb->get_var("SHOW COLUMNS FROM $table_name LIKE 'clinic_active_slot'")) {
+            $added = $wpdb->query(
+                "ALTER TABLE $table_name ADD COLUMN clinic_active_slot VARCHAR(64)
+                 GENERATED ALWAYS AS (IF(status <> 0,
+                     CONCAT(doctor_id, '|', appointment_start_date, '|', appointment_start_time), NULL)) VIRTUAL"
+            );
+            if ($added === false) {
+                error_log("Clinic Bot API: не удалось добавить колонку clinic_active_slot: " . $wpdb->last_error);
+                update_option('clinic_bot_slot_guard', 0);
+                return false;
+            }
+        }
+        if ($wpdb->query("ALTER TABLE $table_name ADD UNIQUE INDEX clinic_active_slot (clinic_active_slot)") === false) {
+            error_log("Clinic Bot API: уникальный ключ слота не создан (двойные записи в таблице?): " . $wpdb->last_error);
+            update_option('clinic_bot_slot_guard', 0);
+            return false;
+        }
+    }
+    update_option('clinic_bot_slot_guard', 1);
+    return true;
+}
+
+/**
+ * Таблица журнала изменений записей
+ */
+function clinic_changes_table()
+{
+    global $wpdb;
+    return $wpdb->prefix . 'clinic_appointment_changes';
+}
+
+/**
+ * Журнал изменений записей: таблица + триггеры на ae3rf_kc_appointments
+ * Триггеры ловят изменения из любого источника (бот, сайт KiviCare, админка).
+ * Если создать триггеры нельзя (нет привилегии TRIGGER), изменения пишет сам плагин.
+ */
+function clinic_ensure_change_log()
 {
     global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+    $changes_table = clinic_changes_table();
+
+    $created = $wpdb->query(
+        "CREATE TABLE IF NOT EXISTS $changes_table (
+            id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+            appointment_id BIGINT UNSIGNED NOT NULL,
+            doctor_id BIGINT UNSIGNED NOT NULL,
+            appointment_date DATE NULL,
+            appointment_time TIME NULL,
+            status INT NULL,
+            change_type VARCHAR(20) NOT NULL,
+            changed_at DATETIME NOT NULL,
+            PRIMARY KEY (id),
+            KEY changed_at (changed_at)
+        ) " . $wpdb->get_charset_collate()
+    );
+    if ($created === false) {
+        error_log("Clinic Bot API: не удалось создать журнал изменений: " . $wpdb->last_error);
+        return false;
+    }
+
+    $columns = "(appointment_id, doctor_id, appointment_date, appointment_time, status, change_type, changed_at)";
+    $triggers = array(
+        'clinic_apt_after_insert' => "AFTER INSERT ON $table_name FOR EACH ROW
+            INSERT INTO $changes_table $columns
+            VALUES (NEW.id, NEW.doctor_id, NEW.appointment_start_date, NEW.appointment_start_time, NEW.status, 'created', NOW())",
+        // При переносе записи сначала логируем освобожденный слот (OLD) как 'moved'
+        'clinic_apt_after_update' => "AFTER UPDATE ON $table_name FOR EACH ROW BEGIN
+            IF NOT (OLD.doctor_id <=> NEW.doctor_id)
+                OR NOT (OLD.appointment_start_date <=> NEW.appointment_start_date)
+                OR NOT (OLD.appointment_start_time <=> NEW.appointment_start_time) THEN
+                INSERT INTO $changes_table $columns
+                VALUES (OLD.id, OLD.doctor_id, OLD.appointment_start_date, OLD.appointment_start_time, OLD.status, 'moved', NOW());
+            END IF;
+            INSERT INTO $changes_table $columns
+            VALUES (NEW.id, NEW.doctor_id, NEW.appointment_start_date, NEW.appointment_start_time, NEW.status,
+                    IF(NEW.status = 0 AND OLD.status <> 0, 'cancelled', 'updated'), NOW());
+        END",
+        'clinic_apt_after_delete' => "AFTER DELETE ON $table_name FOR EACH ROW
+            INSERT INTO $changes_table $columns
+            VALUES (OLD.id, OLD.doctor_id, OLD.appointment_start_date, OLD.appointment_start_time, OLD.status, 'deleted', NOW())"
+    );
+
+    // Триггеры старой версии (без записи 'moved' при переносе) пересоздаются
+    $markers = array('clinic_apt_after_update' => "'moved'");
+
+    $has_triggers = true;
+    foreach ($triggers as $name => $body) {
+        $statement = $wpdb->get_var($wpdb->prepare(
+            "SELECT ACTION_STATEMENT FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = %s",
+            $name
+        ));
+        if ($statement !== null) {
+            if (!isset($markers[$name]) || strpos($statement, $markers[$name]) !== false) {
+                continue;
+            }
+            $wpdb->query("DROP TRIGGER IF EXISTS $name");
+        }
+        if ($wpdb->query("CREATE TRIGGER $name $body") === false) {
+            error_log("Clinic Bot API: не удалось создать триггер $name, журнал ведет плагин: " . $wpdb->last_error);
+            $has_triggers = false;
+            break;
+        }
+    }
+    if (!$has_triggers) {
+        // Частично созданные триггеры дублировали бы записи плагина в журнале
+        foreach (array_keys($triggers) as $name) {
+            $wpdb->query("DROP TRIGGER IF EXISTS $name");
+        }
+    }
+    update_option('clinic_bot_change_triggers', $has_triggers ? 1 : 0);
 
+    if (!wp_next_scheduled('clinic_prune_changes')) {
+        wp_schedule_event(time(), 'daily', 'clinic_prune_changes');
+    }
+    return true;
+}
+
+/**
+ * Запись изменения в журнал из кода плагина (только если триггеров нет)
+ */
+function clinic_log_change($appointment_id, $change_type)
+{
+    global $wpdb;
+    clinic_appointments_changed(true);
+    if (get_option('clinic_bot_change_triggers')) {
+        return;
+    }
+
+    $table_name = 'ae3rf_kc_appointments';
+    $changes_table = clinic_changes_table();
+    $wpdb->query($wpdb->prepare(
+        "INSERT INTO $changes_table (appointment_id, doctor_id, appointment_date, appointment_time, status, change_type, changed_at)
+         SELECT id, doctor_id, appointment_start_date, appointment_start_time, status, %s, NOW()
+         FROM $table_name WHERE id = %d",
+        $change_type,
+        $appointment_id
+    ));
+}
+
+/**
+ * Удаление старых записей журнала (cron)
+ */
+function clinic_prune_changes()
+{
+    global $wpdb;
+    $changes_table = clinic_changes_table();
+    $wpdb->query($wpdb->prepare(
+        "DELETE FROM $changes_table WHERE changed_at < DATE_SUB(NOW(), INTERVAL %d DAY)",
+        CLINIC_CHANGES_RETENTION_DAYS
+    ));
+}
+
+/**
+ * Флаг "в этом запросе менялись записи": clinic_appointments_changed(true) - установить,
+ * clinic_appointments_changed() - прочитать
+ */
+function clinic_appointments_changed($set = false)
+{
+    static $changed = false;
+    if ($set) {
+        $changed = true;
+    }
+    return $changed;
+}
+
+/**
+ * Фильтр query: отмечает запросы, изменяющие ae3rf_kc_appointments
+ * (бот, сайт KiviCare, админка - любой код через $wpdb)
+ */
+function clinic_watch_appointment_writes($query)
+{
+    if (!clinic_appointments_changed()
+        && stripos($query, 'ae3rf_kc_appointments') !== false
+        && preg_match('/^\s*(INSERT|UPDATE|DELETE|REPLACE)\b/i', $query)) {
+        clinic_appointments_changed(true);
+    }
+    return $query;
+}
+
+/**
+ * Курсор webhook (последний отправленный id журнала) или null
+ * Читается из БД, а не из кэша опций: его могли сдвинуть параллельные запросы
+ */
+function clinic_webhook_cursor()
+{
+    global $wpdb;
+    return $wpdb->get_var($wpdb->prepare(
+        "SELECT option_value FROM $wpdb->options WHERE option_name = %s",
+        'clinic_bot_webhook_last_id'
+    ));
+}
+
+/**
+ * Отправка новых изменений из журнала на webhook бота
+ * Выполняется в конце запросов, в которых менялись записи:
+ * бронирование через бота, сайт KiviCare, админку
+ */
+function clinic_dispatch_webhook()
+{
+    global $wpdb;
+
+    if (!clinic_appointments_changed()) {
+        return;
+    }
+    $url = get_option('clinic_bot_webhook_url');
+    $secret = get_option('clinic_bot_webhook_secret');
+    if (!$url || !$secret) {
+        return;
+    }
+
+    $changes_table = clinic_changes_table();
+    $last_id = clinic_webhook_cursor();
+    if ($last_id === null) {
+        // Первый запуск: курсор перед изменениями этого запроса (они тоже отправляются)
+        $start = $wpdb->get_var($wpdb->prepare(
+            "SELECT MAX(id) FROM $changes_table WHERE changed_at < FROM_UNIXTIME(%d)",
+            intval($_SERVER['REQUEST_TIME'])
+        ));
+        add_option('clinic_bot_webhook_last_id', intval($start), '', 'no');
+        // Параллельный запрос мог создать курсор раньше - берем значение из БД
+        $last_id = clinic_webhook_cursor();
+        if ($last_id === null) {
+            return;
+        }
+    }
+
+    $rows = $wpdb->get_results($wpdb->prepare(
+        "SELECT id, appointment_id, doctor_id, appointment_date, appointment_time, status, change_type
+         FROM $changes_table WHERE id > %d ORDER BY id ASC LIMIT 100",
+        intval($last_id)
+    ));
+    if (empty($rows)) {
+        return;
+    }
+
+    $events = array();
+    foreach ($rows as $row) {
+        $events[] = array(
+            'appointment_id' => intval($row->appointment_id),
+            'doctor_id' => intval($row->doctor_id),
+            'date' => $row->appointment_date,
+            'time' => $row->appointment_time ? substr($row->appointment_time, 0, 5) : null,
+            'status' => intval($row->status),
+            'type' => $row->change_type
+        );
+    }
+    // Атомарный сдвиг курсора: события отправляет только запрос, успевший его сдвинуть
+    $claimed = $wpdb->query($wpdb->prepare(
+        "UPDATE $wpdb->options SET option_value = %s WHERE option_name = %s AND option_value = %s",
+        (string) intval(end($rows)->id),
+        'clinic_bot_webhook_last_id',
+        $last_id
+    ));
+    wp_cache_delete('clinic_bot_webhook_last_id', 'options');
+    if (!$claimed) {
+        return;
+    }
+
+    // timestamp входит в подписанное тело: бот отклоняет старые (повторно отправленные) запросы
+    $body = wp_json_encode(array('events' => $events, 'timestamp' => time()));
+    wp_remote_post($url, array(
+        'body' => $body,
+        'headers' => array(
+            'Content-Type' => 'application/json',
+            'X-Clinic-Signature' => 'sha256=' . hash_hmac('sha256', $body, $secret)
+        ),
+        'timeout' => 1,
+        'blocking' => false
+    ));
+}
+
+/**
+ * Настройки webhook (Настройки -> Clinic Bot)
+ */
+function clinic_register_settings()
+{
+    register_setting('clinic_bot', 'clinic_bot_webhook_url', array('sanitize_callback' => 'esc_url_raw'));
+    register_setting('clinic_bot', 'clinic_bot_webhook_secret', array('sanitize_callback' => 'sanitize_text_field'));
+}
+
+function clinic_add_settings_page()
+{
+    add_options_page('Clinic Telegram Bot', 'Clinic Bot', 'manage_options', 'clinic-bot', 'clinic_render_settings_page');
+}
+
+function clinic_render_settings_page()
+{
+    if (!current_user_can('manage_options')) {
+        return;
+    }
+    $triggers = clinic_change_triggers_present();
+    ?>
+    <div class="wrap">
+        <h1>Clinic Telegram Bot</h1>
+        <p>Webhook сообщает боту об изменениях записей (бот, сайт KiviCare, админка), и бот сразу сбрасывает кэш занятости.
+            Секрет должен совпадать с WEBHOOK_SECRET бота.</p>
+        <form method="post" action="options.php">
+            <?php settings_fields('clinic_bot'); ?>
+            <table class="form-table">
+                <tr>
+                    <th scope="row"><label for="clinic_bot_webhook_url">URL webhook бота</label></th>
+                    <td><input type="url" class="regular-text" id="clinic_bot_webhook_url" name="clinic_bot_webhook_url"
+                               value="<?php echo esc_attr(get_option('clinic_bot_webhook_url')); ?>"
+                               placeholder="http://127.0.0.1:8081/clinic-webhook"></td>
+                </tr>
+                <tr>
+                    <th scope="row"><label for="clinic_bot_webhook_secret">Секрет</label></th>
+                    <td><input type="password" class="regular-text" id="clinic_bot_webhook_secret" name="clinic_bot_webhook_secret"
+                               value="<?php echo esc_attr(get_option('clinic_bot_webhook_secret')); ?>" autocomplete="off"></td>
+                </tr>
+            </table>
+            <?php submit_button(); ?>
+        </form>
+        <p>Триггеры журнала изменений:
+            <?php echo $triggers ? 'установлены' : '<strong>не установлены</strong> (нет привилегии TRIGGER) - записи, сделанные на сайте, в журнал и webhook не попадают'; ?>
+        </p>
+    </div>
+    <?php
+}
+
+/**
+ * Созданы ли все триггеры журнала изменений (проверка в information_schema)
+ */
+function clinic_change_triggers_present()
+{
+    global $wpdb;
+    $count = $wpdb->get_var(
+        "SELECT COUNT(*) FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()
+         AND TRIGGER_NAME IN ('clinic_apt_after_insert', 'clinic_apt_after_update', 'clinic_apt_after_delete')"
+    );
+    return intval($count) === 3;
+}
+
+/**
+ * Создание/обновление схемы плагина
+ */
+function clinic_upgrade_schema()
+{
+    // Уникальный ключ слота не обязателен: без него работает проверка после вставки
+    clinic_ensure_slot_guard();
+    if (clinic_ensure_appointment_indexes() && clinic_ensure_change_log()) {
+        update_option('clinic_bot_schema_version', CLINIC_SCHEMA_VERSION);
+        delete_option('clinic_bot_schema_failed_at');
+        return true;
+    }
+    // Запоминаем неудачу, чтобы не повторять SHOW INDEX/ALTER на каждом запросе
+    update_option('clinic_bot_schema_failed_at', time());
+    return false;
+}
+
+/**
+ * Проверка версии схемы при загрузке (обновление без повторной активации)
+ * Само обновление (SHOW INDEX, ALTER TABLE) выполняется в событии WP-Cron
+ */
+function clinic_maybe_upgrade_schema()
+{
+    if (get_option('clinic_bot_schema_version') === CLINIC_SCHEMA_VERSION) {
+        return;
+    }
+    // После неудачной попытки (нет прав на ALTER/TRIGGER, нет таблицы KiviCare) повторяем не чаще раза в час
+    $failed_at = intval(get_option('clinic_bot_schema_failed_at', 0));
+    if ($failed_at && time() - $failed_at < CLINIC_SCHEMA_RETRY_INTERVAL) {
+        return;
+    }
+    if (!wp_next_scheduled('clinic_upgrade_schema')) {
+        wp_schedule_single_event(time(), 'clinic_upgrade_schema');
+    }
+}
+
+/**
+ * Изменения записей после курсора since (id в журнале)
+ * Без since возвращает только текущий курсор - точку отсчета для клиента
+ * Ответ: {"changes": [...], "cursor": последний id, "has_more": bool}
+ */
+function clinic_get_changes($request)
+{
+    global $wpdb;
+    $changes_table = clinic_changes_table();
+
+    $since = $request->get_param('since');
+    $limit = intval($request->get_param('limit'));
+    if ($limit <= 0 || $limit > 1000) {
+        $limit = 500;
+    }
+
+    if ($since === null || $since === '') {
+        $cursor = intval($wpdb->get_var("SELECT MAX(id) FROM $changes_table"));
+        return rest_ensure_response(array('changes' => array(), 'cursor' => $cursor, 'has_more' => false));
+    }
+
+    $rows = $wpdb->get_results($wpdb->prepare(
+        "SELECT id, appointment_id, doctor_id, appointment_date, appointment_time, status, change_type, changed_at
+         FROM $changes_table
+         WHERE id > %d
+         ORDER BY id ASC
+         LIMIT %d",
+        intval($since),
+        $limit + 1
+    ));
+
+    if ($wpdb->last_error) {
+        return new WP_Error('db_error', $wpdb->last_error);
+    }
+
+    $has_more = count($rows) > $limit;
+    if ($has_more) {
+        $rows = array_slice($rows, 0, $limit);
+    }
+
+    $changes = array();
+    foreach ($rows as $row) {
+        $changes[] = array(
+            'id' => intval($row->id),
+            'appointment_id' => intval($row->appointment_id),
+            'doctor_id' => intval($row->doctor_id),
+            'date' => $row->appointment_date,
+            'time' => $row->appointment_time ? substr($row->appointment_time, 0, 5) : null,
+            'status' => intval($row->status),
+            'type' => $row->change_type,
+            'changed_at' => $row->changed_at
+        );
+    }
+
+    $cursor = empty($changes) ? intval($since) : end($changes)['id'];
+    return rest_ensure_response(array('changes' => $changes, 'cursor' => $cursor, 'has_more' => $has_more));
+}
+
+/**
+ * Диагностика: наличие индексов под запросы плагина, триггеры журнала изменений, webhook
+ */
+function clinic_get_diagnostics($request)
+{
+    $existing = clinic_get_existing_indexes();
+
+    $indexes = array();
+    foreach (clinic_appointment_indexes() as $name => $columns) {
+        $present = isset($existing[$name]) || in_array($columns, $existing, true);
+        $indexes[$name] = array(
+            'columns' => $columns,
+            'present' => $present
+        );
+    }
+
+    return rest_ensure_response(array(
+        'schema_version' => get_option('clinic_bot_schema_version'),
+        'expected_schema_version' => CLINIC_SCHEMA_VERSION,
+        'schema_failed_at' => intval(get_option('clinic_bot_schema_failed_at', 0)) ?: null,
+        // Без триггеров журнал (и webhook) содержит только записи, сделанные через плагин
+        'change_triggers' => clinic_change_triggers_present(),
+        'webhook_configured' => get_option('clinic_bot_webhook_url') && get_option('clinic_bot_webhook_secret'),
+        // Уникальный ключ активного слота (защита от двойной записи с сайта)
+        'slot_guard' => (bool) get_option('clinic_bot_slot_guard'),
+        'indexes' => $indexes
+    ));
+}
+
+/**
+ * Пакетная загрузка пользователей WP по списку ID одним запросом
+ * Возвращает массив ID => объект (ID, display_name, user_login)
+ */
+function clinic_load_users_by_ids($ids)
+{
+    global $wpdb;
+
+    $ids = array_filter(array_unique(array_map('intval', $ids)));
+    if (empty($ids)) {
+        return array();
+    }
+
+    $rows = $wpdb->get_results(
+        "SELECT ID, display_name, user_login FROM {$wpdb->users}
+         WHERE ID IN (" . implode(',', $ids) . ")"
+    );
+
+    $users = array();
+    foreach ($rows as $row) {
+        $users[$row->ID] = $row;
+    }
+    return $users;
+}
+
+/**
+ * ID пациента (WP user) по Telegram ID
+ * Результат кэшируется в transient, отсутствие пользователя - на короткое время (0)
+ */
+function clinic_get_patient_id_by_telegram($telegram_id)
+{
+    $cache_key = 'clinic_tg_patient_' . $telegram_id;
+    $cached = get_transient($cache_key);
+    if ($cached !== false) {
+        return intval($cached);
+    }
+
+    $user = get_user_by('login', 'tg_patient_' . $telegram_id);
+    if ($user) {
+        set_transient($cache_key, $user->ID, CLINIC_PATIENT_ID_TTL);
+        return $user->ID;
+    }
+
+    set_transient($cache_key, 0, 5 * MINUTE_IN_SECONDS);
+    return 0;
+}
+
+/**
+ * Сброс кэша списка врачей
+ */
+function clinic_flush_doctors_cache()
+{
+    delete_transient('clinic_kivi_doctors');
+}
+
+/**
+ * Сброс кэша врачей только для мета-полей, которые попадают в ответ /doctors
+ */
+function clinic_flush_doctors_cache_on_meta($meta_id, $user_id, $meta_key)
+{
+    if (in_array($meta_key, array('ae3rf_capabilities', 'basic_data', 'description', 'first_name', 'last_name'), true)) {
+        clinic_flush_doctors_cache();
+    }
+}
+
+/**
+ * Список врачей из KiviCare (без кэша)
+ */
+function clinic_build_kivi_doctors()
+{
     // Получаем пользователей с ролью/capability 'kiviCare_doctor'
     // Используем WP_User_Query для надежности
     $args = array(
@@ -148,7 +901,26 @@ function clinic_get_kivi_doctors($request)
         );
     }
 
-    return rest_ensure_response($response);
+    return $response;
+}
+
+/**
+ * Получение врачей из KiviCare
+ * Список кэшируется в transient вместе с ETag
+ */
+function clinic_get_kivi_doctors($request)
+{
+    $cached = get_transient('clinic_kivi_doctors');
+    if ($cached === false) {
+        $doctors = clinic_build_kivi_doctors();
+        $cached = array(
+            'doctors' => $doctors,
+            'etag' => '"' . md5(wp_json_encode($doctors)) . '"'
+        );
+        set_transient('clinic_kivi_doctors', $cached, CLINIC_DOCTORS_CACHE_TTL);
+    }
+
+    return clinic_conditional_response($request, $cached['doctors'], $cached['etag']);
 }
 
 /**
@@ -187,7 +959,63 @@ function clinic_get_kivi_appointments($request)
         );
     }
 
-    return rest_ensure_response($formatted);
+    return clinic_conditional_response($request, $formatted);
+}
+
+/**
+ * Занятые слоты врача за диапазон дат
+ * Ответ: { "YYYY-MM-DD": ["HH:MM", ...], ... } - по ключу на каждый день диапазона
+ */
+function clinic_get_kivi_appointments_range($request)
+{
+    global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+
+    $doctor_id = $request->get_param('doctor_id');
+    $date_from = $request->get_param('date_from');
+    $date_to = $request->get_param('date_to');
+
+    if (!$doctor_id || !$date_from || !$date_to) {
+        return new WP_Error('missing_params', 'Doctor ID, date_from and date_to required');
+    }
+
+    $from_ts = strtotime($date_from);
+    $to_ts = strtotime($date_to);
+    if ($from_ts === false || $to_ts === false || $to_ts < $from_ts) {
+        return new WP_Error('invalid_range', 'Invalid date range', array('status' => 400));
+    }
+
+    // Ограничиваем диапазон месяцем
+    if (($to_ts - $from_ts) / DAY_IN_SECONDS > 31) {
+        return new WP_Error('range_too_large', 'Date range is limited to 31 days', array('status' => 400));
+    }
+
+    $query = $wpdb->prepare(
+        "SELECT appointment_start_date, appointment_start_time
+         FROM $table_name
+         WHERE doctor_id = %d
+         AND appointment_start_date BETWEEN %s AND %s
+         AND status != 0",
+        $doctor_id,
+        date('Y-m-d', $from_ts),
+        date('Y-m-d', $to_ts)
+    );
+
+    $appointments = $wpdb->get_results($query);
+
+    // Пустой список для каждого дня, чтобы клиент мог закэшировать и свободные дни
+    $result = array();
+    $end = new DateTime(date('Y-m-d', $to_ts));
+    $period = new DatePeriod(new DateTime(date('Y-m-d', $from_ts)), new DateInterval('P1D'), $end->modify('+1 day'));
+    foreach ($period as $day) {
+        $result[$day->format('Y-m-d')] = array();
+    }
+
+    foreach ($appointments as $apt) {
+        $result[$apt->appointment_start_date][] = substr($apt->appointment_start_time, 0, 5);
+    }
+
+    return rest_ensure_response($result);
 }
 
 /**
@@ -208,6 +1036,76 @@ function clinic_create_kivi_appointment($request)
         return new WP_Error('missing_fields', 'Required fields missing');
     }
 
+    if (strlen($time) == 5)
+        $time .= ':00';
+
+    // Проверка и вставка под блокировкой слота (врач + дата):
+    // параллельные записи через бота выполняются по очереди
+    $lock_name = 'clinic_slot_' . intval($doctor_id) . '_' . $date;
+    if (!$wpdb->get_var($wpdb->prepare("SELECT GET_LOCK(%s, %d)", $lock_name, 5))) {
+        // 423: сайт работает, слот занят другим запросом (не сбой - не влияет на circuit breaker бота)
+        return new WP_Error('slot_locked', 'Slot is being booked, try again', array('status' => 423));
+    }
+
+    try {
+        return clinic_insert_kivi_appointment($doctor_id, $date, $time, $patient_name, $patient_phone, $telegram_id);
+    } finally {
+        $wpdb->query($wpdb->prepare("SELECT RELEASE_LOCK(%s)", $lock_name));
+    }
+}
+
+/**
+ * Занятые (не отмененные) времена врача на дату, формат HH:MM
+ */
+function clinic_get_occupied_times($doctor_id, $date)
+{
+    global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+
+    $times = $wpdb->get_col($wpdb->prepare(
+        "SELECT appointment_start_time FROM $table_name
+         WHERE doctor_id = %d AND appointment_start_date = %s AND status != 0
+         ORDER BY appointment_start_time",
+        $doctor_id,
+        $date
+    ));
+    return array_map(function ($t) {
+        return substr($t, 0, 5);
+    }, $times);
+}
+
+/**
+ * Ошибка "слот занят" со свежей занятостью дня (бот сразу покажет альтернативы)
+ */
+function clinic_slot_taken_error($doctor_id, $date)
+{
+    return new WP_Error('slot_taken', 'This time slot is already taken', array(
+        'status' => 409,
+        'occupied' => clinic_get_occupied_times($doctor_id, $date)
+    ));
+}
+
+/**
+ * Вставка записи (вызывается под блокировкой слота)
+ */
+function clinic_insert_kivi_appointment($doctor_id, $date, $time, $patient_name, $patient_phone, $telegram_id)
+{
+    global $wpdb;
+    $table_name = 'ae3rf_kc_appointments';
+
+    // 0. Слот уже занят?
+    $taken = $wpdb->get_var($wpdb->prepare(
+        "SELECT id FROM $table_name
+         WHERE doctor_id = %d AND appointment_start_date = %s AND appointment_start_time = %s AND status != 0
+         LIMIT 1",
+        $doctor_id,
+        $date,
+        $time
+    ));
+    if ($taken) {
+        return clinic_slot_taken_error($doctor_id, $date);
+    }
+
     // 1. Найти или создать пациента (WP User)
     $patient_id = 0;
 
@@ -220,6 +1118,9 @@ function clinic_create_kivi_appointment($request)
 
     if ($user) {
         $patient_id = $user->ID;
+        if ($telegram_id) {
+            set_transient('clinic_tg_patient_' . $telegram_id, $patient_id, CLINIC_PATIENT_ID_TTL);
+        }
     } else {
         // Создаем нового пользователя
         $random_password = wp_generate_password();
@@ -244,6 +1145,11 @@ function clinic_create_kivi_appointment($request)
 
         // Сохраняем телефон
         update_user_meta($patient_id, 'mobile_number', $patient_phone);
+
+        // Обновляем кэш telegram_id -> patient_id (мог быть закэширован "не найден")
+        if ($telegram_id) {
+            set_transient('clinic_tg_patient_' . $telegram_id, $patient_id, CLINIC_PATIENT_ID_TTL);
+        }
     }
 
     // 2. Рассчитываем конец приема (+30 мин)
@@ -252,12 +1158,7 @@ function clinic_create_kivi_appointment($request)
     $end_time = date('H:i:s', $end_timestamp);
     $end_date = date('Y-m-d', $end_timestamp); // На случай если переход через полночь (редко)
 
-    if (strlen($time) == 5)
-        $time .= ':00';
-
     // 3. Вставляем в таблицу KiviCare
-    $table_name = 'ae3rf_kc_appointments';
-
     $result = $wpdb->insert(
         $table_name,
         array(
@@ -276,12 +1177,33 @@ function clinic_create_kivi_appointment($request)
     );
 
     if ($result === false) {
+        // Уникальный ключ clinic_active_slot: слот заняли параллельно (в т.ч. через сайт)
+        if (stripos($wpdb->last_error, 'Duplicate entry') !== false) {
+            return clinic_slot_taken_error($doctor_id, $date);
+        }
         return new WP_Error('db_error', 'Database insert failed');
     }
+    $appointment_id = $wpdb->insert_id;
+
+    // 4. Без уникального ключа (см. clinic_ensure_slot_guard) сайт KiviCare блокировку не берет:
+    // если слот успели занять параллельно, побеждает запись с меньшим ID, нашу удаляем.
+    // Запись с сайта, вставленная после нашей, так не отсеивается - это защищает только ключ
+    $first_id = $wpdb->get_var($wpdb->prepare(
+        "SELECT MIN(id) FROM $table_name
+         WHERE doctor_id = %d AND appointment_start_date = %s AND appointment_start_time = %s AND status != 0",
+        $doctor_id,
+        $date,
+        $time
+    ));
+    if ($first_id && intval($first_id) !== intval($appointment_id)) {
+        $wpdb->delete($table_name, array('id' => $appointment_id), array('%d'));
+        return clinic_slot_taken_error($doctor_id, $date);
+    }
+    clinic_log_change($appointment_id, 'created');
 
     return rest_ensure_response(array(
         'success' => true,
-        'id' => $wpdb->insert_id,
+        'id' => $appointment_id,
         'message' => 'Appointment created in KiviCare',
         'patient_id' => $patient_id
     ));
@@ -313,8 +1235,21 @@ function clinic_cancel_kivi_appointment($request)
     if ($result === false) {
         return new WP_Error('db_error', 'Update failed');
     }
+    clinic_log_change($appointment_id, 'cancelled');
+
+    // Врач и слот отмененной записи: бот сбрасывает занятость только этого дня
+    $row = $wpdb->get_row($wpdb->prepare(
+        "SELECT doctor_id, appointment_start_date, appointment_start_time FROM $table_name WHERE id = %d",
+        $appointment_id
+    ));
 
-    return rest_ensure_response(array('success' => true, 'message' => 'Appointment cancelled'));
+    return rest_ensure_response(array(
+        'success' => true,
+        'message' => 'Appointment cancelled',
+        'doctor_id' => $row ? intval($row->doctor_id) : null,
+        'date' => $row ? $row->appointment_start_date : null,
+        'time' => $row && $row->appointment_start_time ? substr($row->appointment_start_time, 0, 5) : null
+    ));
 }
 
 /**
@@ -331,17 +1266,14 @@ function clinic_get_patient_appointments($request)
         return new WP_Error('missing_id', 'Telegram ID required');
     }
 
-    // 1. Находим user_id по username (tg_patient_ID)
-    $username = 'tg_patient_' . $telegram_id;
-    $user = get_user_by('login', $username);
+    // 1. Находим user_id по username (tg_patient_ID), с кэшем в transient
+    $patient_id = clinic_get_patient_id_by_telegram($telegram_id);
 
-    if (!$user) {
+    if (!$patient_id) {
         // Если пользователя нет, значит и записей нет
         return rest_ensure_response(array());
     }
 
-    $patient_id = $user->ID;
-
     // 2. Ищем будущие активные записи
     $query = $wpdb->prepare(
         "SELECT id, doctor_id, appointment_start_date, appointment_start_time, status 
@@ -357,10 +1289,13 @@ function clinic_get_patient_appointments($request)
 
     $appointments = $wpdb->get_results($query);
 
+    // Имена всех врачей одним запросом
+    $doctors = clinic_load_users_by_ids(wp_list_pluck($appointments, 'doctor_id'));
+
     $response = array();
     foreach ($appointments as $apt) {
         // Имя врача
-        $doctor_info = get_userdata($apt->doctor_id);
+        $doctor_info = isset($doctors[$apt->doctor_id]) ? $doctors[$apt->doctor_id] : null;
         $doctor_name = $doctor_info ? $doctor_info->display_name : 'Врач #' . $apt->doctor_id;
 
         $response[] = array(
@@ -382,22 +1317,61 @@ function clinic_get_all_appointments($request)
     global $wpdb;
     $table_name = 'ae3rf_kc_appointments';
 
-    $limit = $request->get_param('limit');
+    $limit = intval($request->get_param('limit'));
     if (!$limit) {
         $limit = 50;
     }
 
-    // Показываем только БУДУЩИЕ записи (от сегодня и на месяц вперед)
+    $status = $request->get_param('status');
+    $doctor_id = $request->get_param('doctor_id');
+    $date_from = $request->get_param('date_from');
+    $date_to = $request->get_param('date_to');
+    $cursor = $request->get_param('cursor');
+
+    // По умолчанию показываем только БУДУЩИЕ записи (от сегодня и на месяц вперед)
     // Исключаем только отмененные (status=0)
+    $where = array('status != 0');
+    $where[] = $date_from
+        ? $wpdb->prepare('appointment_start_date >= %s', $date_from)
+        : 'appointment_start_date >= CURDATE()';
+    $where[] = $date_to
+        ? $wpdb->prepare('appointment_start_date <= %s', $date_to)
+        : 'appointment_start_date <= DATE_ADD(CURDATE(), INTERVAL 1 MONTH)';
+
+    // Фильтр по статусу (те же группы, что и в боте)
+    if ($status === 'confirmed') {
+        $where[] = 'status NOT IN (4, 5)';
+    } elseif ($status === 'visited') {
+        $where[] = 'status = 4';
+    } elseif ($status === 'noshow') {
+        $where[] = 'status = 5';
+    }
+
+    if ($doctor_id) {
+        $where[] = $wpdb->prepare('doctor_id = %d', $doctor_id);
+    }
+
+    // Keyset пагинация: курсор = последняя (дата, время, id) предыдущей страницы
+    if ($cursor) {
+        $parts = explode('|', base64_decode($cursor));
+        if (count($parts) !== 3) {
+            return new WP_Error('invalid_cursor', 'Invalid cursor', array('status' => 400));
+        }
+        list($c_date, $c_time, $c_id) = $parts;
+        $where[] = $wpdb->prepare(
+            '(appointment_start_date > %s OR (appointment_start_date = %s AND (appointment_start_time > %s OR (appointment_start_time = %s AND id > %d))))',
+            $c_date, $c_date, $c_time, $c_time, $c_id
+        );
+    }
+
     $query = "SELECT id, doctor_id, patient_id, appointment_start_date, appointment_start_time, status, description 
              FROM $table_name 
-             WHERE appointment_start_date >= CURDATE()
-             AND appointment_start_date <= DATE_ADD(CURDATE(), INTERVAL 1 MONTH)
-             AND status != 0
-             ORDER BY appointment_start_date ASC, appointment_start_time ASC";
+             WHERE " . implode(' AND ', $where) . "
+             ORDER BY appointment_start_date ASC, appointment_start_time ASC, id ASC";
 
     if ($limit > 0) {
-        $query .= $wpdb->prepare(" LIMIT %d", $limit);
+        // Берем на одну строку больше, чтобы понять, есть ли следующая страница
+        $query .= $wpdb->prepare(" LIMIT %d", $limit + 1);
     }
 
     $appointments = $wpdb->get_results($query);
@@ -406,10 +1380,37 @@ function clinic_get_all_appointments($request)
         return new WP_Error('db_error', $wpdb->last_error);
     }
 
+    $next_cursor = null;
+    if ($limit > 0 && count($appointments) > $limit) {
+        $appointments = array_slice($appointments, 0, $limit);
+        $last = end($appointments);
+        $next_cursor = base64_encode($last->appointment_start_date . '|' . $last->appointment_start_time . '|' . $last->id);
+    }
+
+    // Загружаем связанные данные пачками (а не по запросу на каждую запись):
+    // 1) детали пациентов KiviCare, 2) пользователи WP (врачи + пациенты)
+    $patient_rows = array();
+    $patient_ids = array_unique(array_map('intval', wp_list_pluck($appointments, 'patient_id')));
+    if (!empty($patient_ids)) {
+        $rows = $wpdb->get_results(
+            "SELECT id, user_id, mobile_number FROM ae3rf_kc_patient_details
+             WHERE id IN (" . implode(',', $patient_ids) . ")"
+        );
+        foreach ($rows as $row) {
+            $patient_rows[$row->id] = $row;
+        }
+    }
+
+    $user_ids = array_merge(
+        wp_list_pluck($appointments, 'doctor_id'),
+        wp_list_pluck($patient_rows, 'user_id')
+    );
+    $users = clinic_load_users_by_ids($user_ids);
+
     $response = array();
     foreach ($appointments as $apt) {
         // Имя врача
-        $doctor_info = get_userdata($apt->doctor_id);
+        $doctor_info = isset($users[$apt->doctor_id]) ? $users[$apt->doctor_id] : null;
         $doctor_name = $doctor_info ? $doctor_info->display_name : 'Врач #' . $apt->doctor_id;
 
         // Имя пациента
@@ -418,12 +1419,11 @@ function clinic_get_all_appointments($request)
         $telegram_id = null;
 
         // Попытка 1: KiviCare Patient Details
-        $patient_sql = $wpdb->prepare("SELECT * FROM ae3rf_kc_patient_details WHERE id = %d", $apt->patient_id);
-        $patient_row = $wpdb->get_row($patient_sql);
+        $patient_row = isset($patient_rows[$apt->patient_id]) ? $patient_rows[$apt->patient_id] : null;
 
         if ($patient_row) {
             if (!empty($patient_row->user_id)) {
-                $pt_user = get_userdata($patient_row->user_id);
+                $pt_user = isset($users[$patient_row->user_id]) ? $users[$patient_row->user_id] : null;
                 if ($pt_user) {
                     $patient_name = $pt_user->display_name;
                     if (strpos($pt_user->user_login, 'tg_patient_') === 0) {
@@ -473,6 +1473,8 @@ function clinic_get_all_appointments($request)
         );
     }
 
-    return rest_ensure_response($response);
+    // Список остается массивом (совместимость), курсор - в заголовке
+    $headers = $next_cursor ? array('X-Next-Cursor' => $next_cursor) : array();
+    return clinic_conditional_response($request, $response, null, $headers);
 }
 
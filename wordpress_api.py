@@ -1,14 +1,84 @@
 import requests
 import logging
+import random
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from response_cache import ResponseCache, MISS
+from single_flight import SingleFlight
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED
+from schedule_compiler import compile_template
+
+# Таймауты по endpoint'ам (секунды). Остальные используют общий timeout.
+DEFAULT_ENDPOINT_TIMEOUTS = {
+    'doctors': 10,
+    'get-appointments': 5,
+    'get-appointments-range': 10,
+    'appointments': 15,
+    'my-appointments': 8,
+    'all-appointments': 20,
+    'cancel-appointment': 10,
+    'update-status': 10,
+    'batch': 20,
+    'changes': 10,
+}
+
+# HTTP статусы, при которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def is_server_failure(response):
+    """
+    Ответ - сбой сайта (повтор, ошибка для circuit breaker).
+    Конфликт слота (409 slot_taken, 423/503 slot_locked) - ответ работающего сайта, а не сбой.
+    """
+    if response.status_code not in RETRY_STATUSES:
+        return False
+    return parse_slot_taken(response) is None
+
+
+def _request_not_sent(error):
+    """True, если запрос гарантированно не дошел до сервера (не удалось подключиться)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
 
 class WordPressAPI:
-    def __init__(self, site_url, username=None, password=None, api_key=None, verify_ssl=True, timeout=10, retry_attempts=3, cache_ttl=60):
+    def __init__(self, site_url, username=None, password=None, api_key=None, verify_ssl=True, timeout=10, retry_attempts=3, cache_ttl=60,
+                 endpoint_timeouts=None, pool_maxsize=10, backoff_factor=0.5, cache_max_entries=256, cache_ttls=None,
+                 cache_stale_ttl=600, breaker_threshold=5, breaker_reset_timeout=30):
         self.site_url = site_url
         self.username = username
         self.password = password
         self.api_key = api_key
         self.verify_ssl = verify_ssl
         self.timeout = timeout
+        self.retry_attempts = max(1, retry_attempts)
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.endpoint_timeouts = dict(DEFAULT_ENDPOINT_TIMEOUTS)
+        if endpoint_timeouts:
+            self.endpoint_timeouts.update(endpoint_timeouts)
+        # Кэш ответов GET endpoint'ов (сбрасывается при создании/отмене/смене статуса)
+        self.cache = ResponseCache(ttl=cache_ttl, max_entries=cache_max_entries, endpoint_ttls=cache_ttls,
+                                   stale_ttl=cache_stale_ttl)
+        # Circuit breaker по endpoint'ам: при недоступности сайта отказываем сразу
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.breakers = {}
+        # Одинаковые параллельные GET выполняются одним запросом
+        self.flights = SingleFlight()
+        # Подписчики на сброс занятости: callback(doctor_id, date), None - все
+        self.invalidation_listeners = []
+        # Подписчики на изменения записей (журнал/webhook): callback(changes)
+        self.change_listeners = []
+        # Курсор журнала изменений (/changes), None - еще не получен
+        self.changes_cursor = None
+        # Последний ответ /diagnostics (None - еще не получен)
+        self.diagnostics = None
         self.logger = logging.getLogger('wordpress_api')
         
         self.headers = {
@@ -18,6 +88,14 @@ class WordPressAPI:
         
         if self.api_key:
             self.headers['x-api-key'] = self.api_key
+        
+        # Постоянная сессия: соединения (TCP+TLS) переиспользуются между запросами.
+        # Повторы делаем сами в _request, поэтому у адаптера max_retries=0.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
             
         # Проверка соединения при инициализации
         try:
@@ -26,17 +104,176 @@ class WordPressAPI:
         except Exception as e:
             self.logger.error(f"Ошибка инициализации API: {e}")
 
+    def _backoff(self, attempt):
+        """Экспоненциальная задержка с jitter перед повтором"""
+        delay = self.backoff_factor * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay))
+
+    def get_breaker(self, endpoint):
+        """Circuit breaker endpoint'а (создается при первом обращении)"""
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers.setdefault(
+                endpoint, CircuitBreaker(self.breaker_threshold, self.breaker_reset_timeout)
+            )
+        return breaker
+
+    def is_degraded(self, endpoint):
+        """True, если endpoint сейчас недоступен и данные могут отдаваться из кэша"""
+        return self.get_breaker(endpoint).state != CLOSED
+
+    def get_breaker_stats(self):
+        """Состояние circuit breaker'ов по endpoint'ам"""
+        return {endpoint: breaker.get_stats() for endpoint, breaker in self.breakers.items()}
+
+    def _request(self, method, endpoint, idempotent=None, **kwargs):
+        """
+        HTTP запрос к clinic/v1 через общую сессию с повторами.
+
+        GET (и idempotent=True) повторяются при сетевых ошибках, таймаутах и 5xx/429.
+        Неидемпотентные POST повторяются только если соединение не было
+        установлено (запрос гарантированно не дошел до сервера).
+        Если circuit breaker endpoint'а открыт - сразу CircuitOpenError.
+        """
+        if idempotent is None:
+            idempotent = method == 'GET'
+        url = f"{self.site_url}/wp-json/clinic/v1/{endpoint}"
+        kwargs.setdefault('timeout', self.endpoint_timeouts.get(endpoint, self.timeout))
+        kwargs.setdefault('verify', self.verify_ssl)
+
+        breaker = self.get_breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(endpoint)
+
+        for attempt in range(self.retry_attempts):
+            last_attempt = attempt == self.retry_attempts - 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.record_failure()
+                # Если соединение не установлено, повтор безопасен для любого метода
+                if last_attempt or not (idempotent or _request_not_sent(e)) or not breaker.allow():
+                    raise
+            except requests.exceptions.RequestException:
+                breaker.record_failure()
+                raise
+            else:
+                failed = is_server_failure(response)
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not failed or not idempotent or last_attempt:
+                    return response
+                if not breaker.allow():
+                    return response
+            self.logger.warning(f"Повтор запроса {method} /{endpoint} (попытка {attempt + 2}/{self.retry_attempts})")
+            self._backoff(attempt)
+
+    def close(self):
+        """Закрытие HTTP сессии"""
+        self.session.close()
+
+    def _cached_get(self, endpoint, params, parse):
+        """
+        GET с кэшем ответов и условным запросом.
+
+        Свежая запись кэша возвращается без запроса. Иначе отправляется
+        If-None-Match с сохраненным ETag; на 304 берется прошлый ответ
+        (без передачи и разбора тела). parse(response) -> значение для кэша.
+        Если сайт недоступен, возвращается устаревший ответ (stale_ttl), а когда
+        breaker не закрыт - сразу, с обновлением в фоновом потоке (см. is_stale).
+        """
+        cached = self.cache.get(endpoint, params)
+        if cached is not MISS:
+            return cached
+        key = self.cache.make_key(endpoint, params)
+        fetch = lambda: self._fetch(endpoint, params, parse)
+
+        # Сайт недоступен: не ждем таймаут, отдаем последний ответ и обновляем его в фоне
+        if self.is_degraded(endpoint):
+            stale = self.cache.get_stale(endpoint, params)
+            if stale is not MISS:
+                self._revalidate_in_background(key, fetch)
+                return stale
+
+        try:
+            return self.flights.do(key, fetch)
+        except Exception as e:
+            # Сайт недоступен - отдаем последний удачный ответ, если он есть
+            stale = self.cache.get_stale(endpoint, params)
+            if stale is MISS:
+                raise
+            self.logger.warning(f"/{endpoint} недоступен ({e}), используем устаревший ответ из кэша")
+            return stale
+
+    def _revalidate_in_background(self, key, fetch):
+        """Одно фоновое обновление устаревшего ответа на ключ (в отдельном потоке)"""
+        if key in self.flights:
+            return
+
+        def refresh():
+            try:
+                self.flights.do(key, fetch)
+            except Exception as e:
+                self.logger.debug(f"Фоновое обновление не удалось: {e}")
+
+        threading.Thread(target=refresh, name='wp-revalidate', daemon=True).start()
+
+    def is_stale(self, endpoint, params=None):
+        """True, если для запроса сейчас есть только устаревший ответ (сайт недоступен)"""
+        return self.cache.is_stale(endpoint, params)
+
+    def _fetch(self, endpoint, params, parse):
+        """Запрос для _cached_get: If-None-Match, разбор ответа, сохранение в кэш"""
+        validator = self.cache.get_validator(endpoint, params)
+        headers = {'If-None-Match': validator[0]} if validator else {}
+        response = self._request('GET', endpoint, params=params, headers=headers)
+
+        if response.status_code == 304 and validator:
+            value = validator[1]
+            self.cache.mark_revalidated()
+        else:
+            response.raise_for_status()
+            value = parse(response)
+            etag = response.headers.get('ETag')
+            if etag:
+                self.cache.set_validator(endpoint, params, etag, value)
+        self.cache.set(endpoint, params, value)
+        return value
+
+    def _notify_invalidated(self, doctor_id, date):
+        """Оповещение подписчиков о сбросе занятости"""
+        for listener in self.invalidation_listeners:
+            try:
+                listener(doctor_id, date)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработчика сброса кэша: {e}")
+
+    def invalidate_appointments(self, doctor_id=None, date=None, telegram_id=None):
+        """
+        Сброс кэша после изменения записи.
+        Занятость сбрасывается для (doctor_id, date), если они известны, иначе целиком.
+        Списки записей (/all-appointments, /my-appointments) сбрасываются всегда.
+        """
+        if doctor_id is not None and date is not None:
+            self.cache.invalidate('get-appointments', {'doctor_id': doctor_id, 'date': date})
+            self.cache.invalidate('get-appointments-range', {'doctor_id': doctor_id})
+            self._notify_invalidated(doctor_id, date)
+        else:
+            self.cache.invalidate('get-appointments')
+            self.cache.invalidate('get-appointments-range')
+            self._notify_invalidated(None, None)
+        self.cache.invalidate('all-appointments')
+        if telegram_id is not None:
+            self.cache.invalidate('my-appointments', {'telegram_id': telegram_id})
+        else:
+            self.cache.invalidate('my-appointments')
+
     def get_doctors(self):
         """Получение списка врачей"""
         try:
-            response = requests.get(
-                f"{self.site_url}/wp-json/clinic/v1/doctors",
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
-            return response.json()
+            return self._cached_get('doctors', None, lambda response: response.json())
         except Exception as e:
             self.logger.error(f"Ошибка получения врачей: {e}")
             return []
@@ -44,34 +281,54 @@ class WordPressAPI:
     def test_connection(self):
         """Проверка подключения к API"""
         try:
-            # Пробуем получить список врачей как тест
-            self.get_doctors()
+            # Запрос списка врачей напрямую: get_doctors() глотает ошибки и отдает кэш
+            response = self._request('GET', 'doctors')
+            if response.status_code != 200:
+                return False, f"HTTP {response.status_code}"
             return True, "Подключение успешно"
         except Exception as e:
             return False, str(e)
 
     def get_occupied_slots(self, doctor_id, date):
-        """Получение занятых слотов"""
+        """Получение занятых слотов. None - занятость неизвестна (ошибка запроса)"""
         try:
             params = {'doctor_id': doctor_id, 'date': date}
             if self.api_key:
                 params['api_key'] = self.api_key # Дублируем в GET для надежности
-                
-            response = requests.get(
-                f"{self.site_url}/wp-json/clinic/v1/get-appointments",
-                params=params,
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
-            data = response.json()
-            # API возвращает array of objects {time, status}. Нам нужен список времен.
-            slots = [item['time'][:5] for item in data] # "10:00:00" -> "10:00"
-            return slots
+
+            return self._cached_get('get-appointments', params,
+                                    lambda response: parse_occupied_slots(response.json()))
         except Exception as e:
             self.logger.error(f"Ошибка получения слотов: {e}")
-            return []
+            return None
+
+    def get_occupied_slots_range(self, doctor_id, date_from, date_to):
+        """
+        Занятые слоты врача за диапазон дат одним запросом.
+        Возвращает {"YYYY-MM-DD": ["HH:MM", ...]} и заполняет кэш по дням,
+        так что последующие get_occupied_slots обслуживаются локально.
+        """
+        try:
+            params = {'doctor_id': doctor_id, 'date_from': date_from, 'date_to': date_to}
+            if self.api_key:
+                params['api_key'] = self.api_key
+
+            def parse(response):
+                occupancy = parse_occupied_range(response.json())
+                self.cache_occupied_range(doctor_id, occupancy)
+                return occupancy
+
+            # Через кэш и single-flight: одинаковые параллельные запросы (поиск
+            # ближайшего слота, предзагрузка, прогрев) выполняются одним
+            return self._cached_get('get-appointments-range', params, parse)
+        except Exception as e:
+            self.logger.error(f"Ошибка получения слотов за период: {e}")
+            return {}
+
+    def cache_occupied_range(self, doctor_id, occupancy):
+        """Сохранение занятости по дням в кэш /get-appointments"""
+        for date, slots in occupancy.items():
+            self.cache.set('get-appointments', {'doctor_id': doctor_id, 'date': date}, slots)
 
     def create_appointment(self, doctor_id, date, time, patient_name, patient_phone, telegram_id=None):
         """Создание записи"""
@@ -87,20 +344,24 @@ class WordPressAPI:
             if self.api_key:
                 payload['api_key'] = self.api_key
                 
-            response = requests.post(
-                f"{self.site_url}/wp-json/clinic/v1/appointments",
-                json=payload,
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
+            # Создание записи не идемпотентно: повтор только если запрос не ушел
+            response = self._request('POST', 'appointments', json=payload)
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
+                    self.invalidate_appointments(doctor_id, date, telegram_id)
                     return True, result.get('id')
                 else:
                     return False, result.get('message', 'Неизвестная ошибка от API')
+
+            conflict = parse_slot_taken(response)
+            if conflict is not None:
+                self.logger.warning(f"Слот {date} {time} у врача {doctor_id}: {conflict['code']}")
+                if conflict['occupied'] is not None:
+                    # Слот заняли параллельно: сохраняем свежую занятость дня
+                    self.cache.set('get-appointments', {'doctor_id': doctor_id, 'date': date}, conflict['occupied'])
+                return False, conflict
             
             self.logger.error(f"Ошибка создания записи: {response.text}")
             return False, f"HTTP Error {response.status_code}: {response.text}"
@@ -111,35 +372,27 @@ class WordPressAPI:
 
 
     def get_patient_appointments(self, telegram_id):
-        """Получение записей пациента по Telegram ID"""
+        """
+        Получение записей пациента по Telegram ID.
+        None - записи неизвестны (сайт недоступен и в кэше ничего нет), а не "записей нет".
+        """
         try:
             # Используем endpoint /my-appointments
-            response = requests.get(
-                f"{self.site_url}/wp-json/clinic/v1/my-appointments",
-                params={'telegram_id': telegram_id},
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
-            return response.json()
+            return self._cached_get('my-appointments', {'telegram_id': telegram_id}, lambda response: response.json())
         except Exception as e:
             self.logger.error(f"Ошибка получения записей пациента: {e}")
-            return []
+            return None
 
     def cancel_appointment(self, appointment_id):
         """Отмена записи"""
         try:
             # Используем endpoint /cancel-appointment
-            response = requests.post(
-                f"{self.site_url}/wp-json/clinic/v1/cancel-appointment",
-                params={'appointment_id': appointment_id},
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
+            # Повторная отмена безопасна (статус просто снова станет 0)
+            response = self._request('POST', 'cancel-appointment', idempotent=True,
+                                     params={'appointment_id': appointment_id})
             
             if response.status_code == 200:
+                self.apply_cancellation(response)
                 return True
             
             self.logger.error(f"Ошибка отмены записи: {response.text}")
@@ -148,25 +401,47 @@ class WordPressAPI:
             self.logger.error(f"Ошибка отмены записи: {e}")
             return False
 
-    def get_all_appointments(self, limit=50):
-        """Получение всех записей (для админов)"""
+    def apply_cancellation(self, response):
+        """Сброс кэша после отмены: день записи, а если врач/дата неизвестны - вся занятость"""
         try:
-            params = {'limit': limit}
+            change = parse_cancelled(response.json())
+        except ValueError:
+            change = None
+        if change:
+            self.apply_changes([change])
+        else:
+            self.invalidate_appointments()
+
+    def get_appointments_page(self, limit=50, status=None, doctor_id=None, date_from=None, date_to=None, cursor=None):
+        """
+        Страница записей (для админов) с фильтрацией на стороне сайта.
+        Возвращает (записи, курсор следующей страницы или None).
+        """
+        try:
+            params = build_appointments_params(limit, status, doctor_id, date_from, date_to, cursor)
             if self.api_key:
                 params['api_key'] = self.api_key
-                
-            response = requests.get(
-                f"{self.site_url}/wp-json/clinic/v1/all-appointments",
-                params=params,
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
-            response.raise_for_status()
-            return response.json()
+
+            return self._cached_get('all-appointments', params, parse_appointments_page)
         except Exception as e:
             self.logger.error(f"Ошибка получения всех записей: {e}")
-            return []
+            return [], None
+
+    def get_all_appointments(self, limit=50, **filters):
+        """Получение всех записей (для админов)"""
+        appointments, _ = self.get_appointments_page(limit, **filters)
+        return appointments
+
+    def get_all_appointments_paged(self, page_size=200, max_pages=50, **filters):
+        """Получение всех записей постранично (для экспорта)"""
+        appointments = []
+        cursor = None
+        for _ in range(max_pages):
+            page, cursor = self.get_appointments_page(page_size, cursor=cursor, **filters)
+            appointments.extend(page)
+            if not cursor:
+                break
+        return appointments
 
     def get_filtered_appointments(self, limit=50, status_filter=None):
         """Получение записей с фильтрацией по статусу (для админов)
@@ -175,24 +450,9 @@ class WordPressAPI:
             limit: максимальное количество записей
             status_filter: 'confirmed', 'visited', 'noshow', или None для всех
         """
-        appointments = self.get_all_appointments(limit)
-        
-        if not status_filter or status_filter == 'all':
-            return appointments
-        
-        # Фильтруем по статусу
-        filtered = []
-        for apt in appointments:
-            status = apt.get('status', '')
-            
-            if status_filter == 'confirmed' and status in ['confirmed', 'pending']:
-                filtered.append(apt)
-            elif status_filter == 'visited' and status == 'visited':
-                filtered.append(apt)
-            elif status_filter == 'noshow' and status == 'noshow':
-                filtered.append(apt)
-        
-        return filtered
+        appointments = self.get_all_appointments(limit, status=status_filter)
+        # Повторная фильтрация на случай старой версии плагина без параметра status
+        return filter_appointments_by_status(appointments, status_filter)
 
     def update_appointment_status(self, appointment_id, status_code):
         """Обновление статуса записи"""
@@ -201,15 +461,14 @@ class WordPressAPI:
             if self.api_key:
                 payload['api_key'] = self.api_key
                 
-            response = requests.post(
-                f"{self.site_url}/wp-json/clinic/v1/update-status",
-                data=payload, # POST параметры
-                headers=self.headers,
-                timeout=self.timeout,
-                verify=self.verify_ssl
-            )
+            # Установка статуса идемпотентна - повтор безопасен
+            response = self._request('POST', 'update-status', idempotent=True,
+                                     data=payload) # POST параметры
             
             if response.status_code == 200:
+                # Статус не освобождает слот, но меняет списки записей
+                self.cache.invalidate('all-appointments')
+                self.cache.invalidate('my-appointments')
                 return True
                 
             self.logger.error(f"Ошибка обновления статуса: {response.text}")
@@ -218,87 +477,272 @@ class WordPressAPI:
             self.logger.error(f"Исключение при обновлении статуса: {e}")
             return False
 
+    def get_changes(self, since=None, limit=500):
+        """
+        Страница журнала изменений записей после курсора since.
+        Возвращает {'changes': [...], 'cursor': int, 'has_more': bool} или None при ошибке.
+        """
+        try:
+            params = {'limit': limit}
+            if since is not None:
+                params['since'] = since
+            if self.api_key:
+                params['api_key'] = self.api_key
+            response = self._request('GET', 'changes', params=params)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            self.logger.error(f"Ошибка получения журнала изменений: {e}")
+            return None
+
+    def get_diagnostics(self):
+        """
+        Диагностика плагина (/diagnostics): индексы, триггеры журнала изменений, webhook.
+        Последний ответ сохраняется в self.diagnostics. None при ошибке.
+        """
+        try:
+            params = {'api_key': self.api_key} if self.api_key else None
+            response = self._request('GET', 'diagnostics', params=params)
+            response.raise_for_status()
+            self.diagnostics = response.json()
+            return self.diagnostics
+        except Exception as e:
+            self.logger.error(f"Ошибка получения диагностики плагина: {e}")
+            return None
+
+    def push_invalidation_complete(self):
+        """
+        Попадают ли в журнал изменений (и webhook) записи из любого источника.
+        Без триггеров журнал ведет сам плагин - записи, сделанные на сайте, в нем не видны.
+        """
+        return bool(self.diagnostics and self.diagnostics.get('change_triggers'))
+
+    def apply_changes(self, changes):
+        """Сброс кэша по изменениям из журнала (занятость дня врача + списки записей)"""
+        if not changes:
+            return
+        for change in changes:
+            self.cache.invalidate('get-appointments', {'doctor_id': change['doctor_id'], 'date': change['date']})
+            self.cache.invalidate('get-appointments-range', {'doctor_id': change['doctor_id']})
+            self._notify_invalidated(change['doctor_id'], change['date'])
+        self.cache.invalidate('all-appointments')
+        self.cache.invalidate('my-appointments')
+        for listener in self.change_listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                self.logger.error(f"Ошибка обработчика изменений записей: {e}")
+
+    def poll_changes(self, max_pages=10):
+        """
+        Изменения записей с прошлого вызова (курсор хранится в клиенте).
+
+        Сбрасывает кэш по изменениям. Возвращает список изменений или None,
+        если дельта неизвестна: первый вызов (только получение курсора),
+        ошибка, плагин без /changes или слишком много изменений.
+        """
+        first_call = self.changes_cursor is None
+        # Курсор сохраняется только после применения изменений: при ошибке
+        # на середине страницы будут запрошены заново
+        cursor = self.changes_cursor
+        changes = []
+        for _ in range(max_pages):
+            feed = self.get_changes(cursor)
+            if feed is None:
+                return None
+            changes.extend(feed['changes'])
+            cursor = feed['cursor']
+            if not feed['has_more']:
+                break
+        else:
+            # Изменений больше, чем max_pages страниц - сбрасываем кэш целиком
+            self.invalidate_appointments()
+            self.changes_cursor = cursor
+            return None
+
+        if not first_call:
+            self.apply_changes(changes)
+        self.changes_cursor = cursor
+        return None if first_call else changes
+
+    def batch(self, operations, idempotent=False):
+        """
+        Несколько операций одним HTTP запросом (/batch).
+
+        operations: [(op, params), ...], op - имя endpoint'а
+        ('update-status', 'all-appointments', 'get-appointments', ...).
+        Возвращает список {'status', 'data', 'headers'} в порядке операций
+        или None, если пакет не выполнен (в т.ч. старая версия плагина без /batch).
+        """
+        try:
+            response = self._request('POST', 'batch', idempotent=idempotent,
+                                     json=build_batch_payload(operations, self.api_key))
+            if response.status_code == 404:
+                self.logger.warning("Endpoint /batch не найден (старая версия плагина)")
+                return None
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            self.logger.error(f"Ошибка пакетного запроса: {e}")
+            return None
+
+    def apply_status_batch(self, results, list_params, status_filter):
+        """
+        Результаты пакета [update-status, all-appointments] -> (успех, записи).
+        Сбрасывает кэш списков и кладет в него свежую страницу.
+        """
+        status_result, list_result = results
+        success = status_result.get('status') == 200
+        if success:
+            self.cache.invalidate('all-appointments')
+            self.cache.invalidate('my-appointments')
+        else:
+            self.logger.error(f"Ошибка обновления статуса: {status_result.get('data')}")
+
+        if list_result.get('status') != 200:
+            self.logger.error(f"Ошибка получения всех записей: {list_result.get('data')}")
+            return success, []
+        page = (list_result['data'], (list_result.get('headers') or {}).get('X-Next-Cursor'))
+        self.cache.set('all-appointments', list_params, page)
+        return success, filter_appointments_by_status(page[0], status_filter)
+
+    def update_status_and_list(self, appointment_id, status_code, limit=50, status_filter=None):
+        """
+        Смена статуса и обновленный список записей за один запрос.
+        Возвращает (успех, записи с фильтром status_filter).
+        """
+        list_params = build_appointments_params(limit, status_filter)
+        results = self.batch([
+            ('update-status', {'appointment_id': appointment_id, 'status': status_code}),
+            ('all-appointments', list_params),
+        ], idempotent=True)
+
+        if results is None:
+            # Без /batch - двумя отдельными запросами
+            success = self.update_appointment_status(appointment_id, status_code)
+            return success, self.get_filtered_appointments(limit, status_filter)
+        return self.apply_status_batch(results, list_params, status_filter)
+
+def parse_occupied_slots(data):
+    """Ответ /get-appointments -> список занятых времен (формат HH:MM)"""
+    # API возвращает array of objects {time, status}. Нам нужен список времен.
+    return [item['time'][:5] for item in data] # "10:00:00" -> "10:00"
+
+
+def parse_occupied_range(data):
+    """Ответ /get-appointments-range -> {дата: список времен (HH:MM)}"""
+    # Пустой ответ PHP кодирует как [] вместо {}
+    if not data:
+        return {}
+    return {date: [t[:5] for t in times] for date, times in data.items()}
+
+
+def parse_slot_taken(response):
+    """
+    Конфликт слота от /appointments -> словарь ошибки или None.
+    409 slot_taken: {'code': 'slot_taken', 'message': ..., 'occupied': [HH:MM, ...] или None}
+    423 slot_locked (день врача сейчас записывают параллельно; 503 в старых версиях плагина):
+    {'code': 'slot_locked', 'message': ..., 'occupied': None}
+    """
+    if response.status_code not in (409, 423, 503):
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if response.status_code in (423, 503) and data.get('code') == 'slot_locked':
+        return {
+            'code': 'slot_locked',
+            'message': 'Это время сейчас записывают, попробуйте еще раз.',
+            'occupied': None,
+        }
+    if response.status_code != 409 or data.get('code') != 'slot_taken':
+        return None
+    # Без списка занятости (старый плагин) занятость дня неизвестна - None, а не "все свободно"
+    occupied = (data.get('data') or {}).get('occupied')
+    return {
+        'code': 'slot_taken',
+        'message': 'Это время только что заняли, выберите другое.',
+        'occupied': None if occupied is None else [t[:5] for t in occupied],
+    }
+
+
+def parse_cancelled(data):
+    """
+    Ответ /cancel-appointment -> событие отмены для apply_changes или None
+    (старый плагин не возвращает врача и дату)
+    """
+    if not isinstance(data, dict) or not data.get('doctor_id') or not data.get('date'):
+        return None
+    return {'doctor_id': data['doctor_id'], 'date': data['date'], 'time': data.get('time'),
+            'type': 'cancelled', 'status': 0}
+
+
+def build_batch_payload(operations, api_key=None):
+    """[(op, params), ...] -> тело запроса /batch"""
+    payload = {'operations': [{'op': op, 'params': params or {}} for op, params in operations]}
+    if api_key:
+        payload['api_key'] = api_key
+    return payload
+
+
+def parse_appointments_page(response):
+    """Ответ /all-appointments -> (записи, курсор следующей страницы или None)"""
+    return response.json(), response.headers.get('X-Next-Cursor')
+
+
+def build_appointments_params(limit, status=None, doctor_id=None, date_from=None, date_to=None, cursor=None):
+    """Параметры запроса /all-appointments (пустые фильтры не передаются)"""
+    params = {'limit': limit}
+    if status and status != 'all':
+        params['status'] = status
+    if doctor_id:
+        params['doctor_id'] = doctor_id
+    if date_from:
+        params['date_from'] = date_from
+    if date_to:
+        params['date_to'] = date_to
+    if cursor:
+        params['cursor'] = cursor
+    return params
+
+
+def filter_appointments_by_status(appointments, status_filter):
+    """Фильтрация записей по статусу: 'confirmed', 'visited', 'noshow' или None/'all'"""
+    if not status_filter or status_filter == 'all':
+        return appointments
+    
+    # Фильтруем по статусу
+    filtered = []
+    for apt in appointments:
+        status = apt.get('status', '')
+        
+        if status_filter == 'confirmed' and status in ['confirmed', 'pending']:
+            filtered.append(apt)
+        elif status_filter == 'visited' and status == 'visited':
+            filtered.append(apt)
+        elif status_filter == 'noshow' and status == 'noshow':
+            filtered.append(apt)
+    
+    return filtered
+
+
 def calculate_available_slots(occupied_slots, start_time, end_time, lunch_start, lunch_end, slot_duration):
     """
     Вычисляет свободные слоты на основе занятых
     Start/End times format: "HH:MM"
     occupied_slots: list of "HH:MM" strings
     """
-    from datetime import datetime, timedelta
-    
-    slots = []
-    
-    # Парсим время
-    current = datetime.strptime(start_time, "%H:%M")
-    end = datetime.strptime(end_time, "%H:%M")
-    l_start = datetime.strptime(lunch_start, "%H:%M")
-    l_end = datetime.strptime(lunch_end, "%H:%M")
-    
-    while current < end:
-        # Проверяем обед
-        is_lunch = False
-        if l_start <= current < l_end:
-            is_lunch = True
-            
-        if not is_lunch:
-            time_str = current.strftime("%H:%M")
-            if time_str not in occupied_slots:
-                slots.append(time_str)
-        
-        current += timedelta(minutes=slot_duration)
-        
-    return slots
+    template = compile_template(start_time, end_time, lunch_start, lunch_end, slot_duration)
+    return template.free_slots(occupied_slots)
 
 def generate_day_slots(start_time, end_time, lunch_start, lunch_end, slot_duration, date_str=None):
     """
     Генерирует все возможные слоты на день (без учета занятости).
     Если передан date_str и он равен "сегодня", фильтрует прошедшее время.
+    Сетка слотов собирается один раз на набор параметров (schedule_compiler).
     """
-    from datetime import datetime, timedelta
-    
-    slots = []
-    
-    # Парсим время
-    current = datetime.strptime(start_time, "%H:%M")
-    end = datetime.strptime(end_time, "%H:%M")
-    l_start = datetime.strptime(lunch_start, "%H:%M")
-    l_end = datetime.strptime(lunch_end, "%H:%M")
-    
-    now = datetime.now()
-    is_today = False
-    
-    if date_str:
-        try:
-            # Формат даты ожидается YYYY-MM-DD
-            chk_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            if chk_date == now.date():
-                is_today = True
-        except:
-            pass
-            
-    current_time_minutes = now.hour * 60 + now.minute
-    
-    while current < end:
-        # Проверяем обед
-        is_lunch = False
-        if l_start <= current < l_end:
-            is_lunch = True
-            
-        # Фильтр прошедшего времени для "сегодня"
-        is_past = False
-        if is_today:
-            slot_minutes = current.hour * 60 + current.minute
-            # Даем запас 15 минут (не показывать слоты, которые начинаются через 5 мин, или уже начались)
-            # Или строго: если время слота < текущее время -> не показывать.
-            # Пользователь сказал "record ended" (запись закончилась) - значит, время прошло.
-            if slot_minutes <= current_time_minutes: 
-                is_past = True
-            
-        if not is_lunch and not is_past:
-            time_str = current.strftime("%H:%M")
-            slots.append(time_str)
-            
-        current += timedelta(minutes=slot_duration)
-
-    return slots
-
+    template = compile_template(start_time, end_time, lunch_start, lunch_end, slot_duration)
+    return template.day_slots(date_str)